@@ -0,0 +1,103 @@
+"""
+Проверка ResilientLLM против локального стаба: дедлайны, хеджирование, размыкатель и fallback.
+
+Запуск из корня репозитория:
+    python -m benchmarks.llm_resilience_benchmark --requests 300 --concurrency 16 \\
+        --latency yandexgpt=lognormal:0.4:0.8 --latency yandexgpt-lite=lognormal:0.1:0.3 \\
+        --stall-rate yandexgpt=0.02 --timeout 3
+
+Каждый сценарий (без защиты, с дедлайном и fallback, с хеджированием) гоняется на свежем стабе
+с одинаковым seed; печатаются p50/p95/p99, доля неудач и распределение ответов по моделям.
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+import numpy as np
+from modules.llm_client import HttpCompletionModel, ResilientLLM
+from benchmarks.stub_llm_server import StubLLM, parse_distribution, parse_per_model, serve
+
+SCENARIOS = {
+    "single": dict(hedge=False, fallback=False),
+    "fallback": dict(hedge=False, fallback=True),
+    "hedged": dict(hedge=True, fallback=True),
+}
+
+
+def run_scenario(args, hedge: bool, fallback: bool) -> Dict[str, object]:
+    stub = StubLLM(
+        latencies=parse_per_model(args.latency, parse_distribution),
+        error_rates=parse_per_model(args.error_rate),
+        stall_rates=parse_per_model(args.stall_rate),
+        stall_seconds=args.timeout * 4,
+        seed=args.seed
+    )
+    server = serve(stub)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    models = [(args.primary, HttpCompletionModel(endpoint, f"gpt://stub/{args.primary}/latest"))]
+    if fallback:
+        models.append((args.fallback, HttpCompletionModel(endpoint, f"gpt://stub/{args.fallback}/latest")))
+    # Без fallback дедлайн фактически отсутствует, как в исходном Agent
+    llm = ResilientLLM(
+        models,
+        timeout=args.timeout if fallback else args.timeout * 10,
+        hedge=hedge,
+        max_workers=args.concurrency * 2
+    )
+
+    latencies, answered_by, failures = [], Counter(), 0
+
+    def call(i: int):
+        started = time.perf_counter()
+        try:
+            text = llm.run(f"Вопрос {i}").text
+            return time.perf_counter() - started, text.split("]")[0].lstrip("[")
+        except Exception:
+            return time.perf_counter() - started, None
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for latency, model in pool.map(call, range(args.requests)):
+            latencies.append(latency)
+            if model is None:
+                failures += 1
+            else:
+                answered_by[model] += 1
+
+    server.shutdown()
+    return {
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "failed": failures / len(latencies),
+        "answered_by": dict(answered_by),
+        "upstream_calls": sum(stub.calls.values())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--primary", default="yandexgpt")
+    parser.add_argument("--fallback", default="yandexgpt-lite")
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--latency", action="append", default=[])
+    parser.add_argument("--error-rate", action="append", default=[])
+    parser.add_argument("--stall-rate", action="append", default=[])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if not args.latency:
+        args.latency = ["yandexgpt=lognormal:0.4:0.8", "yandexgpt-lite=lognormal:0.1:0.3"]
+
+    print(f"{'scenario':<10} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'failed':>7} {'calls':>6}  answered by")
+    for name, options in SCENARIOS.items():
+        stats = run_scenario(args, **options)
+        print(
+            f"{name:<10} {stats['p50']:>7.3f} {stats['p95']:>7.3f} {stats['p99']:>7.3f} "
+            f"{stats['failed']:>7.1%} {stats['upstream_calls']:>6}  {stats['answered_by']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
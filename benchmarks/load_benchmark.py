@@ -0,0 +1,564 @@
+"""
+Офлайн-нагрузочный тест полного пути TelegramBot -> Kafka -> Worker -> Agent без внешних сервисов.
+
+Запуск из корня репозитория (зависимости бота и pip install -r requirements-dev.txt):
+    python -m benchmarks.load_benchmark --log logs/queries.jsonl --requests 500 --rate 20 \\
+        --zipf 1.1 --paraphrase 0.3 --latency yandexgpt=lognormal:1.0:0.5 --output report.json
+
+Масштабирование: --workers N запускает N воркеров одной группы потребителей на --partitions разделах;
+при узком месте в LLM пропускная способность растёт примерно линейно с N.
+
+Регрессионный режим - сравнение с сохранённым отчётом, код выхода 1 при ухудшении:
+    python -m benchmarks.load_benchmark ... --baseline report.json --tolerance 0.15
+
+Вместо живых сервисов используются:
+- InMemoryKafka - брокер в памяти с интерфейсом KafkaMessaging, разделами и группами потребителей
+- fakeredis - общий для бота, воркера и семантического кэша сервер Redis
+- MockBot - aiogram Bot с подменёнными send_message / edit_message_text
+- стаб YandexGPT из benchmarks.stub_llm_server с заданным распределением задержки
+
+Запросы берутся из JSONL-лога бота (поле query или text), повторы распределены по Zipf,
+часть запросов перефразируется. Задержки по этапам считаются по гистограммам rag_stage_seconds,
+сквозная задержка - от входящего апдейта до финального сообщения в чате.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+import numpy as np
+import fakeredis
+import redis.asyncio as aioredis
+from fakeredis.aioredis import FakeConnection
+from aiogram import Bot, Dispatcher, types
+from confluent_kafka import TopicPartition
+from prometheus_client import REGISTRY
+import config
+import bot as bot_module
+import worker as worker_module
+from modules import cache as cache_module
+from modules.admission import BUSY_MESSAGE
+from modules.messaging import KafkaMessaging
+from modules.serialization import Serializer
+from benchmarks.stub_llm_server import StubLLM, parse_distribution, parse_per_model, serve
+
+DEFAULT_QUERIES = [
+    "Куда поехать летом на море?",
+    "Что посмотреть в Италии?",
+    "Лучшее время для поездки в Японию",
+    "Какую страну выбрать для первого путешествия в Европу?",
+    "Что попробовать из местной кухни во Франции?",
+    "Куда поехать зимой, чтобы было тепло?",
+    "Достопримечательности Испании",
+    "Посоветуй страну для активного отдыха в горах",
+    "Какие традиции есть в Турции?",
+    "Куда поехать с детьми?",
+]
+
+PARAPHRASES = [
+    "{query}",
+    "{query_lower}",
+    "Подскажи, {query_lower}",
+    "{query} Заранее спасибо!",
+    "А {query_lower}",
+    "{query_stripped}",
+]
+
+FINAL_ERRORS = ("Произошла ошибка при обработке запроса", "Ошибка обработки запроса")
+
+
+class InMemoryKafka:
+    """
+    Брокер в памяти с интерфейсом KafkaMessaging, общий по bootstrap_servers:
+    разделы выбираются по ключу, разделы темы делятся между участниками группы;
+    сообщения хранятся закодированными, как в брокере, объём считается по темам
+    """
+
+    _brokers: Dict[str, dict] = {}
+    batch_offsets = staticmethod(KafkaMessaging.batch_offsets)
+    first_offsets = staticmethod(KafkaMessaging.first_offsets)
+
+    def __init__(self, bootstrap_servers: str = "memory", serializer: Optional[Serializer] = None):
+        self.serializer = serializer or Serializer()
+        self.broker = self._brokers.setdefault(bootstrap_servers, {
+            "topics": {},
+            "bytes": defaultdict(int),
+            "groups": defaultdict(lambda: {"members": [], "generation": 0, "committed": {}}),
+            "condition": threading.Condition()
+        })
+
+    def create_topic_if_not_exists(self, topic_name: str, num_partitions: int = 1, replication_factor: int = 1):
+        with self.broker["condition"]:
+            self.broker["topics"].setdefault(topic_name, [[] for _ in range(num_partitions)])
+
+    def create_producer(self, **options):
+        return object()
+
+    def create_consumer(self, group_id: str, topics: List[str], assignment_strategy: str = None,
+                        on_assign=None, on_revoke=None):
+        consumer = {
+            "group_id": group_id, "topics": topics, "assigned": set(), "positions": {}, "generation": -1,
+            "on_assign": on_assign, "on_revoke": on_revoke
+        }
+        with self.broker["condition"]:
+            group = self.broker["groups"][group_id]
+            group["members"].append(consumer)
+            group["generation"] += 1
+        return consumer
+
+    def close_consumer(self, consumer):
+        with self.broker["condition"]:
+            group = self.broker["groups"][consumer["group_id"]]
+            group["members"].remove(consumer)
+            group["generation"] += 1
+
+    def _rebalance(self, consumer):
+        """Раздача разделов участникам группы по кругу при изменении её состава"""
+        group = self.broker["groups"][consumer["group_id"]]
+        if consumer["generation"] == group["generation"]:
+            return
+        consumer["generation"] = group["generation"]
+        index = group["members"].index(consumer)
+        partitions = [
+            (topic, partition)
+            for topic in consumer["topics"]
+            for partition in range(len(self.broker["topics"].setdefault(topic, [[]])))
+        ]
+        target = {tp for i, tp in enumerate(partitions) if i % len(group["members"]) == index}
+        revoked, added = consumer["assigned"] - target, target - consumer["assigned"]
+        consumer["assigned"] = target
+        for tp in added:
+            consumer["positions"][tp] = group["committed"].get(tp, 0)
+        if revoked and consumer["on_revoke"]:
+            consumer["on_revoke"]([TopicPartition(topic, partition) for topic, partition in revoked])
+        if added and consumer["on_assign"]:
+            consumer["on_assign"]([TopicPartition(topic, partition) for topic, partition in added])
+
+    def produce_message(self, producer, topic: str, key: str, value: dict):
+        with self.broker["condition"]:
+            partitions = self.broker["topics"].setdefault(topic, [[]])
+            partition = zlib.crc32(key.encode("utf-8")) % len(partitions)
+            payload = self.serializer.dumps(value)
+            self.broker["bytes"][topic] += len(payload)
+            partitions[partition].append({"key": key, "value": payload})
+            self.broker["condition"].notify_all()
+        return True
+
+    def flush(self, producer, timeout: float = 10.0) -> bool:
+        return True
+
+    def consume(self, consumer, num_messages: int = 32, timeout: float = 0.2) -> List[dict]:
+        deadline = time.monotonic() + timeout
+        condition = self.broker["condition"]
+        with condition:
+            while True:
+                self._rebalance(consumer)
+                batch = []
+                for topic, partition in sorted(consumer["assigned"]):
+                    messages = self.broker["topics"][topic][partition]
+                    position = consumer["positions"][(topic, partition)]
+                    end = min(len(messages), position + num_messages - len(batch))
+                    for offset in range(position, end):
+                        batch.append({
+                            "topic": topic,
+                            "partition": partition,
+                            "offset": offset,
+                            "key": messages[offset]["key"],
+                            "value": self.serializer.loads(messages[offset]["value"])
+                        })
+                    consumer["positions"][(topic, partition)] = max(position, end)
+                remaining = deadline - time.monotonic()
+                if batch or remaining <= 0:
+                    return batch
+                condition.wait(remaining)
+
+    def seek_offsets(self, consumer, offsets):
+        with self.broker["condition"]:
+            for tp in offsets:
+                if (tp.topic, tp.partition) in consumer["assigned"]:
+                    consumer["positions"][(tp.topic, tp.partition)] = tp.offset
+
+    def commit_offsets(self, consumer, offsets):
+        with self.broker["condition"]:
+            committed = self.broker["groups"][consumer["group_id"]]["committed"]
+            for tp in offsets:
+                committed[(tp.topic, tp.partition)] = tp.offset
+
+    def consumer_lag(self, consumer, timeout: float = 1.0):
+        with self.broker["condition"]:
+            committed = self.broker["groups"][consumer["group_id"]]["committed"]
+            return {
+                (topic, partition): len(self.broker["topics"][topic][partition]) - committed.get((topic, partition), 0)
+                for topic, partition in consumer["assigned"]
+            }
+
+
+class RequestTracker:
+    """Сквозная задержка: от входящего апдейта до финального сообщения в чате"""
+
+    def __init__(self):
+        self.sent_at: Dict[int, float] = {}
+        self.done_at: Dict[int, float] = {}
+        self.outcomes: Dict[int, str] = {}
+        self.all_done = asyncio.Event()
+        self.expected = None
+
+    def sent(self, chat_id: int):
+        self.sent_at[chat_id] = time.perf_counter()
+
+    def message(self, chat_id: int, text: str, final: bool):
+        if not final or chat_id in self.done_at or chat_id not in self.sent_at:
+            return
+        self.done_at[chat_id] = time.perf_counter()
+        if text == BUSY_MESSAGE:
+            self.outcomes[chat_id] = "shed"
+        elif text in FINAL_ERRORS:
+            self.outcomes[chat_id] = "error"
+        else:
+            self.outcomes[chat_id] = "answered"
+        if self.expected is not None and len(self.done_at) >= self.expected:
+            self.all_done.set()
+
+    def latencies(self) -> List[float]:
+        return [self.done_at[chat_id] - self.sent_at[chat_id] for chat_id in self.done_at]
+
+
+class MockBot(Bot):
+    """aiogram Bot без сети: сообщения попадают в RequestTracker с задержкой Telegram API"""
+
+    def __init__(self, tracker: RequestTracker, api_latency: float, placeholder: str = "✍️ Готовлю ответ..."):
+        super().__init__(token="123456:BENCHMARK-TOKEN")
+        self.tracker = tracker
+        self.api_latency = api_latency
+        self.placeholder = placeholder
+        self._message_ids = 0
+
+    def _message(self, chat_id: int, text: str) -> types.Message:
+        self._message_ids += 1
+        return types.Message.to_object({
+            "message_id": self._message_ids,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text
+        })
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.tracker.message(int(chat_id), text, final=text != self.placeholder)
+        return self._message(int(chat_id), text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, parse_mode=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        self.tracker.message(int(chat_id), text, final=not text.endswith(" ▌"))
+        return True
+
+
+def load_queries(path: Optional[str]) -> List[str]:
+    if not path:
+        return list(DEFAULT_QUERIES)
+    queries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get("query") or record.get("text")
+            if query:
+                queries.append(query)
+    return queries or list(DEFAULT_QUERIES)
+
+
+def generate_traffic(queries: List[str], count: int, zipf: float, paraphrase: float, seed: int) -> List[str]:
+    """Поток запросов: популярность по Zipf, часть запросов перефразирована"""
+    rng = random.Random(seed)
+    pool = list(queries)
+    rng.shuffle(pool)
+    weights = [1.0 / (rank + 1) ** zipf for rank in range(len(pool))]
+    traffic = []
+    for query in rng.choices(pool, weights=weights, k=count):
+        if rng.random() < paraphrase:
+            query = rng.choice(PARAPHRASES).format(
+                query=query,
+                query_lower=query[:1].lower() + query[1:],
+                query_stripped=query.rstrip("?!. ")
+            )
+        traffic.append(query)
+    return traffic
+
+
+def histogram_snapshot() -> Dict[str, Dict[float, float]]:
+    """Кумулятивные бакеты rag_stage_seconds по этапам"""
+    buckets: Dict[str, Dict[float, float]] = defaultdict(dict)
+    for metric in REGISTRY.collect():
+        if metric.name != "rag_stage_seconds":
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_bucket"):
+                buckets[sample.labels["stage"]][float(sample.labels["le"])] = sample.value
+    return buckets
+
+
+def counter_snapshot(name: str) -> Dict[tuple, float]:
+    values = {}
+    for metric in REGISTRY.collect():
+        if metric.name != name:
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                values[tuple(sorted(sample.labels.items()))] = sample.value
+    return values
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> float:
+    """Квантиль по кумулятивным бакетам с линейной интерполяцией, как в Prometheus"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return 0.0
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def build_report(args, tracker, started, finished, stages_before, stages_after, cache_before, cache_after, stub,
+                 payload_bytes):
+    stages = {}
+    for stage, after in stages_after.items():
+        before = stages_before.get(stage, {})
+        delta = {bound: count - before.get(bound, 0.0) for bound, count in after.items()}
+        count = delta.get(float("inf"), 0.0)
+        if count:
+            stages[stage] = {
+                "count": int(count),
+                **{f"p{int(q * 100)}": histogram_quantile(q, delta) for q in (0.5, 0.95, 0.99)}
+            }
+
+    lookups: Dict[str, Dict[str, float]] = defaultdict(lambda: {"hit": 0.0, "miss": 0.0})
+    for labels, value in cache_after.items():
+        labels_dict = dict(labels)
+        lookups[labels_dict["cache"]][labels_dict["result"]] += value - cache_before.get(labels, 0.0)
+    hit_rates = {
+        cache: counts["hit"] / (counts["hit"] + counts["miss"])
+        for cache, counts in lookups.items() if counts["hit"] + counts["miss"] > 0
+    }
+
+    outcomes = defaultdict(int)
+    for outcome in tracker.outcomes.values():
+        outcomes[outcome] += 1
+    outcomes["timeout"] = args.requests - len(tracker.done_at)
+
+    return {
+        "requests": args.requests,
+        "rate": args.rate,
+        "workers": args.workers,
+        "completed": len(tracker.done_at),
+        "throughput_rps": len(tracker.done_at) / max(finished - started, 1e-9),
+        "e2e": percentiles(tracker.latencies()),
+        "outcomes": dict(outcomes),
+        "stages": stages,
+        "cache_hit_rate": hit_rates,
+        "llm_calls": dict(stub.calls),
+        "payload_bytes": payload_bytes
+    }
+
+
+def print_report(report: dict):
+    print(f"\nRequests: {report['requests']} at {report['rate']} rps, workers {report['workers']}, completed {report['completed']}, "
+          f"throughput {report['throughput_rps']:.2f} rps")
+    print(f"Outcomes: {report['outcomes']}, upstream LLM calls: {report['llm_calls']}")
+    e2e = report["e2e"]
+    print(f"End-to-end: p50 {e2e['p50']:.3f}s  p95 {e2e['p95']:.3f}s  p99 {e2e['p99']:.3f}s")
+    print(f"\n{'stage':<16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"{stage:<16} {stats['count']:>7} {stats['p50'] * 1000:>9.1f} "
+              f"{stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}")
+    print("\nCache hit rate: " + ", ".join(
+        f"{cache} {rate:.1%}" for cache, rate in sorted(report["cache_hit_rate"].items())
+    ))
+    print("Payload bytes: " + ", ".join(
+        f"{name} {size}" for name, size in sorted(report.get("payload_bytes", {}).items())
+    ))
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Ухудшения относительно базового отчёта"""
+    regressions = []
+    for q in ("p50", "p95", "p99"):
+        current, previous = report["e2e"][q], baseline["e2e"][q]
+        if previous and current > previous * (1 + tolerance):
+            regressions.append(f"e2e {q}: {previous:.3f}s -> {current:.3f}s")
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['throughput_rps']:.2f} -> {report['throughput_rps']:.2f} rps")
+    for cache, previous in baseline.get("cache_hit_rate", {}).items():
+        current = report["cache_hit_rate"].get(cache, 0.0)
+        if current < previous - tolerance / 2:
+            regressions.append(f"{cache} cache hit rate: {previous:.1%} -> {current:.1%}")
+    for stage, stats in baseline.get("stages", {}).items():
+        current = report["stages"].get(stage)
+        # Миллисекундные колебания быстрых этапов - шум, а не регрессия
+        if current and current["p95"] > stats["p95"] * (1 + tolerance) and current["p95"] - stats["p95"] > 0.01:
+            regressions.append(f"stage {stage} p95: {stats['p95'] * 1000:.1f}ms -> {current['p95'] * 1000:.1f}ms")
+    return regressions
+
+
+def configure(args, stub_endpoint: str, server: fakeredis.FakeServer):
+    """Подмена внешних сервисов до создания бота и воркера"""
+    config.YANDEX_LLM_ENDPOINT = stub_endpoint
+    config.YANDEX_FOLDER_ID = config.YANDEX_FOLDER_ID or "benchmark"
+    config.METRICS_PORT = 0
+    config.DATA_PATH = args.data
+    config.VECTOR_DB_DIR = args.persist_dir or tempfile.mkdtemp(prefix="bench_load_")
+    config.KAFKA_BOOTSTRAP_SERVERS = "memory"
+    config.KAFKA_PARTITIONS = args.partitions
+    config.EMBEDDED_WORKER = False
+    bot_module.KafkaMessaging = InMemoryKafka
+    worker_module.KafkaMessaging = InMemoryKafka
+    cache_module._async_pools[(config.REDIS_HOST, config.REDIS_PORT, config.REDIS_DB)] = aioredis.ConnectionPool(
+        connection_class=FakeConnection,
+        server=server,
+        max_connections=config.REDIS_MAX_CONNECTIONS
+    )
+
+
+async def run(args) -> dict:
+    stub = StubLLM(
+        latencies=parse_per_model(args.latency, parse_distribution),
+        error_rates=parse_per_model(args.error_rate),
+        seed=args.seed
+    )
+    stub_server = serve(stub)
+    redis_server = fakeredis.FakeServer()
+    configure(args, f"http://127.0.0.1:{stub_server.server_address[1]}", redis_server)
+
+    tracker = RequestTracker()
+    mock_bot = MockBot(tracker, api_latency=args.telegram_latency)
+    telegram_bot = bot_module.TelegramBot(bot=mock_bot)
+    # Воркеры в одном процессе, но в одной группе потребителей - как отдельные контейнеры
+    # RAG-ядро у них общее, как у бота и встроенного воркера; замер идёт после прогрева
+    workers = [worker_module.Worker(bot=mock_bot) for _ in range(args.workers)]
+    core = workers[0].core
+    await core.wait_ready()
+    if core.semantic_cache is not None:
+        core.semantic_cache.redis = fakeredis.FakeRedis(server=redis_server)
+    for worker in workers:
+        asyncio.ensure_future(worker.process_messages())
+    Bot.set_current(mock_bot)
+    Dispatcher.set_current(telegram_bot.dp)
+
+    traffic = generate_traffic(load_queries(args.log), args.requests, args.zipf, args.paraphrase, args.seed)
+    tracker.expected = len(traffic)
+    rng = random.Random(args.seed)
+    await asyncio.sleep(1)
+
+    stages_before = histogram_snapshot()
+    cache_before = counter_snapshot("rag_cache_requests")
+    started = time.perf_counter()
+    handlers = []
+    for i, query in enumerate(traffic):
+        chat_id = 100000 + i
+        update = types.Update.to_object({
+            "update_id": i,
+            "message": {
+                "message_id": i,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+                "text": query
+            }
+        })
+        tracker.sent(chat_id)
+        handlers.append(asyncio.ensure_future(telegram_bot.dp.process_update(update)))
+        # Открытая модель нагрузки: пуассоновский поток с заданной интенсивностью
+        await asyncio.sleep(rng.expovariate(args.rate))
+
+    try:
+        await asyncio.wait_for(tracker.all_done.wait(), timeout=args.drain_timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"{tracker.expected - len(tracker.done_at)} requests did not complete in time")
+    finished = max(tracker.done_at.values(), default=time.perf_counter())
+
+    # Объём сообщений по темам Kafka и ответов, сохранённых в Redis
+    payload_bytes = {f"kafka:{topic}": size for topic, size in telegram_bot.messaging.broker["bytes"].items()}
+    redis_client = fakeredis.FakeRedis(server=redis_server)
+    payload_bytes["redis:responses"] = sum(
+        len(redis_client.get(key) or b"") for key in redis_client.scan_iter(match=f"{cache_module.KEY_PREFIX}:*")
+    )
+    report = build_report(
+        args, tracker, started, finished,
+        stages_before, histogram_snapshot(), cache_before, counter_snapshot("rag_cache_requests"), stub,
+        payload_bytes
+    )
+    await asyncio.gather(*handlers, return_exceptions=True)
+    stub_server.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=None, help="JSONL-лог запросов; по умолчанию встроенный набор")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--persist-dir", default=None, help="каталог индекса; по умолчанию временный")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=10.0, help="запросов в секунду")
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--paraphrase", type=float, default=0.3)
+    parser.add_argument("--latency", action="append", default=[], help="<model>=<distribution> для стаба LLM")
+    parser.add_argument("--error-rate", action="append", default=[])
+    parser.add_argument("--workers", type=int, default=1, help="число воркеров в группе потребителей")
+    parser.add_argument("--partitions", type=int, default=12)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="сохранить отчёт в JSON (базовая линия)")
+    parser.add_argument("--baseline", default=None, help="сравнить с сохранённым отчётом")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    if not args.latency:
+        args.latency = ["yandexgpt=lognormal:1.0:0.5", "yandexgpt-lite=lognormal:0.3:0.3"]
+
+    logging.getLogger().setLevel(args.log_level)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    report = loop.run_until_complete(run(args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
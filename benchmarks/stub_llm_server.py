@@ -0,0 +1,180 @@
+"""
+Локальный стаб YandexGPT REST API (foundationModels/v1/completion) с настраиваемой задержкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stub_llm_server --port 8090 \\
+        --latency yandexgpt=lognormal:1.2:0.6 --latency yandexgpt-lite=lognormal:0.3:0.3 \\
+        --error-rate yandexgpt=0.05 --stall-rate yandexgpt=0.01
+
+Распределения задержки (секунды):
+    fixed:<value>, uniform:<low>:<high>, lognormal:<median>:<sigma>
+Модель определяется по modelUri (gpt://<folder>/<model>/<version>); для неизвестных моделей
+используется распределение "default". Воркер направляется на стаб через YANDEX_LLM_ENDPOINT.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+Distribution = Callable[[random.Random], float]
+
+ANSWER = (
+    "🇮🇹 Я бы тебе порекомендовал Италию! Прогуляйся по Риму, загляни в Колизей и Ватикан, "
+    "попробуй настоящую пасту и мороженое, а весной или осенью отправляйся в Тоскану."
+)
+
+
+def parse_distribution(spec: str) -> Distribution:
+    kind, *params = spec.split(":")
+    values = [float(param) for param in params]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def parse_per_model(items, parse=float) -> Dict[str, object]:
+    result = {}
+    for item in items or []:
+        model, _, value = item.partition("=")
+        result[model] = parse(value)
+    return result
+
+
+class StubLLM:
+    """Поведение стаба: задержка, ошибки и зависания по моделям"""
+
+    def __init__(
+            self,
+            latencies: Dict[str, Distribution],
+            error_rates: Optional[Dict[str, float]] = None,
+            stall_rates: Optional[Dict[str, float]] = None,
+            stall_seconds: float = 300.0,
+            seed: Optional[int] = None
+    ):
+        self.latencies = latencies
+        self.error_rates = error_rates or {}
+        self.stall_rates = stall_rates or {}
+        self.stall_seconds = stall_seconds
+        self.calls: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def plan(self, model: str):
+        """Задержка ответа и признак ошибки для очередного вызова"""
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            distribution = self.latencies.get(model) or self.latencies.get("default") or (lambda rng: 0.0)
+            latency = distribution(self._rng)
+            if self._rng.random() < self.stall_rates.get(model, 0.0):
+                latency = self.stall_seconds
+            failed = self._rng.random() < self.error_rates.get(model, 0.0)
+        return latency, failed
+
+
+def make_handler(stub: StubLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            try:
+                self._handle()
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент уже ушёл по таймауту или взял ответ хеджированного дубликата
+                pass
+
+        def _handle(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            parts = body.get("modelUri", "").split("/")
+            model = parts[3] if len(parts) > 3 else "default"
+            stream = body.get("completionOptions", {}).get("stream", False)
+            latency, failed = stub.plan(model)
+
+            if failed:
+                time.sleep(latency / 4)
+                self._send(500, b'{"error": {"message": "stub failure"}}')
+                return
+
+            text = f"[{model}] {ANSWER}"
+            if not stream:
+                time.sleep(latency)
+                self._send(200, json.dumps(self._payload(text, "ALTERNATIVE_STATUS_FINAL")).encode("utf-8"))
+                return
+
+            # Поток: накопленный текст частями, по строке JSON на часть
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split()
+            steps = 4
+            for step in range(1, steps + 1):
+                time.sleep(latency / steps)
+                status = "ALTERNATIVE_STATUS_FINAL" if step == steps else "ALTERNATIVE_STATUS_PARTIAL"
+                partial = " ".join(words[:len(words) * step // steps])
+                self.wfile.write(json.dumps(self._payload(partial, status)).encode("utf-8") + b"\n")
+                self.wfile.flush()
+            self.close_connection = True
+
+        @staticmethod
+        def _payload(text: str, status: str) -> dict:
+            return {"result": {
+                "alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+                "usage": {"inputTextTokens": "0", "completionTokens": str(len(text.split())), "totalTokens": "0"}
+            }}
+
+        def _send(self, code: int, payload: bytes):
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+def serve(stub: StubLLM, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Запуск стаба в фоновом потоке; фактический порт - server.server_address[1]"""
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", action="append", default=[], help="<model>=<distribution>")
+    parser.add_argument("--error-rate", action="append", default=[], help="<model>=<probability>")
+    parser.add_argument("--stall-rate", action="append", default=[], help="<model>=<probability>")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubLLM(
+        latencies=parse_per_model(args.latency, parse_distribution),
+        error_rates=parse_per_model(args.error_rate),
+        stall_rates=parse_per_model(args.stall_rate),
+        seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    server.daemon_threads = True
+    print(f"Stub LLM listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
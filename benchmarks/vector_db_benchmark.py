@@ -0,0 +1,106 @@
+"""
+Сравнение бэкендов VectorDB (Chroma и NumpyVectorDB) по задержке и полноте.
+
+Запуск из корня репозитория:
+    python -m benchmarks.vector_db_benchmark --data data --queries 200 --top-k 3
+
+Оба индекса строятся во временных каталогах из одних и тех же чанков.
+Точный поиск NumpyVectorDB служит эталоном для recall@k приближённого HNSW в Chroma.
+"""
+import argparse
+import random
+import tempfile
+import time
+from typing import Dict, List
+import numpy as np
+from modules.document_loader import DocumentLoader
+from modules.vector_db import VectorDB
+from modules.numpy_vector_db import NumpyVectorDB
+
+
+def build_documents(data_path: str) -> Dict[str, Dict[str, str]]:
+    return {
+        doc_name: {f"{doc_name}_chunk_{i}": chunk for i, chunk in enumerate(chunks)}
+        for doc_name, chunks in DocumentLoader(data_path=data_path).load_and_chunk_documents().items()
+    }
+
+
+def sample_queries(documents: Dict[str, Dict[str, str]], count: int, seed: int) -> List[str]:
+    """Запросы - случайные фрагменты чанков, чтобы не зависеть от внешнего лога"""
+    rng = random.Random(seed)
+    chunks = [chunk for chunks in documents.values() for chunk in chunks.values()]
+    queries = []
+    for _ in range(count):
+        words = rng.choice(chunks).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(" ".join(words[start:start + 8]))
+    return queries
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def measure(db: VectorDB, embeddings: np.ndarray, top_k: int, batch_size: int) -> Dict[str, float]:
+    single = []
+    for embedding in embeddings:
+        started = time.perf_counter()
+        db.search(embedding[None, :], top_k=top_k)
+        single.append(time.perf_counter() - started)
+
+    batched = []
+    for i in range(0, len(embeddings), batch_size):
+        started = time.perf_counter()
+        db.search(embeddings[i:i + batch_size], top_k=top_k)
+        batched.append((time.perf_counter() - started) / len(embeddings[i:i + batch_size]))
+
+    return {
+        "p50_ms": percentile(single, 50),
+        "p95_ms": percentile(single, 95),
+        "p99_ms": percentile(single, 99),
+        "batched_per_query_ms": percentile(batched, 50)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    documents = build_documents(args.data)
+    queries = sample_queries(documents, args.queries, args.seed)
+
+    backends = {}
+    for name, backend in (("chroma", VectorDB), ("numpy", NumpyVectorDB)):
+        started = time.perf_counter()
+        db = backend(persist_dir=tempfile.mkdtemp(prefix=f"bench_{name}_"))
+        db.sync_documents(documents.items())
+        print(f"{name}: indexed {db._count()} chunks in {time.perf_counter() - started:.2f}s")
+        backends[name] = db
+
+    # Эмбеддинги запросов считаются один раз, чтобы сравнивать только поиск
+    embeddings = backends["numpy"].embed(queries)
+
+    exact = backends["numpy"].search(embeddings, top_k=args.top_k)
+    approximate = backends["chroma"].search(embeddings, top_k=args.top_k)
+    recall = np.mean([
+        len({doc_id for doc_id, _, _ in a} & {doc_id for doc_id, _, _ in e}) / max(1, len(e))
+        for a, e in zip(approximate, exact)
+    ])
+
+    print(f"\n{'backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batched ms/q':>13} {'recall@k':>9}")
+    for name, db in backends.items():
+        stats = measure(db, embeddings, args.top_k, args.batch_size)
+        backend_recall = 1.0 if name == "numpy" else recall
+        print(
+            f"{name:<8} {stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f} "
+            f"{stats['batched_per_query_ms']:>13.3f} {backend_recall:>9.3f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
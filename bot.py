@@ -2,11 +2,15 @@ import logging
 import asyncio
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
-from modules.agent import Agent
-from modules.document_loader import DocumentLoader
-from modules.vector_db import VectorDB
-from modules.cache import CacheManager
+from modules.core import get_core
+from modules.agent import format_cache_version
+from modules.kb_versions import KnowledgeBaseRevision
+from modules.warmup import QueryLog
+from modules.cache import AsyncCacheManager, LocalCache
+from modules.serialization import Serializer
 from modules.messaging import KafkaMessaging
+from modules.delivery import DeliveryService
+from modules.metrics import count_cache, start_metrics_server, timed
 import config
 from worker import Worker
 
@@ -21,38 +25,102 @@ class TelegramBot:
         self.dp = Dispatcher(self.bot)
 
         # Инициализация компонентов
+        # Сообщения Kafka и значения Redis: msgpack + zstd с заголовком версии схемы
+        self.serializer = Serializer(
+            codec=config.SERIALIZATION_CODEC,
+            compress_threshold=config.SERIALIZATION_COMPRESS_THRESHOLD,
+            level=config.SERIALIZATION_ZSTD_LEVEL
+        )
         logger.info(f"Connecting to Redis at {config.REDIS_HOST}:{config.REDIS_PORT}")
-        self.cache = CacheManager(
+        self.cache = AsyncCacheManager(
             host=config.REDIS_HOST,
-            port=config.REDIS_PORT
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            local_cache=LocalCache(
+                max_entries=config.L1_CACHE_MAX_ENTRIES,
+                max_bytes=config.L1_CACHE_MAX_BYTES,
+                ttl=config.L1_CACHE_TTL
+            ) if config.L1_CACHE_ENABLED else None,
+            serializer=self.serializer
         )
-        logger.info(f"Redis connection established")
+        logger.info(f"Redis connection pool created")
 
         logger.info(f"Connecting to Kafka at {config.KAFKA_BOOTSTRAP_SERVERS}")
         self.messaging = KafkaMessaging(
-            bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS
+            bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS,
+            serializer=self.serializer
         )
         logger.info(f"creating kafka_producer")
-        self.kafka_producer = self.messaging.create_producer()
-
-        # RAG компоненты
-        logger.info(f"Loading documents from {config.DATA_PATH}")
-        self.document_loader = DocumentLoader(data_path=config.DATA_PATH)
-        self.vector_db = VectorDB()
-        self.agent = Agent(
-            yandex_folder_id=config.YANDEX_FOLDER_ID,
-            yandex_api_key=config.YANDEX_API_KEY,
-            document_loader=self.document_loader,
-            vector_db=self.vector_db
+        self.kafka_producer = self.messaging.create_producer(
+            linger_ms=config.KAFKA_LINGER_MS,
+            batch_size=config.KAFKA_PRODUCER_BATCH_BYTES,
+            compression_type=config.KAFKA_COMPRESSION_TYPE
+        )
+
+        # Все сообщения бота идут через общий планировщик с лимитами Telegram
+        self.delivery = DeliveryService(
+            bot=self.bot,
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            chat_rate=config.TELEGRAM_CHAT_RATE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+            retries=config.DELIVERY_RETRIES,
+            retry_backoff=config.DELIVERY_RETRY_BACKOFF,
+            max_redeliveries=config.DELIVERY_MAX_REDELIVERIES
         )
+        self.response_consumer = None
+        if config.RESPONSE_DELIVERY == "kafka":
+            self.messaging.create_topic_if_not_exists(
+                config.KAFKA_RESPONSES_TOPIC,
+                num_partitions=config.KAFKA_PARTITIONS,
+                replication_factor=config.KAFKA_REPLICATION_FACTOR
+            )
+            self.response_consumer = self.messaging.create_consumer(
+                group_id=config.KAFKA_DELIVERY_GROUP_ID,
+                topics=[config.KAFKA_RESPONSES_TOPIC],
+                assignment_strategy=config.KAFKA_ASSIGNMENT_STRATEGY
+            )
+
+        # Журнал запросов - источник для прогрева кэша (warmup.py)
+        self.query_log = QueryLog(
+            config.QUERY_LOG_PATH,
+            max_bytes=config.QUERY_LOG_MAX_BYTES,
+            backups=config.QUERY_LOG_BACKUPS
+        ) if config.QUERY_LOG_PATH else None
+
+        # RAG-ядро нужно боту только со встроенным воркером и собирается в фоне;
+        # для ключей кэша ответов достаточно ревизии базы знаний из алиаса и манифеста
+        self.core = get_core() if config.EMBEDDED_WORKER else None
+        self.kb_revision = KnowledgeBaseRevision(persist_dir=config.VECTOR_DB_DIR, versioned=config.KB_VERSIONED)
 
         logger.info("Bot initialized successfully.")
+        self._kb_update = asyncio.Lock()
         self._register_handlers()
 
-        self.worker = Worker(bot=self.bot)
-
         loop = asyncio.get_event_loop()
-        loop.create_task(self.worker.process_messages())
+        if self.core is not None:
+            self.core.start()
+        loop.create_task(start_metrics_server(port=config.METRICS_PORT))
+        loop.create_task(self.cache.listen_invalidations())
+        if self.response_consumer is not None:
+            loop.create_task(self.delivery.run(
+                self.messaging,
+                self.response_consumer,
+                self.handle_kafka_response,
+                batch_size=config.KAFKA_BATCH_SIZE,
+                batch_timeout=config.KAFKA_BATCH_TIMEOUT_MS / 1000,
+                max_pending=config.DELIVERY_MAX_PENDING_BATCHES
+            ))
+
+        # Без встроенного воркера базу знаний пересобирают процессы worker.py; из процессов с RAG-ядром
+        # это делает только владелец индекса
+        if self.core is not None and config.KB_WATCH_INTERVAL > 0:
+            loop.create_task(self.core.own_index(self.update_knowledge_base, config.KB_WATCH_INTERVAL))
+
+        # В режиме масштабирования запросы обрабатывают отдельные процессы worker.py
+        self.worker = Worker(bot=self.bot, delivery=self.delivery) if config.EMBEDDED_WORKER else None
+        if self.worker is not None:
+            loop.create_task(self.worker.process_messages())
 
     def _register_handlers(self):
         @self.dp.message_handler(commands=['start', 'help'])
@@ -60,59 +128,86 @@ class TelegramBot:
             logger.info(f"Received command: /start or /help from {message.chat.id}")
             await message.reply("Привет! Я ассистент по путешествиям. Спроси меня о странах, достопримечательностях или лучших сезонах для отдыха!")
 
+        if config.ADMIN_CHAT_IDS and self.core is not None:
+            @self.dp.message_handler(commands=['reload'], chat_id=config.ADMIN_CHAT_IDS)
+            async def reload_knowledge_base(message: types.Message):
+                logger.info(f"Knowledge base reload requested by {message.chat.id}")
+                await message.reply("Пересобираю базу знаний...")
+                stats = await self.update_knowledge_base()
+                await message.reply(f"Готово: {stats}")
+
 
         @self.dp.message_handler()
         async def handle_message(message: types.Message):
             try:
-                logger.info(f"Received message from {message.chat.id}: {message.text}")
-
-                cache_key = self.cache.generate_cache_key(message.text)
-                cached_response = self.cache.get(cache_key)
+                logger.debug(f"Received message from {message.chat.id}")
+                if self.query_log is not None:
+                    self.query_log.record(message.text)
+
+                with timed("cache_lookup"):
+                    cache_version = format_cache_version(
+                        config.YANDEX_MODEL_NAME, config.YANDEX_MODEL_VERSION, self.kb_revision.revision
+                    )
+                    cache_key = self.cache.generate_cache_key(message.text, cache_version)
+                    cached_response = await self.cache.get(cache_key)
+                count_cache("response", int(bool(cached_response)), int(not cached_response))
 
                 if cached_response:
-                    logger.info(f"Cache hit for message '{message.text}', sending cached response.")
-                    await message.answer(cached_response['response'])
+                    await self.delivery.send(message.chat.id, cached_response['response'])
                     return
 
-                logger.info(f"Cache miss for message '{message.text}', processing request...")
-
                 msg = {
                     'chat_id': message.chat.id,
                     'query': message.text,
                     'message_id': message.message_id
                 }
 
-                logger.info(f"Sending message to Kafka topic '{config.KAFKA_REQUESTS_TOPIC}'")
-                self.messaging.produce_message(
-                    producer=self.kafka_producer,
-                    topic=config.KAFKA_REQUESTS_TOPIC,
-                    key=str(message.chat.id),
-                    value=msg
-                )
-
-                logger.info(f"Message from {message.chat.id} sent to Kafka for processing.")
-                await asyncio.sleep(1)
+                with timed("kafka_produce"):
+                    self.messaging.produce_message(
+                        producer=self.kafka_producer,
+                        topic=config.KAFKA_REQUESTS_TOPIC,
+                        key=str(message.chat.id),
+                        value=msg
+                    )
 
             except Exception as e:
                 logger.error(f"Error processing message from {message.chat.id}: {str(e)}")
                 await message.answer("Ошибка обработки запроса")
 
-    async def handle_kafka_response(self, message_data: dict):
+    async def update_knowledge_base(self) -> dict:
+        """Сборка новой версии базы знаний в фоне и сброс L1-кэшей во всех процессах"""
+        async with self._kb_update:
+            agent = await self.core.wait_ready()
+            loop = asyncio.get_running_loop()
+            stats = await loop.run_in_executor(None, agent.update_knowledge_base)
+            await self.cache.invalidate()
+            return stats
+
+    async def handle_kafka_response(self, message_data: dict) -> bool:
         """Обработка ответа из Kafka"""
         try:
             chat_id = message_data['chat_id']
             response = message_data['response']
-            logger.info(f"Received response from Kafka for chat_id {chat_id}: {response}")
+            logger.debug(f"Received response from Kafka for chat_id {chat_id}")
+
+            # Потоковый ответ воркер уже показал в чате правками сообщения
+            if message_data.get('delivered'):
+                return True
 
             # Отправка ответа пользователю в Telegram
-            await self.bot.send_message(chat_id=chat_id, text=response)
+            return await self.delivery.send(chat_id, response)
         except Exception as e:
             logger.error(f"Failed to handle Kafka response: {str(e)}")
+            return False
 
     def run(self):
         logger.info("Starting bot polling...")
-        executor.start_polling(self.dp, skip_updates=True)
-        logger.info("Bot polling started.")
+        try:
+            executor.start_polling(self.dp, skip_updates=True)
+        finally:
+            if self.query_log is not None:
+                self.query_log.close()
+        logger.info("Bot polling stopped.")
 
 
 if __name__ == '__main__':
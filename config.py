@@ -11,14 +11,168 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 # Paths
 DATA_PATH = os.getenv("DATA_PATH", "data")
 
+# Ingestion
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+INGEST_FAST_MARKDOWN = os.getenv("INGEST_FAST_MARKDOWN", "true").lower() == "true"
+# Разбор в пуле процессов - только от этого числа файлов, меньшие наборы разбираются в текущем процессе
+INGEST_PARALLEL_MIN_FILES = int(os.getenv("INGEST_PARALLEL_MIN_FILES", 64))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 256))
+# Размер чанка в токенах (0 - старое разбиение по символам) и перекрытие соседних чанков
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 256))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+
+# Исполнитель эмбеддингов: пакеты до EMBEDDING_BATCH_SIZE текстов, ожидание пакета до EMBEDDING_MAX_WAIT_MS,
+# EMBEDDING_WORKERS потоков (0 - по числу ядер). int8-модель требует пакет onnx; после смены варианта
+# модели базу знаний стоит пересобрать
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 0))
+EMBEDDING_QUANTIZED = os.getenv("EMBEDDING_QUANTIZED", "false").lower() == "true"
+
+# Vector DB: "chroma" или "numpy" (memory-mapped индекс)
+VECTOR_DB_BACKEND = os.getenv("VECTOR_DB_BACKEND", "chroma")
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "db")
+# Версии базы знаний: пересборка пишет коллекцию documents_v{n}, после проверки переключается алиас.
+# VECTOR_DB_DIR должен быть общим для бота и воркеров
+KB_VERSIONED = os.getenv("KB_VERSIONED", "true").lower() == "true"
+KB_KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", 2))
+KB_MIN_CHUNK_RATIO = float(os.getenv("KB_MIN_CHUNK_RATIO", 0.5))
+KB_SMOKE_QUERIES = [
+    query.strip()
+    for query in os.getenv("KB_SMOKE_QUERIES", "Что посмотреть в Италии?;Куда поехать летом на море?").split(";")
+    if query.strip()
+]
+# Опрос DATA_PATH и пересборка при изменениях (0 - выключено); /reload - для ADMIN_CHAT_IDS.
+# Собирает базу знаний только владелец индекса (блокировка в VECTOR_DB_DIR), остальные процессы её открывают
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", 10.0))
+ADMIN_CHAT_IDS = {int(chat_id) for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()}
+# Retrieval: "dense" или "hybrid" (BM25 + эмбеддинги, reciprocal-rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+# Поиск только по чанкам стран, упомянутых в запросе (индекс псевдонимов modules/entities.py)
+ENTITY_FILTER_ENABLED = os.getenv("ENTITY_FILTER_ENABLED", "true").lower() == "true"
+
+# Prompt packing: бюджет токенов на контекст и порог отсева почти дублирующихся чанков
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", 1200))
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv("PROMPT_DEDUPE_THRESHOLD", 0.8))
+
+# Retrieval cache
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 4096))
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", 3600))
+
 # Redis
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 CACHE_TTL = int(os.getenv("CACHE_TTL", 86400))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+# Формат сообщений Kafka и значений Redis: json - прежний формат, или msgpack (zstd для значений
+# больше SERIALIZATION_COMPRESS_THRESHOLD байт). Читаются оба, поэтому выкатка в два этапа:
+# сначала все процессы обновляются с json, затем msgpack включается явно
+SERIALIZATION_CODEC = os.getenv("SERIALIZATION_CODEC", "json")
+SERIALIZATION_COMPRESS_THRESHOLD = int(os.getenv("SERIALIZATION_COMPRESS_THRESHOLD", 512))
+SERIALIZATION_ZSTD_LEVEL = int(os.getenv("SERIALIZATION_ZSTD_LEVEL", 3))
+
+# In-process L1 cache
+L1_CACHE_ENABLED = os.getenv("L1_CACHE_ENABLED", "true").lower() == "true"
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", 1024))
+L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+L1_CACHE_TTL = int(os.getenv("L1_CACHE_TTL", 60))
+
+# Semantic cache
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_NEAR_MISS_MARGIN = float(os.getenv("SEMANTIC_CACHE_NEAR_MISS_MARGIN", 0.05))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 10000))
+
+# Прогрев кэша (warmup.py): журнал запросов бота (пусто - не пишется) с ротацией по размеру,
+# число кластеров, частота вызовов LLM и параллельность генерации
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", 50 * 1024 * 1024))
+QUERY_LOG_BACKUPS = int(os.getenv("QUERY_LOG_BACKUPS", 5))
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 200))
+WARMUP_RATE = float(os.getenv("WARMUP_RATE", 2))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+
+# LLM: дедлайны, хеджирование, размыкатель и запасная быстрая модель
+YANDEX_MODEL_NAME = os.getenv("YANDEX_MODEL_NAME", "yandexgpt")
+YANDEX_MODEL_VERSION = os.getenv("YANDEX_MODEL_VERSION", "rc")
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "yandexgpt-lite")
+LLM_FALLBACK_MODEL_VERSION = os.getenv("LLM_FALLBACK_MODEL_VERSION", "latest")
+# REST-эндпоинт вместо SDK, например локальный стаб: http://localhost:8090
+YANDEX_LLM_ENDPOINT = os.getenv("YANDEX_LLM_ENDPOINT")
+LLM_OPTIONS = {
+    "timeout": float(os.getenv("LLM_TIMEOUT", 30.0)),
+    "attempt_timeout": float(os.getenv("LLM_ATTEMPT_TIMEOUT", 15.0)),
+    "hedge": os.getenv("LLM_HEDGE", "true").lower() == "true",
+    "slow_threshold": float(os.getenv("LLM_SLOW_THRESHOLD", 10.0)),
+    "simple_query_tokens": int(os.getenv("LLM_SIMPLE_QUERY_TOKENS", 6)),
+    "failure_threshold": int(os.getenv("LLM_FAILURE_THRESHOLD", 5)),
+    "reset_timeout": float(os.getenv("LLM_RESET_TIMEOUT", 30.0)),
+    "max_hedges": int(os.getenv("LLM_MAX_HEDGES", 4)),
+}
+
+# Single-flight: одна генерация на одинаковые запросы во всех воркерах
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_LEASE_MS = int(os.getenv("SINGLE_FLIGHT_LEASE_MS", 45000))
+SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", 45.0))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 0.5))
 
 # Kafka
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 KAFKA_REQUESTS_TOPIC = os.getenv("KAFKA_REQUESTS_TOPIC", "rag_requests")
 KAFKA_GROUP_ID = os.getenv("KAFKA_GROUP_ID", "rag_workers")
-KAFKA_RESPONSES_TOPIC = os.getenv("KAFKA_RESPONSES_TOPIC", "rag_requests")
\ No newline at end of file
+KAFKA_RESPONSES_TOPIC = os.getenv("KAFKA_RESPONSES_TOPIC", "rag_responses")
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", 32))
+KAFKA_BATCH_TIMEOUT_MS = int(os.getenv("KAFKA_BATCH_TIMEOUT_MS", 200))
+# Число разделов - верхняя граница числа воркеров в группе
+KAFKA_PARTITIONS = int(os.getenv("KAFKA_PARTITIONS", 12))
+KAFKA_REPLICATION_FACTOR = int(os.getenv("KAFKA_REPLICATION_FACTOR", 1))
+KAFKA_ASSIGNMENT_STRATEGY = os.getenv("KAFKA_ASSIGNMENT_STRATEGY", "cooperative-sticky")
+# Пакетирование producer: ожидание попутных сообщений, размер пакета в байтах, сжатие пакета
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", 5))
+KAFKA_PRODUCER_BATCH_BYTES = int(os.getenv("KAFKA_PRODUCER_BATCH_BYTES", 131072))
+KAFKA_COMPRESSION_TYPE = os.getenv("KAFKA_COMPRESSION_TYPE", "lz4")
+
+# Worker
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 8))
+WORKER_MAX_PENDING_BATCHES = int(os.getenv("WORKER_MAX_PENDING_BATCHES", 2))
+WORKER_MAX_REDELIVERIES = int(os.getenv("WORKER_MAX_REDELIVERIES", 3))
+# false - бот только принимает запросы, воркеры запускаются отдельно (python worker.py)
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "true").lower() == "true"
+
+# Admission control: квота YandexGPT (запросов в секунду) и очередь ожидания.
+# LLM_RATE_SHARED - один bucket в Redis на все воркеры; false - квота на каждый процесс отдельно,
+# тогда LLM_RATE_LIMIT нужно делить на число воркеров
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", 10))
+LLM_RATE_BURST = float(os.getenv("LLM_RATE_BURST", 10))
+LLM_RATE_SHARED = os.getenv("LLM_RATE_SHARED", "true").lower() == "true"
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 100))
+ADMISSION_MAX_PER_CHAT = int(os.getenv("ADMISSION_MAX_PER_CHAT", 3))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 20.0))
+
+# Delivery: kafka - воркер пишет ответы в KAFKA_RESPONSES_TOPIC, отправляет их сервис доставки в боте;
+# inline - воркер отправляет ответы в Telegram сам
+RESPONSE_DELIVERY = os.getenv("RESPONSE_DELIVERY", "kafka")
+KAFKA_DELIVERY_GROUP_ID = os.getenv("KAFKA_DELIVERY_GROUP_ID", "rag_delivery")
+DELIVERY_RETRIES = int(os.getenv("DELIVERY_RETRIES", 3))
+DELIVERY_RETRY_BACKOFF = float(os.getenv("DELIVERY_RETRY_BACKOFF", 1.0))
+DELIVERY_MAX_PENDING_BATCHES = int(os.getenv("DELIVERY_MAX_PENDING_BATCHES", 4))
+# Сколько раз перечитывать из темы ответ, который не удалось отправить в Telegram
+DELIVERY_MAX_REDELIVERIES = int(os.getenv("DELIVERY_MAX_REDELIVERIES", 3))
+# Лимиты Telegram Bot API: сообщений в секунду на бота и на чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", 3))
+
+# Streaming: true, false или auto. Правки сообщений отправляет воркер напрямую, поэтому auto включает поток
+# только там, где воркер не обходит лимиты Telegram бота: во встроенном воркере (общий DeliveryService)
+# и в режиме inline. Отдельный воркер в режиме kafka отвечает одним сообщением через тему ответов
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "auto").lower()
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+STREAM_MIN_DELTA = int(os.getenv("STREAM_MIN_DELTA", 40))
+
+# Metrics: Prometheus /metrics (0 - выключено)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+METRICS_LAG_INTERVAL = float(os.getenv("METRICS_LAG_INTERVAL", 15.0))
@@ -0,0 +1,221 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional
+import redis.asyncio as aioredis
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token bucket в Redis: пополнение по часам сервера, взятие токена атомарно для всех процессов.
+# Возвращает 0, если токен взят, иначе - сколько секунд ждать
+_TAKE_SCRIPT = """
+local now = redis.call('time')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or t
+tokens = math.min(capacity, tokens + math.max(0, t - updated) * rate)
+local delay = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    delay = (1 - tokens) / rate
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(t))
+redis.call('expire', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(delay)
+"""
+
+BUSY_MESSAGE = "Сейчас слишком много запросов, повторите, пожалуйста, через минуту 🙏"
+
+
+class Overloaded(Exception):
+    """Запрос отклонён: очередь переполнена или ожидание превысило лимит"""
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до появления токена"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    async def reserve(self) -> float:
+        """Взятие токена, если он есть; иначе - сколько секунд ждать"""
+        delay = self.delay()
+        if delay <= 0:
+            self.take()
+        return delay
+
+
+class SharedTokenBucket:
+    """
+    Общий для всех воркеров token bucket в Redis: квота LLM действует на всю установку,
+    а не умножается на число процессов. Без Redis работает локальный bucket на тех же параметрах
+    """
+
+    def __init__(self, redis_client: aioredis.Redis, rate: float, capacity: float, key: str = "llm_rate"):
+        self.redis = redis_client
+        self.rate = rate
+        self.capacity = capacity
+        self.key = key
+        self.fallback = TokenBucket(rate, capacity)
+        self._take = self.redis.register_script(_TAKE_SCRIPT)
+
+    async def reserve(self) -> float:
+        try:
+            return float(await self._take(keys=[self.key], args=[self.rate, self.capacity]))
+        except Exception as e:
+            logger.error(f"Shared rate limit error, using local bucket: {str(e)}")
+            return await self.fallback.reserve()
+
+
+class AdmissionController:
+    """
+    Допуск запросов к LLM:
+    - частота вызовов ограничена token bucket под квоту YandexGPT (общим в Redis или своим
+      у процесса), параллельность - числом слотов
+    - ожидающие запросы обслуживаются по приоритету, внутри приоритета - по кругу между чатами
+    - при переполнении очереди или долгом ожидании запрос сразу отклоняется (Overloaded)
+    """
+
+    def __init__(
+            self,
+            rate: float,
+            burst: float,
+            concurrency: int,
+            max_queue: int = 100,
+            max_per_chat: int = 5,
+            max_wait: float = 20.0,
+            bucket: Optional[SharedTokenBucket] = None
+    ):
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_per_chat = max_per_chat
+        self.max_wait = max_wait
+        self._active = 0
+        self._size = 0
+        # приоритет -> чат -> очередь ожидающих
+        self._queues: Dict[int, "OrderedDict[Hashable, Deque[asyncio.Future]]"] = {}
+        self._wakeup = asyncio.Event()
+
+    @property
+    def queued(self) -> int:
+        return self._size
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @asynccontextmanager
+    async def slot(self, chat_id: Hashable, priority: int = 0):
+        """Ожидание допуска к LLM; priority 0 - живые запросы, больше - фоновые"""
+        future = self._enqueue(chat_id, priority)
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except BaseException:
+            if future.done():
+                self._release()
+            else:
+                future.cancel()
+                self._remove(chat_id, priority, future)
+            raise
+        if not future.done():
+            future.cancel()
+            self._remove(chat_id, priority, future)
+            raise Overloaded(f"waited more than {self.max_wait}s for admission")
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._wakeup.set()
+
+    def _enqueue(self, chat_id: Hashable, priority: int) -> asyncio.Future:
+        chats = self._queues.setdefault(priority, OrderedDict())
+        waiters = chats.get(chat_id)
+        if self._size >= self.max_queue:
+            raise Overloaded(f"admission queue is full ({self._size} waiting)")
+        if waiters is not None and len(waiters) >= self.max_per_chat:
+            raise Overloaded(f"chat {chat_id} already has {len(waiters)} requests waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        chats.setdefault(chat_id, deque()).append(future)
+        self._size += 1
+        self._wakeup.set()
+        return future
+
+    def _remove(self, chat_id: Hashable, priority: int, future: asyncio.Future) -> None:
+        chats = self._queues.get(priority, {})
+        waiters = chats.get(chat_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self._size -= 1
+        if not waiters:
+            del chats[chat_id]
+
+    def _next(self) -> Optional[asyncio.Future]:
+        """Следующий ожидающий: наивысший приоритет, чаты по кругу"""
+        for priority in sorted(self._queues):
+            chats = self._queues[priority]
+            if not chats:
+                continue
+            chat_id, waiters = next(iter(chats.items()))
+            future = waiters.popleft()
+            self._size -= 1
+            if waiters:
+                chats.move_to_end(chat_id)
+            else:
+                del chats[chat_id]
+            return future
+        return None
+
+    async def try_take(self) -> bool:
+        """Токен квоты без ожидания - для дополнительных вызовов LLM вне слотов (дубликаты запросов)"""
+        return await self.bucket.reserve() <= 0
+
+    async def run(self) -> None:
+        """Цикл выдачи допусков; запускается задачей в event loop воркера"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._size and self._active < self.concurrency:
+                delay = await self.bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                # Токен уже взят: он достаётся первому ожидающему, который ещё не отменён
+                future = self._next()
+                while future is not None and future.done():
+                    future = self._next()
+                if future is None:
+                    break
+                self._active += 1
+                future.set_result(None)
@@ -1,11 +1,24 @@
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Tuple, Iterator
+import numpy as np
 from yandex_cloud_ml_sdk import YCloudML
 from .document_loader import DocumentLoader
+from .prompt_packer import PromptPacker
+from .llm_client import HttpCompletionModel, ResilientLLM
+from .metrics import PROMPT_TOKENS, STAGE_SECONDS, count_cache, timed
+from .tokens import estimate_tokens
 from .vector_db import VectorDB
+from .semantic_cache import SemanticCache
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def format_cache_version(model_name: str, model_version: str, kb_version: str) -> str:
+    """Версия для ключей кэша ответов: модель и ревизия базы знаний"""
+    return f"{model_name}/{model_version}:{kb_version}"
+
+
 class Agent:
     def __init__(
             self,
@@ -14,60 +27,178 @@ class Agent:
             document_loader: DocumentLoader,
             vector_db: VectorDB,
             model_name: str = "yandexgpt",
-            model_version: str = "rc"
+            model_version: str = "rc",
+            semantic_cache: Optional[SemanticCache] = None,
+            index_batch_size: int = 256,
+            retrieval_top_k: int = 3,
+            prompt_packer: Optional[PromptPacker] = None,
+            fallback_model_name: Optional[str] = None,
+            fallback_model_version: str = "latest",
+            llm_endpoint: Optional[str] = None,
+            llm_options: Optional[Dict] = None,
+            build_knowledge_base: bool = True
     ):
         logger.info("Started init Agent")
         self.document_loader = document_loader
         logger.info("FINISHED document_loader")
         self.vector_db = vector_db
         logger.info("FINISHED vector_db")
-        self._init_models(yandex_folder_id, yandex_api_key, model_name, model_version)
+        self.model_name = model_name
+        self.model_version = model_version
+        self.semantic_cache = semantic_cache
+        self.index_batch_size = index_batch_size
+        self.retrieval_top_k = retrieval_top_k
+        self.prompt_packer = prompt_packer
+        models = [(model_name, model_version)]
+        if fallback_model_name:
+            models.append((fallback_model_name, fallback_model_version))
+        self._init_models(yandex_folder_id, yandex_api_key, models, llm_endpoint, llm_options or {})
         logger.info("FINISHED _init_models")
-        self._load_knowledge_base()
-        logger.info("FINISHED _load_knowledge_base")
+        # Базу знаний собирает владелец индекса, остальные процессы работают с её рабочей версией
+        if build_knowledge_base:
+            self._load_knowledge_base()
+            logger.info("FINISHED _load_knowledge_base")
 
-    def _init_models(self, folder_id: str, api_key: str, model_name: str, model_version: str):
-        """Инициализация моделей"""
+    def _init_models(
+            self,
+            folder_id: str,
+            api_key: str,
+            models: List[Tuple[str, str]],
+            endpoint: Optional[str],
+            options: Dict
+    ):
+        """
+        Инициализация моделей: основная и запасные по порядку, с дедлайнами,
+        хеджированием и размыкателем. endpoint направляет вызовы в REST API (например, на стаб)
+        """
         logger.info("STARTED _init_models")
-        self.sdk = YCloudML(folder_id=folder_id, auth=api_key)
-        logger.info("FINISHED sdk")
-        self.model = self.sdk.models.completions(model_name, model_version=model_version)
-        logger.info("FINISHED sdk.models.completions")
+        if endpoint:
+            clients = [
+                (name, HttpCompletionModel(endpoint, f"gpt://{folder_id}/{name}/{version}", api_key))
+                for name, version in models
+            ]
+        else:
+            self.sdk = YCloudML(folder_id=folder_id, auth=api_key)
+            logger.info("FINISHED sdk")
+            clients = [
+                (name, self.sdk.models.completions(name, model_version=version))
+                for name, version in models
+            ]
+        self.model = ResilientLLM(clients, **options)
+        logger.info(f"FINISHED models: {', '.join(name for name, _ in models)}")
 
     def _load_knowledge_base(self):
         """Загрузка документов в векторную БД"""
         logger.info("STARTED _load_knowledge_base")
-        documents = {}
-        for doc_name, chunks in self.document_loader.load_and_chunk_documents().items():
-            logger.info(f"\t {doc_name} - {chunks}")
-            for i, chunk in enumerate(chunks):
-                doc_id = f"{doc_name}_chunk_{i}"
-                documents[doc_id] = chunk
+        documents = (
+            (doc_name, {f"{doc_name}_chunk_{i}": chunk for i, chunk in enumerate(chunks)})
+            for doc_name, chunks in self.document_loader.iter_documents()
+        )
 
-        logger.info("STARTED add_documents")
-        self.vector_db.add_documents(documents)
+        logger.info("STARTED sync_documents")
+        return self.vector_db.sync_documents(documents, batch_size=self.index_batch_size)
+
+    @property
+    def cache_version(self) -> str:
+        """Версия для ключей кэша ответов: модель и ревизия базы знаний"""
+        return format_cache_version(self.model_name, self.model_version, self.vector_db.kb_version)
 
     def generate_response(self, query: str, temperature: float = 0.7) -> str:
         """Генерация ответа с RAG"""
         try:
-            context_chunks = self.vector_db.query(query)
-
-            prompt = self._build_prompt(query, [chunk for chunk, _ in context_chunks])
-
-            response = self.model.run(prompt).text
+            query_embeddings = self.embed_queries([query])
+            cached_response = self.lookup_cached(query_embeddings, [query])[0]
+            if cached_response is not None:
+                return cached_response
 
-            return self._postprocess_response(response, query)
+            context = self.retrieve([query], query_embeddings)[0]
+            return self.generate_with_context(query, context, temperature, query_embeddings[0])
         except Exception as e:
-            return f"Ошибка при обработке запроса: {str(e)}"
+            # Ошибка не превращается в текст ответа, чтобы не попасть в кэш
+            logger.error(f"Failed to generate response for query '{query}': {str(e)}")
+            raise
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Эмбеддинги запросов, общие для семантического кэша и поиска"""
+        return self.vector_db.embed(queries)
+
+    def lookup_cached(self, query_embeddings: np.ndarray, queries: List[str]) -> List[Optional[str]]:
+        """Поиск готовых ответов на семантически близкие запросы"""
+        if self.semantic_cache is None:
+            return [None] * len(query_embeddings)
+        version = self.cache_version
+        with timed("semantic_cache"):
+            responses = [
+                self.semantic_cache.lookup(embedding, version, query)
+                for embedding, query in zip(query_embeddings, queries)
+            ]
+        hits = sum(response is not None for response in responses)
+        count_cache("semantic", hits, len(responses) - hits)
+        return responses
+
+    def retrieve(self, queries: List[str], query_embeddings: Optional[np.ndarray] = None) -> List[List[Tuple[str, str]]]:
+        """Пакетный поиск контекста для нескольких запросов: (id чанка, текст)"""
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        with timed("retrieve"):
+            found = self.vector_db.search(query_embeddings, top_k=self.retrieval_top_k, query_texts=queries)
+        return [[(chunk_id, chunk) for chunk_id, chunk, _ in results] for results in found]
+
+    def generate_with_context(
+            self,
+            query: str,
+            context: List[Tuple[str, str]],
+            temperature: float = 0.7,
+            query_embedding: Optional[np.ndarray] = None
+    ) -> str:
+        """Генерация ответа по заранее найденному контексту"""
+        prompt = self._build_prompt(query, [chunk for _, chunk in context])
+
+        with timed("llm"):
+            raw_response = self.model.run(prompt, simple=self.model.is_simple(query), temperature=temperature).text
+        return self.complete_response(query, raw_response, context, query_embedding)
+
+    def stream_with_context(self, query: str, context: List[Tuple[str, str]], temperature: float = 0.7) -> Iterator[str]:
+        """Потоковая генерация: накопленный сырой текст ответа по мере поступления"""
+        prompt = self._build_prompt(query, [chunk for _, chunk in context])
+
+        text = ""
+        with timed("llm"):
+            started = time.perf_counter()
+            for result in self.model.run_stream(prompt, simple=self.model.is_simple(query), temperature=temperature):
+                if not text:
+                    STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - started)
+                part = result.text
+                # YandexGPT отдаёт в потоке накопленный текст, но поддерживаем и дельты
+                text = part if part.startswith(text) else text + part
+                yield text
+
+    def complete_response(
+            self,
+            query: str,
+            raw_response: str,
+            context: List[Tuple[str, str]],
+            query_embedding: Optional[np.ndarray] = None
+    ) -> str:
+        """Постобработка готового ответа и сохранение его в семантический кэш"""
+        response = self._postprocess_response(raw_response, query)
+
+        if self.semantic_cache is not None and query_embedding is not None:
+            self.semantic_cache.put(
+                query_embedding, response, [chunk_id for chunk_id, _ in context], self.cache_version, query
+            )
+        return response
 
     def _build_prompt(self, query: str, context_chunks: List[str]) -> str:
-        """Формирование промпта с контекстом"""
+        """Формирование промпта с контекстом в пределах бюджета токенов"""
+        if self.prompt_packer is not None:
+            context_chunks = self.prompt_packer.pack(context_chunks)
         context = "\n\n".join(
             f"Контекст {i + 1}:\n{chunk}"
             for i, chunk in enumerate(context_chunks)
         ) if context_chunks else "Контекст не найден"
 
-        return f"""
+        prompt = f"""
         Ты - бот, который помогает пользователям выбрать страну для путешествий. Ты рекомендуешь страны, основываясь на интересных фактах, достопримечательностях, местных традициях и уникальных особенностях. В каждом ответе ты должны красиво описывать страну, упоминать её культуру, природу, популярные места для посещения, а также советы для путешественников.
 
         Пример ответа:
@@ -89,6 +220,8 @@ class Agent:
 
         Ответ (будь точны, но не обязательно кратким):
         """
+        PROMPT_TOKENS.observe(estimate_tokens(prompt))
+        return prompt
 
     def _postprocess_response(self, response: str, original_query: str) -> str:
         """
@@ -116,6 +249,6 @@ class Agent:
 
         return response
 
-    def update_knowledge_base(self):
+    def update_knowledge_base(self) -> Dict[str, int]:
         """Обновление базы знаний"""
-        self._load_knowledge_base()
+        return self._load_knowledge_base()
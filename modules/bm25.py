@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+_VOWELS = set("аеиоуыэюя")
+
+_STOPWORDS = {
+    "и", "в", "во", "не", "что", "он", "на", "я", "с", "со", "как", "а", "то", "все", "она", "так", "его",
+    "но", "да", "ты", "к", "у", "же", "вы", "за", "бы", "по", "только", "ее", "мне", "было", "вот", "от",
+    "меня", "еще", "нет", "о", "из", "ему", "теперь", "когда", "даже", "ну", "ли", "если", "уже", "или",
+    "быть", "был", "него", "до", "вас", "нибудь", "уж", "вам", "там", "потом", "себя", "ей", "может",
+    "они", "тут", "где", "есть", "надо", "ней", "для", "мы", "тебя", "их", "чем", "была", "сам", "чтоб",
+    "без", "будто", "чего", "раз", "тоже", "себе", "под", "будет", "ж", "тогда", "кто", "этот", "того",
+    "потому", "этого", "какой", "ним", "здесь", "этом", "один", "почти", "мой", "тем", "чтобы", "нее",
+    "это", "эти", "при", "про", "над", "больше", "хочу", "какие", "какая", "стоит", "лучше",
+    "the", "a", "an", "of", "in", "on", "and", "or", "to", "is", "are", "for", "with", "what", "where"
+}
+
+# Упрощённый стеммер Snowball для русского языка: окончания, от длинных к коротким
+_PERFECTIVE_GERUND = (("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"), ("вшись", "вши", "в"))
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+    "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"
+)
+_PARTICIPLE = (("ивш", "ывш", "ующ"), ("ем", "нн", "вш", "ющ", "щ"))
+_VERB = (
+    ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+     "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"),
+    ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий",
+    "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я"
+)
+_SUPERLATIVE = ("ейше", "ейш")
+
+
+def _sorted(suffixes: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sorted(suffixes, key=len, reverse=True))
+
+
+_ADJECTIVE = _sorted(_ADJECTIVE)
+_NOUN = _sorted(_NOUN)
+_SUPERLATIVE = _sorted(_SUPERLATIVE)
+
+
+def _strip(word: str, suffixes: Tuple[str, ...]) -> Tuple[str, bool]:
+    for suffix in suffixes:
+        if word.endswith(suffix):
+            return word[:-len(suffix)], True
+    return word, False
+
+
+def _strip_after_a(word: str, groups: Tuple[Tuple[str, ...], Tuple[str, ...]]) -> Tuple[str, bool]:
+    """Окончания второй группы отрезаются только после «а» или «я»"""
+    word, removed = _strip(word, _sorted(groups[0]))
+    if removed:
+        return word, True
+    for suffix in _sorted(groups[1]):
+        if word.endswith(suffix) and word[:-len(suffix)][-1:] in ("а", "я"):
+            return word[:-len(suffix)], True
+    return word, False
+
+
+def stem_ru(word: str) -> str:
+    """Стемминг русского слова в области RV (после первой гласной)"""
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            prefix, rv = word[:i + 1], word[i + 1:]
+            break
+    else:
+        return word
+
+    rv, removed = _strip_after_a(rv, _PERFECTIVE_GERUND)
+    if not removed:
+        rv, _ = _strip(rv, _REFLEXIVE)
+        rv, removed = _strip(rv, _ADJECTIVE)
+        if removed:
+            rv, _ = _strip_after_a(rv, _PARTICIPLE)
+        else:
+            rv, removed = _strip_after_a(rv, _VERB)
+            if not removed:
+                rv, _ = _strip(rv, _NOUN)
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    rv, _ = _strip(rv, _SUPERLATIVE)
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def stem_en(word: str) -> str:
+    """Лёгкий стемминг английских слов"""
+    for suffix in ("ies", "ing", "ed", "es", "'s", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Токенизация с нормализацией регистра, «ё», стоп-словами и стеммингом"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        if token.isdigit():
+            tokens.append(token)
+        elif token[0] in "abcdefghijklmnopqrstuvwxyz":
+            tokens.append(stem_en(token))
+        else:
+            tokens.append(stem_ru(token))
+    return tokens
+
+
+class BM25Index:
+    """Лексический инвертированный индекс BM25, хранящийся рядом с коллекцией"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._mtime = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            self.postings = data.get('postings', {})
+            self.doc_lengths = data.get('doc_lengths', {})
+            self._total_length = sum(self.doc_lengths.values())
+        except Exception as e:
+            logger.error(f"Failed to read BM25 index {self.path}: {str(e)}")
+            self.postings = {}
+            self.doc_lengths = {}
+            self._total_length = 0
+
+    def refresh(self):
+        """Перечитывание индекса, если его обновил другой процесс"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def save(self):
+        """Атомарная запись индекса на диск"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'postings': self.postings, 'doc_lengths': self.doc_lengths}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def add(self, documents: Dict[str, str]):
+        """Индексация (или переиндексация) документов"""
+        self.remove([doc_id for doc_id in documents if doc_id in self.doc_lengths])
+        for doc_id, text in documents.items():
+            terms = Counter(tokenize(text))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = frequency
+            length = sum(terms.values())
+            self.doc_lengths[doc_id] = length
+            self._total_length += length
+
+    def remove(self, ids: List[str]):
+        ids = [doc_id for doc_id in ids if doc_id in self.doc_lengths]
+        if not ids:
+            return
+        removed = set(ids)
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for doc_id in removed.intersection(postings):
+                del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        for doc_id in ids:
+            self._total_length -= self.doc_lengths.pop(doc_id)
+
+    def reset(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self._total_length = 0
+
+    def search(self, query: str, top_k: int = 3, ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Top-k документов по BM25: (id, score); ids ограничивает поиск подмножеством документов"""
+        if not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        avg_length = self._total_length / doc_count or 1.0
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if ids is not None:
+                # Обходится меньший из двух наборов: постинги термина или разрешённые документы
+                if len(ids) < len(postings):
+                    postings = {doc_id: postings[doc_id] for doc_id in ids if doc_id in postings}
+                else:
+                    postings = {doc_id: frequency for doc_id, frequency in postings.items() if doc_id in ids}
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
@@ -1,18 +1,110 @@
 import redis
+import redis.asyncio as aioredis
 import json
-from typing import Optional, Any
+import time
+import string
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, List, Tuple
 import logging
+from .metrics import timed
+from .serialization import Serializer
 
 logger = logging.getLogger(__name__)
 
+KEY_PREFIX = "rag_response"
+INVALIDATION_CHANNEL = "rag_cache:invalidate"
+_TRIM_CHARS = string.punctuation + string.whitespace + "«»“”„—–…¿¡"
+
+_async_pools: Dict[Tuple[str, int, int], aioredis.ConnectionPool] = {}
+
+
+def normalize_query(query: str) -> str:
+    """Нормализация запроса: регистр, пробелы, пунктуация по краям"""
+    text = query.casefold().replace('ё', 'е')
+    text = ' '.join(text.split())
+    return text.strip(_TRIM_CHARS)
+
+
+def make_cache_key(query: str, version: str = "") -> str:
+    """Стабильный между процессами ключ: sha256 нормализованного запроса и версии БЗ/модели"""
+    digest = hashlib.sha256(f"{version}\n{normalize_query(query)}".encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{digest[:32]}"
+
+
+def _get_async_pool(host: str, port: int, db: int, max_connections: int) -> aioredis.ConnectionPool:
+    """Общий для процесса пул асинхронных соединений с Redis"""
+    pool_key = (host, port, db)
+    if pool_key not in _async_pools:
+        _async_pools[pool_key] = aioredis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=max_connections
+        )
+    return _async_pools[pool_key]
+
+
+class LocalCache:
+    """Процессный LRU-кэш (L1) с ограничением по числу записей, объёму и TTL"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: int = 60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, _, expires_at = item
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int, ttl: Optional[int] = None) -> None:
+        if size > self.max_bytes:
+            return
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, size, time.monotonic() + ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _pop(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
 class CacheManager:
-    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0):
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, serializer: Optional[Serializer] = None):
+        # Значения хранятся байтами в формате Serializer
         self.redis = redis.Redis(
             host=host,
             port=port,
-            db=db,
-            decode_responses=True
+            db=db
         )
+        self.serializer = serializer or Serializer()
         try:
             self.redis.ping()
             logger.info("Connected to Redis successfully")
@@ -23,7 +115,7 @@ class CacheManager:
         """Получение данных из кэша"""
         try:
             cached = self.redis.get(key)
-            return json.loads(cached) if cached else None
+            return self.serializer.loads(cached) if cached else None
         except Exception as e:
             logger.error(f"Cache get error: {str(e)}")
             return None
@@ -31,12 +123,175 @@ class CacheManager:
     def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
         """Сохранение данных в кэш"""
         try:
-            self.redis.setex(key, ttl, json.dumps(value))
+            self.redis.setex(key, ttl, self.serializer.dumps(value))
+            return True
+        except Exception as e:
+            logger.error(f"Cache set error: {str(e)}")
+            return False
+
+    def invalidate(self, keys: Optional[List[str]] = None) -> None:
+        """Рассылка инвалидации L1-кэшей всех процессов (без ключей - полная очистка)"""
+        try:
+            self.redis.publish(INVALIDATION_CHANNEL, json.dumps({'keys': keys}))
+        except Exception as e:
+            logger.error(f"Cache invalidate error: {str(e)}")
+
+    def generate_cache_key(self, query: str, version: str = "") -> str:
+        """Генерация ключа кэша на основе запроса"""
+        return make_cache_key(query, version)
+
+
+class AsyncCacheManager:
+    """Асинхронный клиент кэша с общим пулом соединений и пакетными операциями"""
+
+    def __init__(
+            self,
+            host: str = 'localhost',
+            port: int = 6379,
+            db: int = 0,
+            max_connections: int = 50,
+            local_cache: Optional[LocalCache] = None,
+            serializer: Optional[Serializer] = None
+    ):
+        # Соединения пула возвращают bytes: ответы хранятся сжатыми, а не строками JSON
+        self.redis = aioredis.Redis(
+            connection_pool=_get_async_pool(host, port, db, max_connections)
+        )
+        self.local_cache = local_cache
+        self.serializer = serializer or Serializer()
+
+    async def ping(self) -> bool:
+        try:
+            await self.redis.ping()
+            logger.info("Connected to Redis successfully")
+            return True
+        except redis.ConnectionError:
+            logger.error("Failed to connect to Redis")
+            return False
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Получение данных из кэша"""
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                return value
+        try:
+            with timed("redis"):
+                cached = await self.redis.get(key)
+            return self._decode(key, cached)
+        except Exception as e:
+            logger.error(f"Cache get error: {str(e)}")
+            return None
+
+    async def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
+        """Сохранение данных в кэш"""
+        try:
+            encoded = self.serializer.dumps(value)
+            await self.redis.setex(key, ttl, encoded)
+            self._remember(key, value, encoded, ttl)
             return True
         except Exception as e:
             logger.error(f"Cache set error: {str(e)}")
             return False
 
-    def generate_cache_key(self, query: str) -> str:
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Пакетное получение данных: сначала L1, остальное одним запросом MGET"""
+        if not keys:
+            return []
+        values = [
+            self.local_cache.get(key) if self.local_cache is not None else None
+            for key in keys
+        ]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+        try:
+            with timed("redis"):
+                cached = await self.redis.mget([keys[i] for i in missing])
+            for i, raw in zip(missing, cached):
+                values[i] = self._decode(keys[i], raw)
+        except Exception as e:
+            logger.error(f"Cache mget error: {str(e)}")
+        return values
+
+    async def mset(self, items: Dict[str, Any], ttl: int = 3600) -> bool:
+        """Пакетное сохранение с TTL через pipeline"""
+        if not items:
+            return True
+        try:
+            encoded = {key: self.serializer.dumps(value) for key, value in items.items()}
+            with timed("redis"):
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key, raw in encoded.items():
+                        pipe.setex(key, ttl, raw)
+                    await pipe.execute()
+            for key, value in items.items():
+                self._remember(key, value, encoded[key], ttl)
+            return True
+        except Exception as e:
+            logger.error(f"Cache mset error: {str(e)}")
+            return False
+
+    async def invalidate(self, keys: Optional[List[str]] = None) -> None:
+        """Рассылка инвалидации L1-кэшей всех процессов (без ключей - полная очистка)"""
+        self._apply_invalidation(keys)
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, json.dumps({'keys': keys}))
+        except Exception as e:
+            logger.error(f"Cache invalidate error: {str(e)}")
+
+    async def purge(self) -> None:
+        """Удаление всех ответов из Redis и очистка L1 во всех процессах"""
+        try:
+            keys = [key async for key in self.redis.scan_iter(match=f"{KEY_PREFIX}:*", count=500)]
+            for i in range(0, len(keys), 500):
+                await self.redis.delete(*keys[i:i + 500])
+            logger.info(f"Purged {len(keys)} cached responses")
+        except Exception as e:
+            logger.error(f"Cache purge error: {str(e)}")
+        await self.invalidate()
+
+    async def listen_invalidations(self) -> None:
+        """Подписка на инвалидации L1 от других процессов"""
+        if self.local_cache is None:
+            return
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                logger.info(f"Subscribed to cache invalidations on '{INVALIDATION_CHANNEL}'")
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    self._apply_invalidation(json.loads(message['data']).get('keys'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {str(e)}")
+                # Пропущенные сообщения могли оставить устаревшие записи
+                self._apply_invalidation(None)
+                await asyncio.sleep(1)
+
+    def _apply_invalidation(self, keys: Optional[List[str]]) -> None:
+        if self.local_cache is None:
+            return
+        if keys is None:
+            self.local_cache.clear()
+        else:
+            for key in keys:
+                self.local_cache.delete(key)
+
+    def _decode(self, key: str, raw: Optional[bytes]) -> Optional[Any]:
+        if not raw:
+            return None
+        value = self.serializer.loads(raw)
+        self._remember(key, value, raw, None)
+        return value
+
+    def _remember(self, key: str, value: Any, raw: bytes, ttl: Optional[int]) -> None:
+        if self.local_cache is not None:
+            self.local_cache.set(key, value, Serializer.payload_size(raw), ttl)
+
+    def generate_cache_key(self, query: str, version: str = "") -> str:
         """Генерация ключа кэша на основе запроса"""
-        return f"rag_response:{hash(query)}"
\ No newline at end of file
+        return make_cache_key(query, version)
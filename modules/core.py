@@ -0,0 +1,181 @@
+import time
+import asyncio
+import threading
+from typing import Awaitable, Callable, Optional
+from .agent import Agent
+from .document_loader import DocumentLoader
+from .prompt_packer import PromptPacker
+from .vector_db import VectorDB
+from .numpy_vector_db import NumpyVectorDB
+from .kb_versions import DirectoryWatcher, IndexOwnership, VersionedVectorDB
+from .embedding_executor import EmbeddingExecutor
+from .entities import country_index
+from .semantic_cache import SemanticCache
+from .serialization import Serializer
+from .metrics import register_health_check
+import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RAGCore:
+    """
+    RAG-ядро процесса: загрузчик документов, векторная БД, семантический кэш и Agent.
+    - создаётся один раз на процесс (get_core) и разделяется ботом и воркером
+    - тяжёлая часть (клиент Chroma, SDK, синхронизация БЗ, модель эмбеддингов) собирается в фоне
+    - базу знаний собирает и пересобирает только владелец индекса (IndexOwnership),
+      остальные процессы открывают рабочую версию по алиасу
+    - состояние прогрева видно в /ready: starting, loading, warming_up, ready или failed
+    """
+
+    def __init__(self):
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.document_loader: Optional[DocumentLoader] = None
+        self.vector_db = None
+        self.semantic_cache: Optional[SemanticCache] = None
+        self.ownership = IndexOwnership(config.VECTOR_DB_DIR)
+        self._agent: Optional[Agent] = None
+        self._ready = threading.Event()
+        self._started: Optional[asyncio.Future] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def agent(self) -> Agent:
+        if self._agent is None:
+            raise RuntimeError(f"RAG core is not ready: {self.state}")
+        return self._agent
+
+    def start(self) -> asyncio.Future:
+        """Запуск фоновой инициализации; повторные вызовы возвращают ту же задачу"""
+        if self._started is None:
+            register_health_check("rag_core", lambda: self.state)
+            self._started = asyncio.get_event_loop().run_in_executor(None, self._build)
+        return self._started
+
+    async def wait_ready(self) -> Agent:
+        await asyncio.shield(self.start())
+        return self.agent
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        try:
+            self.state = "loading"
+            self.document_loader = DocumentLoader(
+                data_path=config.DATA_PATH,
+                fast_markdown=config.INGEST_FAST_MARKDOWN,
+                workers=config.INGEST_WORKERS,
+                parallel_min_files=config.INGEST_PARALLEL_MIN_FILES,
+                chunk_tokens=config.CHUNK_TOKENS,
+                chunk_overlap=config.CHUNK_OVERLAP_TOKENS
+            )
+
+            vector_db_class = NumpyVectorDB if config.VECTOR_DB_BACKEND == "numpy" else VectorDB
+            vector_db_options = dict(
+                persist_dir=config.VECTOR_DB_DIR,
+                retrieval_cache_size=config.RETRIEVAL_CACHE_SIZE,
+                retrieval_cache_ttl=config.RETRIEVAL_CACHE_TTL,
+                retrieval_mode=config.RETRIEVAL_MODE,
+                # Один исполнитель эмбеддингов на процесс: индексация и запросы пользователей
+                embedding_func=EmbeddingExecutor(
+                    max_batch_size=config.EMBEDDING_BATCH_SIZE,
+                    max_wait_ms=config.EMBEDDING_MAX_WAIT_MS,
+                    workers=config.EMBEDDING_WORKERS,
+                    quantized=config.EMBEDDING_QUANTIZED
+                ),
+                entity_index=country_index() if config.ENTITY_FILTER_ENABLED else None
+            )
+            self.vector_db = VersionedVectorDB(
+                vector_db_class,
+                keep_versions=config.KB_KEEP_VERSIONS,
+                smoke_queries=config.KB_SMOKE_QUERIES,
+                min_chunk_ratio=config.KB_MIN_CHUNK_RATIO,
+                **vector_db_options
+            ) if config.KB_VERSIONED else vector_db_class(**vector_db_options)
+
+            self.semantic_cache = SemanticCache(
+                host=config.REDIS_HOST,
+                port=config.REDIS_PORT,
+                db=config.REDIS_DB,
+                threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                near_miss_margin=config.SEMANTIC_CACHE_NEAR_MISS_MARGIN,
+                max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+                ttl=config.CACHE_TTL,
+                serializer=Serializer(
+                    codec=config.SERIALIZATION_CODEC,
+                    compress_threshold=config.SERIALIZATION_COMPRESS_THRESHOLD,
+                    level=config.SERIALIZATION_ZSTD_LEVEL
+                ),
+                entity_index=country_index()
+            ) if config.SEMANTIC_CACHE_ENABLED else None
+
+            agent = Agent(
+                yandex_folder_id=config.YANDEX_FOLDER_ID,
+                yandex_api_key=config.YANDEX_API_KEY,
+                document_loader=self.document_loader,
+                vector_db=self.vector_db,
+                index_batch_size=config.INDEX_BATCH_SIZE,
+                retrieval_top_k=config.RETRIEVAL_TOP_K,
+                prompt_packer=PromptPacker(
+                    budget_tokens=config.PROMPT_CONTEXT_TOKENS,
+                    dedupe_threshold=config.PROMPT_DEDUPE_THRESHOLD
+                ),
+                model_name=config.YANDEX_MODEL_NAME,
+                model_version=config.YANDEX_MODEL_VERSION,
+                fallback_model_name=config.LLM_FALLBACK_MODEL,
+                fallback_model_version=config.LLM_FALLBACK_MODEL_VERSION,
+                llm_endpoint=config.YANDEX_LLM_ENDPOINT,
+                llm_options=config.LLM_OPTIONS,
+                semantic_cache=self.semantic_cache,
+                build_knowledge_base=self.ownership.acquire()
+            )
+            logger.info(f"Knowledge base owner: {self.ownership.owned}")
+
+            # Модель эмбеддингов грузится при первом вызове - пусть это будет не запрос пользователя
+            self.state = "warming_up"
+            agent.embed_queries(["прогрев"])
+            self._agent = agent
+            self.state = "ready"
+            self._ready.set()
+            logger.info(f"RAG core ready in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"RAG core initialization failed: {str(e)}")
+            raise
+
+
+    async def own_index(self, on_change: Callable[[], Awaitable[dict]], interval: float) -> None:
+        """
+        Пересборка базы знаний при изменениях DATA_PATH - только во владельце индекса.
+        Остальные процессы раз в interval пробуют перехватить владение: если владелец завершился,
+        новый владелец сразу сверяет базу с документами и дальше следит за каталогом сам
+        """
+        await self.wait_ready()
+        took_over = False
+        while not self.ownership.acquire():
+            took_over = True
+            await asyncio.sleep(interval)
+        if took_over:
+            logger.info("Took over knowledge base ownership")
+            try:
+                await on_change()
+            except Exception as e:
+                logger.error(f"Knowledge base sync after takeover failed: {str(e)}")
+        await DirectoryWatcher(config.DATA_PATH, interval=interval).run(on_change)
+
+_core: Optional[RAGCore] = None
+_core_lock = threading.Lock()
+
+
+def get_core() -> RAGCore:
+    """RAG-ядро текущего процесса"""
+    global _core
+    with _core_lock:
+        if _core is None:
+            _core = RAGCore()
+        return _core
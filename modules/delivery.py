@@ -0,0 +1,293 @@
+import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+from aiogram import Bot
+from aiogram.types import Message
+from aiogram.utils.exceptions import BadRequest, CantParseEntities, MessageNotModified, RetryAfter, Unauthorized
+from confluent_kafka import TopicPartition
+from modules.admission import TokenBucket
+from modules.messaging import OrderedCommitter
+from modules.metrics import timed, track_in_flight
+import logging
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+CODE_FENCE = "```"
+
+
+def _cut_position(text: str, limit: int) -> int:
+    """Позиция разреза: граница абзаца, строки, предложения или слова, в крайнем случае - ровно по лимиту"""
+    window = text[:limit]
+    for separator in ("\n\n", "\n", ". ", "! ", "? ", " "):
+        position = window.rfind(separator)
+        # Слишком короткие части не нужны, ищем разделитель мельче
+        if position >= limit // 2:
+            return position + len(separator)
+    return limit
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбиение длинного ответа на сообщения Telegram.
+    Режется по естественным границам, чтобы не разрывать разметку внутри строки;
+    разорванный блок кода закрывается в одной части и открывается заново в следующей.
+    """
+    parts = []
+    reserve = len(CODE_FENCE) + 1
+    while len(text) > limit:
+        cut = _cut_position(text, limit - reserve)
+        part, text = text[:cut].rstrip(), text[cut:].lstrip(" \n")
+        if part.count(CODE_FENCE) % 2:
+            part += "\n" + CODE_FENCE
+            text = CODE_FENCE + "\n" + text
+        if part:
+            parts.append(part)
+    if text.strip():
+        parts.append(text)
+    return parts
+
+
+class TelegramRateLimiter:
+    """
+    Лимиты Telegram Bot API на исходящие сообщения:
+    - общий token bucket на бота (около 30 сообщений в секунду)
+    - token bucket на каждый чат (около 1 сообщения в секунду)
+    - retry_after из ответа 429 приостанавливает отправку целиком
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Давно молчавшие чаты вытесняются: их bucket всё равно был бы полон
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _delay(self, chat_id: int) -> float:
+        bucket = self._chat_bucket(chat_id)
+        delay = max(self._paused_until - time.monotonic(), bucket.delay(), self.global_bucket.delay())
+        if delay <= 0:
+            bucket.take()
+            self.global_bucket.take()
+        return delay
+
+    async def acquire(self, chat_id: int) -> None:
+        """Ожидание разрешения на отправку одного сообщения в чат"""
+        while True:
+            delay = self._delay(chat_id)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def try_acquire(self, chat_id: int) -> bool:
+        """Разрешение без ожидания - для необязательных запросов вроде промежуточных правок"""
+        return self._delay(chat_id) <= 0
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class DeliveryService:
+    """
+    Доставка ответов в Telegram:
+    - длинные ответы делятся на части по безопасным для Markdown границам
+    - отправка идёт через TelegramRateLimiter, сообщения одного чата - строго по очереди
+    - при ошибке разметки часть уходит простым текстом, временные ошибки повторяются
+    - run() читает тему ответов и коммитит смещения после отправки; неотправленные ответы перечитываются
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            global_rate: float = 30.0,
+            chat_rate: float = 1.0,
+            chat_burst: float = 3.0,
+            retries: int = 3,
+            retry_backoff: float = 1.0,
+            max_redeliveries: int = 3
+    ):
+        self.bot = bot
+        self.limiter = TelegramRateLimiter(global_rate, chat_rate, chat_burst)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.max_redeliveries = max_redeliveries
+        # Замок чата живёт, пока в этот чат кто-то отправляет или ждёт очереди
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_users: Dict[int, int] = {}
+        self._sending = 0
+
+    async def send(self, chat_id: int, text: str, parse_mode: Optional[str] = "Markdown") -> bool:
+        """
+        Отправка ответа в чат. False - временная ошибка не прошла за все попытки;
+        постоянные ошибки (бот заблокирован, чат не найден) считаются обработанными.
+        """
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_users[chat_id] = self._chat_users.get(chat_id, 0) + 1
+        self._sending += 1
+        try:
+            async with lock:
+                with timed("deliver"):
+                    for part in split_message(text):
+                        if not await self._send_part(chat_id, part, parse_mode):
+                            return False
+                return True
+        finally:
+            self._sending -= 1
+            self._chat_users[chat_id] -= 1
+            if not self._chat_users[chat_id]:
+                del self._chat_users[chat_id], self._chat_locks[chat_id]
+
+    async def send_placeholder(self, chat_id: int, text: str) -> Optional[Message]:
+        """Сообщение-заглушка потокового ответа; None - отправить не удалось"""
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                return await self.bot.send_message(chat_id=chat_id, text=text)
+            except RetryAfter as e:
+                logger.warning(f"Telegram flood control, pausing sends for {e.timeout}s")
+                self.limiter.pause(e.timeout)
+            except Exception as e:
+                logger.error(f"Failed to send placeholder to chat {chat_id}: {str(e)}")
+                return None
+
+    async def edit(self, message: Message, text: str, parse_mode: Optional[str] = None, wait: bool = True) -> bool:
+        """
+        Правка отправленного сообщения в пределах тех же лимитов, что и отправка.
+        wait=False - промежуточная правка: при исчерпанном лимите или ошибке она пропускается.
+        False - правка не прошла (в том числе сообщение удалено), текст нужно отправить заново.
+        """
+        chat_id = message.chat.id
+        attempt = 0
+        while True:
+            if wait:
+                await self.limiter.acquire(chat_id)
+            elif not self.limiter.try_acquire(chat_id):
+                return False
+            try:
+                await self.bot.edit_message_text(
+                    text=text, chat_id=chat_id, message_id=message.message_id, parse_mode=parse_mode
+                )
+                return True
+            except MessageNotModified:
+                return True
+            except CantParseEntities:
+                parse_mode = None
+                continue
+            except RetryAfter as e:
+                logger.warning(f"Telegram flood control, pausing sends for {e.timeout}s")
+                self.limiter.pause(e.timeout)
+                if not wait:
+                    return False
+                continue
+            except (BadRequest, Unauthorized) as e:
+                logger.warning(f"Cannot edit message in chat {chat_id}: {str(e)}")
+                return False
+            except Exception as e:
+                logger.warning(f"Failed to edit message in chat {chat_id} (attempt {attempt + 1}): {str(e)}")
+            if not wait or attempt >= self.retries:
+                return False
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+
+    async def _send_part(self, chat_id: int, text: str, parse_mode: Optional[str]) -> bool:
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return True
+            except CantParseEntities:
+                # Модель прислала незакрытую разметку - та же часть уходит простым текстом
+                logger.debug(f"Markdown rejected for chat {chat_id}, sending as plain text")
+                parse_mode = None
+                continue
+            except RetryAfter as e:
+                # 429 не считается попыткой: Telegram сам сказал, когда можно продолжать
+                logger.warning(f"Telegram flood control, pausing sends for {e.timeout}s")
+                self.limiter.pause(e.timeout)
+                continue
+            except (BadRequest, Unauthorized) as e:
+                logger.warning(f"Dropping message for chat {chat_id}: {str(e)}")
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to send message to chat {chat_id} (attempt {attempt + 1}): {str(e)}")
+            if attempt >= self.retries:
+                logger.error(f"Giving up sending to chat {chat_id} after {attempt + 1} attempts")
+                return False
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+
+    async def run(
+            self,
+            messaging,
+            consumer,
+            handler: Callable[[dict], Awaitable[bool]],
+            batch_size: int = 64,
+            batch_timeout: float = 0.2,
+            max_pending: int = 4
+    ):
+        """
+        Чтение темы ответов: сообщения разных чатов отправляются параллельно, одного чата - по порядку.
+        Смещения коммитятся по порядку пакетов после того, как handler обработал все сообщения пакета;
+        в разделах с неотправленными ответами - только до первого из них, и чтение возвращается к нему.
+        """
+        loop = asyncio.get_running_loop()
+        # Consumer не потокобезопасен, поэтому все вызовы к нему идут из одного потока
+        poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag_delivery_poll")
+        committer = OrderedCommitter(messaging, consumer, poll_executor, max_redeliveries=self.max_redeliveries)
+        track_in_flight("deliveries", lambda: self._sending)
+        logger.info("Delivery service started")
+
+        async def deliver(batch: List[dict]) -> List[TopicPartition]:
+            return messaging.first_offsets(await self._deliver_batch(batch, handler))
+
+        while True:
+            try:
+                batch = await loop.run_in_executor(poll_executor, messaging.consume, consumer, batch_size, batch_timeout)
+            except Exception as e:
+                logger.error(f"Error while polling responses: {str(e)}")
+                batch = []
+
+            if batch:
+                committer.add(loop.create_task(deliver(batch)), messaging.batch_offsets(batch))
+
+            await committer.commit_ready()
+
+            if len(committer) >= max_pending:
+                await committer.wait_oldest()
+
+    async def _deliver_batch(self, batch: List[dict], handler: Callable[[dict], Awaitable[bool]]) -> List[dict]:
+        """Отправка пакета ответов; возвращает сообщения, которые отправить не удалось"""
+        chats: Dict[object, List[dict]] = {}
+        for message in batch:
+            chats.setdefault(message['value'].get('chat_id'), []).append(message)
+
+        async def deliver_chat(messages: List[dict]) -> List[dict]:
+            failed = []
+            for message in messages:
+                value = message['value']
+                try:
+                    delivered = await handler(value)
+                except Exception as e:
+                    logger.error(f"Failed to deliver response to chat {value.get('chat_id')}: {str(e)}")
+                    delivered = False
+                if not delivered:
+                    failed.append(message)
+            return failed
+
+        results = await asyncio.gather(*(deliver_chat(messages) for messages in chats.values()))
+        return [message for failed in results for message in failed]
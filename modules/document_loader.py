@@ -1,33 +1,148 @@
 import os
+import re
 import glob
-from typing import Dict, List
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Iterator, Optional, Tuple
 import markdown
 from bs4 import BeautifulSoup
+from .tokens import estimate_tokens, split_sentences
+
+_MD_RULES = [
+    (re.compile(r'^[ \t]*```.*$', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]{0,3}(?:[-*_][ \t]*){3,}$', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]{0,3}#{1,6}[ \t]*', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]*>[ \t]?', re.MULTILINE), ''),
+    (re.compile(r'^[ \t]*(?:[-*+]|\d+[.)])[ \t]+', re.MULTILINE), ''),
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),
+    (re.compile(r'<[^>]+>'), ''),
+    (re.compile(r'(\*\*|__)(.+?)\1'), r'\2'),
+    (re.compile(r'(?<![\w*])[*_](?!\s)(.+?)(?<!\s)[*_](?![\w*])'), r'\1'),
+    (re.compile(r'`([^`]*)`'), r'\1'),
+    (re.compile(r'^[ \t]*\|?(?:[ \t]*:?-+:?[ \t]*\|)+[ \t]*(?::?-+:?)?[ \t]*$', re.MULTILINE), ''),
+    (re.compile(r'[ \t]*\|[ \t]*'), ' '),
+]
+
+# Заголовки разделов: markdown-заголовки и строки целиком из жирного текста («- **Кухня**:»)
+_HEADING_RE = re.compile(r'^[ \t]*(?:#{1,6}[ \t]+.+|(?:[-*+][ \t]+)?\*\*[^*]+\*\*:?)[ \t]*$')
 
 
 class DocumentLoader:
-    def __init__(self, data_path: str = "data", chunk_size: int = 1000):
+    def __init__(
+            self,
+            data_path: str = "data",
+            chunk_size: int = 1000,
+            fast_markdown: bool = True,
+            workers: Optional[int] = None,
+            chunk_tokens: Optional[int] = None,
+            chunk_overlap: int = 0,
+            parallel_min_files: int = 64
+    ):
         self.data_path = data_path
         self.chunk_size = chunk_size
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.fast_markdown = fast_markdown
+        self.workers = workers or os.cpu_count() or 1
+        # На малом числе файлов запуск процессов дороже самого разбора
+        self.parallel_min_files = max(parallel_min_files, 2)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def __getstate__(self):
+        # В процессы пула передаются только настройки разбора
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_lock'] = None
+        return state
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """
+        Пул процессов, общий для всех загрузок. Процессы стартуют через spawn: fork процесса
+        с потоками Kafka, Redis и эмбеддингов копировал бы их состояние и захваченные блокировки
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def close(self) -> None:
+        """Остановка пула процессов"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
 
     def load_and_chunk_documents(self) -> Dict[str, List[str]]:
         """Загрузка и разбиение документов на чанки"""
-        documents = {}
-        for file_path in glob.glob(os.path.join(self.data_path, "*.md")):
-            with open(file_path, 'r', encoding='utf-8') as file:
-                file_name = os.path.basename(file_path)
-                md_content = file.read()
-                clean_text = self._clean_markdown(md_content)
-                chunks = self._split_text(clean_text)
-                documents[file_name] = chunks
-        return documents
+        return dict(self.iter_documents())
+
+    def iter_documents(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Потоковая загрузка: (имя файла, чанки) по мере обработки файлов.
+        От parallel_min_files файлов разбор распределяется по пулу процессов, число файлов в работе ограничено.
+        """
+        file_paths = sorted(glob.glob(os.path.join(self.data_path, "*.md")))
+        if self.workers <= 1 or len(file_paths) < self.parallel_min_files:
+            for file_path in file_paths:
+                yield self._process_file(file_path)
+            return
+
+        window = self.workers * 4
+        pool = self._get_pool()
+        pending = deque()
+        try:
+            for file_path in file_paths:
+                pending.append(pool.submit(self._process_file, file_path))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            # Упавший процесс ломает пул целиком: следующая загрузка создаст новый
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str]]:
+        """Потоковая загрузка: (id чанка, текст)"""
+        for file_name, chunks in self.iter_documents():
+            for i, chunk in enumerate(chunks):
+                yield f"{file_name}_chunk_{i}", chunk
+
+    def _process_file(self, file_path: str) -> Tuple[str, List[str]]:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            md_content = file.read()
+        if self.chunk_tokens:
+            return os.path.basename(file_path), self._split_structured(md_content)
+        clean_text = self._clean_markdown(md_content)
+        return os.path.basename(file_path), self._split_text(clean_text)
 
     def _clean_markdown(self, text: str) -> str:
         """Очистка markdown текста"""
+        if self.fast_markdown:
+            return self._strip_markdown(text)
         html = markdown.markdown(text)
         soup = BeautifulSoup(html, 'html.parser')
         return soup.get_text(separator='\n', strip=True)
 
+    @staticmethod
+    def _strip_markdown(text: str) -> str:
+        """Быстрое удаление markdown-разметки без промежуточного HTML"""
+        for pattern, replacement in _MD_RULES:
+            text = pattern.sub(replacement, text)
+        return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
     def _split_text(self, text: str) -> List[str]:
         """Разбиение текста на чанки"""
         words = text.split()
@@ -47,4 +162,100 @@ class DocumentLoader:
         if current_chunk:
             chunks.append(" ".join(current_chunk))
 
-        return chunks
\ No newline at end of file
+        return chunks
+
+    def _split_structured(self, md_content: str) -> List[str]:
+        """
+        Разбиение с учётом структуры и бюджета токенов:
+        - разделы по заголовкам упаковываются целиком, пока помещаются в chunk_tokens
+        - длинный раздел режется по предложениям с перекрытием chunk_overlap токенов,
+          каждый его чанк начинается с заголовка раздела
+        """
+        chunks = []
+        current: List[str] = []
+        current_tokens = 0
+
+        def flush():
+            nonlocal current, current_tokens
+            if current:
+                chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+
+        for heading, body in self._sections(md_content):
+            section = "\n".join(part for part in (heading, body) if part)
+            section_tokens = estimate_tokens(section)
+            if not section_tokens:
+                continue
+
+            if current_tokens + section_tokens <= self.chunk_tokens:
+                current.append(section)
+                current_tokens += section_tokens
+                continue
+
+            flush()
+            if section_tokens <= self.chunk_tokens:
+                current, current_tokens = [section], section_tokens
+                continue
+
+            chunks.extend(self._split_section(heading, body))
+
+        flush()
+        return chunks
+
+    def _sections(self, md_content: str) -> List[Tuple[str, str]]:
+        """Разделы документа: (заголовок, очищенный текст)"""
+        sections = []
+        heading, lines = "", []
+        for line in md_content.splitlines():
+            if _HEADING_RE.match(line):
+                sections.append((heading, self._clean_markdown("\n".join(lines))))
+                heading, lines = self._clean_markdown(line).rstrip(':'), []
+            else:
+                lines.append(line)
+        sections.append((heading, self._clean_markdown("\n".join(lines))))
+        return [(heading, body) for heading, body in sections if heading or body]
+
+    def _split_section(self, heading: str, body: str) -> List[str]:
+        """Нарезка длинного раздела по предложениям с перекрытием"""
+        heading_tokens = estimate_tokens(heading)
+        budget = max(self.chunk_tokens - heading_tokens, 1)
+
+        sentences = []
+        for sentence in split_sentences(body):
+            # Предложение длиннее бюджета режется по словам
+            while estimate_tokens(sentence) > budget:
+                words = sentence.split()
+                head = []
+                while words and estimate_tokens(" ".join(head + words[:1])) <= budget:
+                    head.append(words.pop(0))
+                if not head:
+                    head.append(words.pop(0))
+                sentences.append(" ".join(head))
+                sentence = " ".join(words)
+            if sentence:
+                sentences.append(sentence)
+
+        chunks = []
+        window: List[str] = []
+        window_tokens = 0
+        for sentence in sentences:
+            tokens = estimate_tokens(sentence)
+            if window and window_tokens + tokens > budget:
+                chunks.append("\n".join(part for part in (heading, " ".join(window)) if part))
+                # Перекрытие: хвост предыдущего чанка в пределах chunk_overlap токенов
+                overlap, overlap_tokens = [], 0
+                for previous in reversed(window):
+                    previous_tokens = estimate_tokens(previous)
+                    if overlap_tokens + previous_tokens > self.chunk_overlap:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous_tokens
+                if overlap_tokens + tokens > budget:
+                    overlap, overlap_tokens = [], 0
+                window, window_tokens = overlap, overlap_tokens
+            window.append(sentence)
+            window_tokens += tokens
+
+        if window:
+            chunks.append("\n".join(part for part in (heading, " ".join(window)) if part))
+        return chunks
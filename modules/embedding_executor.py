@@ -0,0 +1,255 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, List, Optional, Tuple
+import numpy as np
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+from .metrics import timed, track_in_flight
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+
+class _Job:
+    """Запрос одного вызывающего: тексты, собранные эмбеддинги и future с результатом"""
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+        self.remaining = len(texts)
+        self.future: Future = Future()
+
+
+class EmbeddingExecutor:
+    """
+    Общий для процесса сервис эмбеддингов с динамическим батчингом:
+    - тексты всех вызывающих собираются в пакеты не больше max_batch_size, ожидание пакета - не дольше max_wait_ms
+    - пакеты считаются в пуле из workers потоков (ONNX Runtime отпускает GIL)
+    - запросы пользователей (INTERACTIVE) идут раньше индексации (BULK); индексация занимает
+      не больше workers - 1 потоков, поэтому переиндексация не блокирует поиск
+    - для модели Chroma по умолчанию паддинг идёт до самого длинного текста пакета, а не до 256 токенов;
+      quantized=True включает int8-вариант модели
+    """
+
+    def __init__(
+            self,
+            model=None,
+            max_batch_size: int = 32,
+            max_wait_ms: float = 5.0,
+            workers: Optional[int] = None,
+            quantized: bool = False
+    ):
+        # Модель Chroma по умолчанию создаётся напрямую: DefaultEmbeddingFunction в новых версиях Chroma -
+        # обёртка, и собственная ONNX-сессия для неё не включилась бы
+        self.model = model or ONNXMiniLM_L6_V2()
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers or os.cpu_count() or 1
+        self.quantized = quantized
+        self._queues: Tuple[Deque, Deque] = (deque(), deque())
+        self._cond = threading.Condition()
+        self._free_workers = self.workers
+        self._bulk_active = 0
+        self._bulk_limit = max(self.workers - 1, 1)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._runner = None
+        self._runner_lock = threading.Lock()
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        """Интерфейс функции эмбеддингов Chroma"""
+        return list(self.embed(list(input)))
+
+    def embed(self, texts: List[str], priority: int = INTERACTIVE) -> np.ndarray:
+        """Эмбеддинги текстов с ожиданием результата"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.submit(texts, priority).result()
+
+    def submit(self, texts: List[str], priority: int = INTERACTIVE) -> Future:
+        """Постановка текстов в очередь; future вернёт матрицу эмбеддингов в порядке texts"""
+        self._start()
+        job = _Job(list(texts))
+        with self._cond:
+            self._queues[priority].append([job, 0])
+            self._cond.notify_all()
+        return job.future
+
+    def _start(self) -> None:
+        if self._pool is not None:
+            return
+        with self._runner_lock:
+            if self._pool is not None:
+                return
+            self._runner = self._load_runner()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rag_embed")
+            threading.Thread(target=self._dispatch, name="rag_embed_dispatch", daemon=True).start()
+            track_in_flight("embedding_queue", self._queued)
+            logger.info(
+                f"Embedding executor started: {self.workers} workers, batch {self.max_batch_size}, "
+                f"wait {self.max_wait * 1000:.0f}ms, quantized={self.quantized}"
+            )
+
+    def _queued(self) -> int:
+        # Вызывается из потока сбора метрик, очереди в это время меняет диспетчер
+        with self._cond:
+            return sum(len(job.texts) - start for queue in self._queues for job, start in queue)
+
+    def _ready_texts(self) -> int:
+        """Тексты, которые можно взять в пакет прямо сейчас"""
+        ready = sum(len(job.texts) - start for job, start in self._queues[INTERACTIVE])
+        if self._bulk_active < self._bulk_limit:
+            ready += sum(len(job.texts) - start for job, start in self._queues[BULK])
+        return ready
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while not self._free_workers or not self._ready_texts():
+                    self._cond.wait()
+                # Под нагрузкой короткое ожидание попутчиков: пакет дешевле тех же запросов по отдельности.
+                # Простаивающий исполнитель запускает одиночный запрос сразу
+                deadline = time.monotonic() + self.max_wait
+                while self._free_workers < self.workers and self._ready_texts() < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, bulk = self._take_batch()
+                if not batch:
+                    continue
+                self._free_workers -= 1
+                self._bulk_active += bulk
+            self._pool.submit(self._run, batch, bulk)
+
+    def _take_batch(self) -> Tuple[List[Tuple[_Job, int, int]], bool]:
+        """
+        Пакет из очередей по приоритету; длинный запрос режется, его остаток остаётся в голове очереди.
+        Второе значение - пакет целиком из индексации.
+        """
+        batch, size, bulk = [], 0, True
+        for priority, queue in enumerate(self._queues):
+            if priority == BULK and self._bulk_active >= self._bulk_limit:
+                break
+            while queue and size < self.max_batch_size:
+                entry = queue[0]
+                job, start = entry
+                end = min(len(job.texts), start + self.max_batch_size - size)
+                batch.append((job, start, end))
+                bulk = bulk and priority == BULK
+                size += end - start
+                if end == len(job.texts):
+                    queue.popleft()
+                else:
+                    entry[1] = end
+        return batch, bool(batch) and bulk
+
+    def _run(self, batch: List[Tuple[_Job, int, int]], bulk: bool) -> None:
+        try:
+            texts = [text for job, start, end in batch for text in job.texts[start:end]]
+            with timed("embed_batch"):
+                embeddings = self._runner(texts)
+            position = 0
+            # Части одного запроса могут досчитываться в разных потоках
+            with self._cond:
+                for job, start, end in batch:
+                    job.embeddings[start:end] = embeddings[position:position + end - start]
+                    position += end - start
+                    job.remaining -= end - start
+                    if not job.remaining and not job.future.done():
+                        job.future.set_result(np.stack(job.embeddings))
+        except Exception as e:
+            logger.error(f"Embedding batch of {sum(end - start for _, start, end in batch)} texts failed: {str(e)}")
+            for job, _, _ in batch:
+                if not job.future.done():
+                    job.future.set_exception(e)
+        finally:
+            with self._cond:
+                self._free_workers += 1
+                self._bulk_active -= bulk
+                self._cond.notify_all()
+
+    def _load_runner(self):
+        """
+        Функция пакетного расчёта: собственная ONNX-сессия для модели Chroma по умолчанию, иначе сама модель.
+        Без своей сессии int8-вариант недоступен, и quantized сбрасывается
+        """
+        if isinstance(self.model, ONNXMiniLM_L6_V2):
+            try:
+                runner = OnnxMiniLMRunner(self.model, threads=1, quantized=self.quantized)
+                self.quantized = runner.quantized
+                return runner
+            except Exception as e:
+                logger.error(f"Failed to load ONNX embedding session, using the Chroma model as is: {str(e)}")
+        if self.quantized:
+            logger.warning(f"int8 embeddings are not available for {type(self.model).__name__}, using the model as is")
+            self.quantized = False
+        model = self.model
+        return lambda texts: np.asarray(model(texts), dtype=np.float32)
+
+
+class OnnxMiniLMRunner:
+    """
+    Прямой запуск all-MiniLM-L6-v2 из кэша Chroma: те же веса и mean pooling,
+    но паддинг до длины пакета и одна сессия на все потоки пула
+    """
+
+    def __init__(self, model: ONNXMiniLM_L6_V2, threads: int = 1, quantized: bool = False):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model._download_model_if_not_exists()
+        model_dir = os.path.join(model.DOWNLOAD_PATH, model.EXTRACTED_FOLDER_NAME)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=model.max_tokens())
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        model_path = os.path.join(model_dir, "model.onnx")
+        if quantized:
+            model_path = self._quantize(model_path)
+        self.quantized = model_path.endswith(".int8.onnx")
+        options = onnxruntime.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Параллельность даёт пул потоков исполнителя, внутри одного пакета - один поток
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+    @staticmethod
+    def _quantize(model_path: str) -> str:
+        """int8-вариант модели (динамическая квантизация весов), создаётся один раз рядом с исходной"""
+        quantized_path = model_path.replace(".onnx", ".int8.onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            logger.error(f"int8 embedding model requires the onnx package, using fp32: {str(e)}")
+            return model_path
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+        logger.info(f"Quantized embedding model saved to {quantized_path}")
+        return quantized_path
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        last_hidden_state = self.session.run(None, {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids)
+        })[0]
+        # Mean pooling по значимым токенам, как в ONNXMiniLM_L6_V2
+        mask = attention_mask[:, :, None].astype(np.float32)
+        embeddings = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings.astype(np.float32)
@@ -0,0 +1,143 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_SEPARATOR_RE = re.compile(r"[^\w]+")
+
+# Страны базы знаний: код ISO 3166 -> названия (рус./англ.), города и достопримечательности.
+# Псевдоним со «*» - основа: совпадает с началом слова и покрывает падежи («итали*» - Италия, Италии, Италию).
+# Без «*» - только целое слово или фраза: короткие основы вроде «инди» или «коре» дают ложные совпадения
+COUNTRY_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "au": ("австрали*", "australia*", "сидне*", "мельбурн*", "брисбен*", "кенгуру", "барьерн* риф*"),
+    "at": ("австри*", "austria*", "вена", "вены", "вене", "вену", "веной", "зальцбург*", "инсбрук*", "тирол*"),
+    "be": ("бельги*", "belgi*", "брюссел*", "брюгге", "антверпен*"),
+    "ca": ("канад*", "canad*", "торонто", "ванкувер*", "монреал*", "оттав*", "квебек*", "ниагар*"),
+    "eg": ("египет", "египт*", "египетск*", "egypt*", "каир*", "гиза", "гизы", "гизе", "хургад*",
+           "шарм эль шейх*", "луксор*", "нил", "нила", "ниле"),
+    "es": ("испани*", "испанск*", "spain", "spanish", "мадрид*", "барселон*", "севиль*", "валенси*", "майорк*",
+           "ибиц*", "андалус*", "канарск*", "тенериф*", "гауди"),
+    "fr": ("франция", "франции", "францию", "францией", "француз*", "france", "french", "париж*", "лувр*",
+           "эйфелев*", "ницц*", "прованс*", "марсел*"),
+    "gr": ("греци*", "греческ*", "greec*", "greek", "афин*", "крит", "крита", "крите", "санторин*", "родос*",
+           "корфу", "акропол*", "салоник*"),
+    "is": ("исланд*", "iceland*", "рейкьявик*"),
+    "in": ("индия", "индии", "индию", "индией", "индийск*", "india", "indian", "гоа", "дели", "мумба*",
+           "тадж махал*", "джайпур*", "варанаси", "керал*"),
+    "it": ("итали*", "итальян*", "italy", "italia*", "рим", "рима", "риме", "римом", "ватикан*", "венеци*",
+           "флоренци*", "милан", "милана", "милане", "тоскан*", "неапол*", "сицили*", "колизе*"),
+    "jp": ("япони*", "японск*", "japan*", "токио", "киото", "осак*", "фудзи*", "хоккайдо", "окинав*", "сакур*"),
+    "my": ("малайзи*", "malaysia*", "куала лумпур*", "лангкави", "пенанг*", "борнео"),
+    "mx": ("мексик*", "mexic*", "канкун*", "юкатан*", "тулум*", "чичен ица"),
+    "nl": ("нидерланд*", "голланд*", "netherlands", "holland*", "dutch", "амстердам*", "роттердам*",
+           "гаага", "гааге", "гаагу"),
+    "nz": ("зеланди*", "новозеландск*", "new zealand*", "окленд*", "веллингтон*", "квинстаун*"),
+    "pt": ("португал*", "portug*", "лиссабон*", "мадейр*", "алгарв*"),
+    "ru": ("росси*", "russia*", "москв*", "петербург*", "питер*", "байкал*", "камчатк*", "сочи", "казан*"),
+    "kr": ("корея", "кореи", "корее", "корею", "кореей", "корейск*", "korea*", "сеул*", "пусан*", "чеджу"),
+    "ch": ("швейцари*", "швейцарск*", "switzerland", "swiss", "цюрих*", "женев*", "берн", "берне", "лозанн*",
+           "церматт*", "маттерхорн*", "интерлакен*"),
+    "th": ("таиланд*", "тайланд*", "тайск*", "thailand", "thai", "бангкок*", "пхукет*", "паттай*", "самуи",
+           "краби"),
+    "tr": ("турци*", "турецк*", "turkey", "turkish", "стамбул*", "анталь*", "анкар*", "каппадоки*", "бодрум*",
+           "памуккале"),
+    "za": ("юар", "южноафриканск*", "южная африка", "южной африке", "южную африку", "южной африки",
+           "south africa*", "кейптаун*", "йоханнесбург*", "претори*", "крюгер*"),
+    "us": ("сша", "америк*", "соединенные штаты", "соединенных штатах", "соединенных штатов",
+           "соединенным штатам", "usa", "united states", "america*", "нью йорк*", "new york", "лос анджелес*",
+           "калифорни*", "флорид*", "гавай*", "лас вегас*", "сан франциско", "гранд каньон*", "йеллоустоун*",
+           "чикаго", "майами"),
+    "gb": ("великобритани*", "британ*", "англия", "англии", "англию", "англией", "англичан*", "uk",
+           "united kingdom", "britain", "british", "england", "лондон*", "шотланди*", "эдинбург*", "уэльс*",
+           "стоунхендж*", "оксфорд*", "кембридж*")
+}
+
+
+def normalize_entity_text(text: str) -> str:
+    """Регистр, «ё» и разделители: «Нью-Йорк» и «нью йорк» совпадают"""
+    return _SEPARATOR_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class AliasIndex:
+    """
+    Автомат Ахо-Корасик над псевдонимами сущностей: все вхождения ищутся за один проход
+    по тексту, время не зависит от числа псевдонимов
+    """
+
+    def __init__(self, aliases: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Для каждого состояния: (сущность, длина псевдонима, основа ли это)
+        self._output: List[List[Tuple[str, int, bool]]] = [[]]
+        for entity, names in aliases.items():
+            for name in names:
+                self._add(name, entity)
+        self._build()
+
+    def _add(self, name: str, entity: str) -> None:
+        stem = name.endswith("*")
+        pattern = normalize_entity_text(name.rstrip("*"))
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((entity, len(pattern), stem))
+
+    def _build(self) -> None:
+        """Ссылки неудач обходом в ширину; выходы состояния дополняются выходами суффиксов"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fail = self._fail[state]
+                    while fail and char not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[str]:
+        """Сущности, упомянутые в тексте, в порядке первого вхождения"""
+        text = f" {normalize_entity_text(text)} "
+        found: Dict[str, int] = {}
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for entity, length, stem in self._output[state]:
+                start = end - length + 1
+                # Псевдоним начинается с начала слова; целое слово должно ещё и закончиться
+                if text[start - 1] != " " or (not stem and text[end + 1] != " "):
+                    continue
+                found.setdefault(entity, start)
+        return sorted(found, key=found.get)
+
+    def key(self, text: str) -> str:
+        """Сущности текста одной строкой без учёта порядка: «Италия и Франция» и «Франция и Италия» совпадают"""
+        return ",".join(sorted(self.find(text)))
+
+    def detect(self, texts: Iterable[str]) -> Optional[str]:
+        """Главная сущность документа: первая упомянутая в первом чанке, где она есть (обычно в заголовке)"""
+        for text in texts:
+            found = self.find(text)
+            if found:
+                return found[0]
+        return None
+
+
+_country_index: Optional[AliasIndex] = None
+
+
+def country_index() -> AliasIndex:
+    """Общий на процесс индекс стран, строится при первом обращении"""
+    global _country_index
+    if _country_index is None:
+        _country_index = AliasIndex(COUNTRY_ALIASES)
+    return _country_index
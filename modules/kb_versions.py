@@ -0,0 +1,365 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+import numpy as np
+from .cache import LocalCache
+from .embedding_executor import EmbeddingExecutor
+from .manifest import IndexManifest
+from .metrics import KB_CHUNKS
+from .vector_db import VectorDB
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBaseValidationError(Exception):
+    """Собранная версия базы знаний не прошла проверку и не будет включена"""
+
+
+class IndexAlias:
+    """Указатель на рабочую версию коллекции: JSON-файл, заменяемый атомарно через os.replace"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version: Optional[int] = None
+        self._stamp = None
+        self._load()
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Failed to read index alias {self.path}: {str(e)}")
+            return
+        # Инод меняется при каждом os.replace, поэтому замена видна даже в пределах одного тика mtime
+        self._stamp = (stat.st_ino, stat.st_mtime_ns)
+        self.version = data.get('version')
+
+    def refresh(self) -> bool:
+        """Перечитывание алиаса, если его переключил другой процесс; True - версия изменилась"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns) == self._stamp:
+            return False
+        version = self.version
+        self._load()
+        return self.version != version
+
+    def point_to(self, version: int, revision: str):
+        """Атомарное переключение алиаса на версию"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': version, 'revision': revision, 'updated_at': time.time()}, file)
+        os.replace(tmp_path, self.path)
+        self._load()
+
+
+def version_collection_name(collection_name: str, version: Optional[int]) -> str:
+    # До первой сборки рабочей считается прежняя неверсионированная коллекция
+    return collection_name if not version else f"{collection_name}_v{version}"
+
+
+class KnowledgeBaseRevision:
+    """
+    Ревизия рабочей версии базы знаний по алиасу и манифесту, без открытия хранилища и модели:
+    тонкому процессу бота она нужна только для ключей кэша ответов
+    """
+
+    def __init__(self, collection_name: str = "documents", persist_dir: str = "db", versioned: bool = True):
+        self.collection_name = collection_name
+        self.persist_dir = persist_dir
+        self.alias = IndexAlias(os.path.join(persist_dir, f"{collection_name}_alias.json")) if versioned else None
+        self._manifest: Optional[IndexManifest] = None
+        self._version: Optional[int] = None
+
+    @property
+    def revision(self) -> str:
+        version = None
+        if self.alias is not None:
+            self.alias.refresh()
+            version = self.alias.version
+        if self._manifest is None or version != self._version:
+            name = version_collection_name(self.collection_name, version)
+            self._manifest = IndexManifest(os.path.join(self.persist_dir, f"{name}_manifest.json"))
+            self._version = version
+        self._manifest.refresh()
+        return self._manifest.revision
+
+
+class VersionedVectorDB:
+    """
+    База знаний из версионированных коллекций {name}_v{n} за общим алиасом:
+    - пересборка пишет новую версию, рабочая в это время не меняется
+    - эмбеддинги неизменившихся чанков копируются из рабочей версии, модель считает только новые
+    - после проверки (число файлов и чанков, контрольные запросы) алиас переключается атомарно
+    - процессы подхватывают новый алиас при следующем запросе, старые версии удаляются
+    """
+
+    def __init__(
+            self,
+            store_class: Type[VectorDB] = VectorDB,
+            collection_name: str = "documents",
+            persist_dir: str = "db",
+            keep_versions: int = 2,
+            smoke_queries: Sequence[str] = (),
+            min_chunk_ratio: float = 0.5,
+            retrieval_cache_size: int = 4096,
+            retrieval_cache_ttl: int = 3600,
+            embedding_func: Optional[EmbeddingExecutor] = None,
+            **store_options
+    ):
+        self.store_class = store_class
+        self.collection_name = collection_name
+        self.persist_dir = persist_dir
+        self.keep_versions = max(keep_versions, 1)
+        self.smoke_queries = list(smoke_queries)
+        self.min_chunk_ratio = min_chunk_ratio
+        self.store_options = dict(
+            store_options,
+            retrieval_cache_size=retrieval_cache_size,
+            retrieval_cache_ttl=retrieval_cache_ttl,
+            # Исполнитель и эмбеддинги запросов не зависят от версии и переживают переключение
+            embedding_func=embedding_func or EmbeddingExecutor(),
+            embedding_cache=LocalCache(
+                max_entries=retrieval_cache_size, max_bytes=64 * 1024 * 1024, ttl=retrieval_cache_ttl
+            )
+        )
+        self._version_re = re.compile(rf"^{re.escape(collection_name)}_v(\d+)_manifest\.json$")
+        self.alias = IndexAlias(os.path.join(persist_dir, f"{collection_name}_alias.json"))
+        self._active = self._open(self._version_name(self.alias.version))
+
+    def _version_name(self, version: Optional[int]) -> str:
+        return version_collection_name(self.collection_name, version)
+
+    def _open(self, name: str) -> VectorDB:
+        return self.store_class(collection_name=name, persist_dir=self.persist_dir, **self.store_options)
+
+    @property
+    def active(self) -> VectorDB:
+        """Рабочая версия; при переключении алиаса другим процессом открывается новая"""
+        if self.alias.refresh():
+            logger.info(f"Knowledge base alias switched to version {self.alias.version}")
+            self._active = self._open(self._version_name(self.alias.version))
+            KB_CHUNKS.set(self._active._count())
+        return self._active
+
+    @property
+    def kb_version(self) -> str:
+        return self.active.kb_version
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.active.embed(texts)
+
+    def search(self, query_embeddings: np.ndarray, top_k: int = 3, query_texts: Optional[List[str]] = None):
+        return self.active.search(query_embeddings, top_k=top_k, query_texts=query_texts)
+
+    def query(self, query_text: str, top_k: int = 3) -> List[Tuple[str, float]]:
+        return self.active.query(query_text, top_k=top_k)
+
+    def query_batch(self, query_texts: List[str], top_k: int = 3) -> List[List[Tuple[str, float]]]:
+        return self.active.query_batch(query_texts, top_k=top_k)
+
+    def sync_documents(
+            self,
+            documents: Iterable[Tuple[str, Dict[str, str]]],
+            batch_size: int = 256
+    ) -> Dict[str, int]:
+        """
+        Сборка новой версии, если документы отличаются от рабочей.
+        В памяти держатся только изменившиеся файлы, для остальных - хэши.
+        """
+        file_hashes: Dict[str, str] = {}
+        changed: Dict[str, Dict[str, str]] = {}
+        manifest = self.active.manifest
+        for file_name, chunks in documents:
+            file_hashes[file_name] = IndexManifest.hash_chunks({
+                chunk_id: IndexManifest.hash_text(content) for chunk_id, content in chunks.items()
+            })
+            if manifest.file_hash(file_name) != file_hashes[file_name]:
+                changed[file_name] = chunks
+        stats = {"files": len(file_hashes), "version": self.alias.version or 0}
+        if not changed and set(manifest.files) == set(file_hashes):
+            return stats
+
+        with self._build_lock():
+            # Пока ждали блокировку, ту же версию мог собрать другой процесс
+            active = self.active
+            if {name: active.manifest.file_hash(name) for name in active.manifest.files} == file_hashes:
+                logger.info(f"Knowledge base version {self.alias.version} is already up to date")
+                return dict(stats, version=self.alias.version or 0)
+            version = self._build(active, changed, set(file_hashes) - set(changed), batch_size)
+        return dict(stats, version=version or stats["version"], changed=len(changed))
+
+    def _build(
+            self,
+            active: VectorDB,
+            changed: Dict[str, Dict[str, str]],
+            unchanged: set,
+            batch_size: int
+    ) -> Optional[int]:
+        version = max(self._versions() + [self.alias.version or 0]) + 1
+        name = self._version_name(version)
+        started = time.perf_counter()
+        logger.info(f"Building knowledge base version {version} ({len(changed)} changed files)")
+        candidate = self._open(name)
+        try:
+            if candidate._count():
+                # Остатки прерванной сборки
+                candidate.drop()
+                candidate = self._open(name)
+            candidate.copy_from(active, batch_size=batch_size)
+            stats = candidate.sync_documents(changed.items(), batch_size=batch_size, keep_files=unchanged)
+            self._validate(candidate, active, len(changed) + len(unchanged))
+        except Exception as e:
+            logger.error(f"Knowledge base version {version} rejected: {str(e)}")
+            candidate.drop()
+            KB_CHUNKS.set(active._count())
+            return None
+
+        self.alias.point_to(version, candidate.kb_version)
+        self._active = candidate
+        logger.info(
+            f"Knowledge base switched to version {version} in {time.perf_counter() - started:.1f}s: {stats}"
+        )
+        self._collect_garbage(version)
+        KB_CHUNKS.set(candidate._count())
+        return version
+
+    def _validate(self, candidate: VectorDB, active: VectorDB, expected_files: int) -> None:
+        count = candidate._count()
+        expected_chunks = sum(len(entry['chunks']) for entry in candidate.manifest.files.values())
+        expected_chunks += len(candidate.manifest.extra)
+        if len(candidate.manifest.files) != expected_files:
+            raise KnowledgeBaseValidationError(
+                f"{len(candidate.manifest.files)} files indexed, {expected_files} expected"
+            )
+        if count == 0 or count != expected_chunks or len(candidate.lexical_index) != count:
+            raise KnowledgeBaseValidationError(
+                f"{count} chunks in collection, {len(candidate.lexical_index)} in BM25, {expected_chunks} expected"
+            )
+        # Резкое уменьшение базы чаще означает сбой выгрузки data/, чем реальное удаление
+        if count < active._count() * self.min_chunk_ratio:
+            raise KnowledgeBaseValidationError(f"chunk count dropped from {active._count()} to {count}")
+        for query in self.smoke_queries:
+            if not candidate.query(query, top_k=1):
+                raise KnowledgeBaseValidationError(f"no results for smoke query '{query}'")
+
+    def _versions(self) -> List[int]:
+        try:
+            file_names = os.listdir(self.persist_dir)
+        except OSError:
+            return []
+        return sorted(
+            int(match.group(1)) for match in map(self._version_re.match, file_names) if match
+        )
+
+    def _collect_garbage(self, active_version: int) -> None:
+        """Удаление версий старше keep_versions последних; предыдущая остаётся для процессов, не успевших переключиться"""
+        versions = self._versions()
+        # Версия 0 - прежняя неверсионированная коллекция
+        if os.path.exists(os.path.join(self.persist_dir, f"{self.collection_name}_manifest.json")):
+            versions.insert(0, 0)
+        stale = [version for version in versions if version < active_version]
+        for version in stale[:max(len(stale) - (self.keep_versions - 1), 0)]:
+            try:
+                self._open(self._version_name(version)).drop()
+                logger.info(f"Dropped knowledge base version {version}")
+            except Exception as e:
+                logger.error(f"Failed to drop knowledge base version {version}: {str(e)}")
+
+    @contextmanager
+    def _build_lock(self):
+        """Межпроцессная блокировка: версию собирает один процесс, остальные ждут и переиспользуют её"""
+        os.makedirs(self.persist_dir, exist_ok=True)
+        with open(os.path.join(self.persist_dir, f"{self.collection_name}.build.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class IndexOwnership:
+    """
+    Владелец индекса: процесс, который собирает базу знаний при старте и следит за DATA_PATH.
+    Владение - неблокирующая flock на файл в каталоге индекса, она держится до конца процесса
+    и освобождается системой при его завершении; тогда владение может перейти другому процессу
+    """
+
+    def __init__(self, persist_dir: str = "db", collection_name: str = "documents"):
+        self.path = os.path.join(persist_dir, f"{collection_name}.owner.lock")
+        self._file = None
+
+    @property
+    def owned(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Попытка стать владельцем; True, если владение у этого процесса"""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock_file = open(self.path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+
+class DirectoryWatcher:
+    """Опрос каталога с документами: изменение считается завершённым, когда снимок не меняется settle секунд"""
+
+    def __init__(self, path: str, interval: float = 10.0, settle: float = 2.0):
+        self.path = path
+        self.interval = interval
+        self.settle = settle
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        result = {}
+        for root, _, file_names in os.walk(self.path):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result[os.path.relpath(path, self.path)] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    async def run(self, on_change: Callable[[], Awaitable[None]]):
+        loop = asyncio.get_running_loop()
+        known = await loop.run_in_executor(None, self.snapshot)
+        logger.info(f"Watching {self.path} for knowledge base changes")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                current = await loop.run_in_executor(None, self.snapshot)
+                if current == known:
+                    continue
+                # Файлы могут ещё копироваться: ждём, пока снимок перестанет меняться
+                while True:
+                    await asyncio.sleep(self.settle)
+                    settled = await loop.run_in_executor(None, self.snapshot)
+                    if settled == current:
+                        break
+                    current = settled
+                known = current
+                logger.info(f"Changes detected in {self.path}, rebuilding knowledge base")
+                await on_change()
+            except Exception as e:
+                logger.error(f"Knowledge base watcher error: {str(e)}")
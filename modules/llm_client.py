@@ -0,0 +1,407 @@
+import json
+import socket
+import threading
+import time
+import http.client
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+import numpy as np
+from .tokens import estimate_tokens
+from .metrics import LLM_CALLS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Признаки запросов, которым нужна полная модель: сравнения, маршруты, планирование
+_COMPLEX_MARKERS = ("сравни", " или ", " vs ", "маршрут", "план", "бюджет", "несколько", "почему", "compare", "itinerary")
+
+
+class LLMUnavailable(Exception):
+    """Ни одна из моделей не ответила в срок"""
+
+
+@dataclass
+class CompletionResult:
+    text: str
+
+
+class CancelToken:
+    """Отмена вызова из другого потока: проигравший хедж закрывает своё соединение"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        self._invoke(callback)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._invoke(callback)
+
+    @staticmethod
+    def _invoke(callback: Callable[[], None]) -> None:
+        try:
+            callback()
+        except OSError:
+            pass
+
+
+class HttpCompletionModel:
+    """
+    Клиент REST API YandexGPT (foundationModels/v1/completion) без SDK.
+    Используется с локальным стабом LLM и там, где gRPC недоступен.
+    Вызов прерывается через CancelToken: сокет закрывается, ожидающий ответа поток освобождается.
+    """
+
+    def __init__(self, endpoint: str, model_uri: str, api_key: Optional[str] = None, temperature: float = 0.7):
+        self.url = urllib.parse.urlsplit(endpoint.rstrip("/") + "/foundationModels/v1/completion")
+        self.model_uri = model_uri
+        self.api_key = api_key
+        self.temperature = temperature
+
+    def configure(self, temperature: float) -> "HttpCompletionModel":
+        """Копия клиента с другой температурой, как configure у моделей SDK"""
+        model = HttpCompletionModel.__new__(HttpCompletionModel)
+        model.__dict__.update(self.__dict__, temperature=temperature)
+        return model
+
+    def _request(self, prompt: str, stream: bool, timeout: float, cancel: Optional[CancelToken]):
+        body = {
+            "modelUri": self.model_uri,
+            "completionOptions": {"stream": stream, "temperature": self.temperature},
+            "messages": [{"role": "user", "text": prompt}]
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Api-Key {self.api_key}"
+        connection_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(self.url.netloc, timeout=timeout)
+        connection.connect()
+        if cancel is not None:
+            # shutdown будит поток, заблокированный в recv, в отличие от close
+            cancel.on_cancel(lambda: connection.sock and connection.sock.shutdown(socket.SHUT_RDWR))
+        try:
+            connection.request("POST", self.url.path, body=json.dumps(body).encode("utf-8"), headers=headers)
+            response = connection.getresponse()
+            if response.status >= 400:
+                raise RuntimeError(f"LLM API returned HTTP {response.status}: {response.read()[:200]!r}")
+        except Exception:
+            connection.close()
+            raise
+        return connection, response
+
+    @staticmethod
+    def _text(payload: dict) -> str:
+        return payload["result"]["alternatives"][0]["message"]["text"]
+
+    def run(self, prompt: str, timeout: float = 60, cancel: Optional[CancelToken] = None) -> CompletionResult:
+        connection, response = self._request(prompt, False, timeout, cancel)
+        try:
+            return CompletionResult(self._text(json.loads(response.read())))
+        finally:
+            connection.close()
+
+    def run_stream(self, prompt: str, timeout: float = 60) -> Iterator[CompletionResult]:
+        # В потоке API присылает по JSON-объекту на строку с накопленным текстом
+        connection, response = self._request(prompt, True, timeout, None)
+        try:
+            for line in response:
+                if line.strip():
+                    yield CompletionResult(self._text(json.loads(line)))
+        finally:
+            connection.close()
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после серии ошибок модель пропускается на reset_timeout секунд.
+    Затем состояние half-open: проходит ровно один пробный запрос, остальные ждут его исхода;
+    успех замыкает размыкатель, ошибка - снова размыкает. Проба без исхода (запрос так и не был
+    отправлен) через reset_timeout уступает место следующей
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Модель сейчас пропускается: размыкатель открыт или пробный запрос уже в полёте"""
+        with self._lock:
+            return not self._can_pass(time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Можно ли вызвать модель; в half-open разрешение получает только пробный запрос"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._can_pass(now):
+                return False
+            if self._opened_at is not None:
+                self._probe_started = now
+            return True
+
+    def _can_pass(self, now: float) -> bool:
+        if self._opened_at is None:
+            return True
+        if now - self._opened_at < self.reset_timeout:
+            return False
+        return self._probe_started is None or now - self._probe_started >= self.reset_timeout
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек для порога хеджирования и признака медленной модели.
+    Старые замеры устаревают, чтобы отложенная из-за медленности модель снова получила запросы.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, max_age: float = 120.0):
+        self.min_samples = min_samples
+        self.max_age = max_age
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            horizon = time.monotonic() - self.max_age
+            while self._samples and self._samples[0][0] < horizon:
+                self._samples.popleft()
+            if len(self._samples) < self.min_samples:
+                return None
+            return float(np.percentile([seconds for _, seconds in self._samples], q))
+
+
+class ModelTier:
+    """Модель со своим размыкателем и статистикой задержек"""
+
+    def __init__(self, name: str, model: Any, breaker: CircuitBreaker):
+        self.name = name
+        self.model = model
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+
+
+class ResilientLLM:
+    """
+    Вызов LLM с защитой от медленного и недоступного апстрима:
+    - у каждого вызова есть общий дедлайн, у попытки не последней модели - свой, меньший
+    - если ответ не пришёл к p95 задержки, отправляется дубликат и берётся первый ответ;
+      проигравший вызов отменяется, одновременно в полёте не больше max_hedges дубликатов
+    - дубликат - такой же вызов апстрима, поэтому берёт токен квоты через hedge_permit;
+      нет токена - дубликат не отправляется
+    - модели перебираются по уровням: основная, затем быстрая (yandexgpt-lite);
+      основная пропускается при разомкнутом размыкателе, при p95 выше slow_threshold
+      и для простых запросов
+    """
+
+    def __init__(
+            self,
+            models: List[Tuple[str, Any]],
+            timeout: float = 30.0,
+            attempt_timeout: Optional[float] = None,
+            hedge: bool = True,
+            hedge_quantile: float = 95,
+            slow_threshold: Optional[float] = None,
+            simple_query_tokens: int = 0,
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.0,
+            max_workers: int = 16,
+            max_hedges: int = 4,
+            hedge_permit: Optional[Callable[[], bool]] = None
+    ):
+        self.tiers = [
+            ModelTier(name, model, CircuitBreaker(failure_threshold, reset_timeout))
+            for name, model in models
+        ]
+        self.timeout = timeout
+        # Основной модели даётся часть общего дедлайна, чтобы на быструю модель осталось время
+        self.attempt_timeout = attempt_timeout or timeout / 2
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.slow_threshold = slow_threshold
+        self.simple_query_tokens = simple_query_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm_call")
+        # Дубликаты не должны занять все потоки пула и удвоить нагрузку на апстрим
+        self._hedges = threading.BoundedSemaphore(max_hedges)
+        self.hedge_permit = hedge_permit
+
+    def is_simple(self, query: str) -> bool:
+        """Короткий запрос без сравнений и планирования - ему хватит быстрой модели"""
+        if not self.simple_query_tokens or estimate_tokens(query) > self.simple_query_tokens:
+            return False
+        lowered = f" {query.lower()} "
+        return not any(marker in lowered for marker in _COMPLEX_MARKERS)
+
+    def _route(self, simple: bool) -> List[ModelTier]:
+        """Порядок попыток: недоступные и медленные модели уходят в конец"""
+        preferred, deferred = [], []
+        for i, tier in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            p95 = tier.latency.percentile(self.hedge_quantile)
+            # Размыкатель проверяется последним: в half-open он выдаёт разрешение на пробу
+            skip = (
+                (simple and not last)
+                or (self.slow_threshold is not None and p95 is not None and p95 > self.slow_threshold and not last)
+                or not tier.breaker.allow_request()
+            )
+            (deferred if skip else preferred).append(tier)
+        return preferred + deferred
+
+    def _attempts(self, simple: bool, deadline: float) -> Iterator[Tuple[ModelTier, float]]:
+        """Модели в порядке попыток и бюджет времени на каждую"""
+        tiers = self._route(simple)
+        for i, tier in enumerate(tiers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            yield tier, remaining if i == len(tiers) - 1 else min(remaining, self.attempt_timeout)
+
+    @staticmethod
+    def _model(tier: ModelTier, temperature: Optional[float]):
+        """Модель уровня с температурой вызова: configure у SDK и HttpCompletionModel возвращает копию"""
+        if temperature is None or not hasattr(tier.model, "configure"):
+            return tier.model
+        return tier.model.configure(temperature=temperature)
+
+    def _call(self, tier: ModelTier, model: Any, prompt: str, timeout: float, cancel: CancelToken):
+        started = time.monotonic()
+        if isinstance(model, HttpCompletionModel):
+            result = model.run(prompt, timeout=timeout, cancel=cancel)
+        else:
+            # Вызов SDK не прерывается, проигравший дубликат дорабатывает до своего таймаута
+            result = model.run(prompt, timeout=timeout)
+        tier.latency.observe(time.monotonic() - started)
+        return result
+
+    def run(self, prompt: str, simple: bool = False, temperature: Optional[float] = None):
+        """Ответ первой успевшей модели; LLMUnavailable, если не справилась ни одна"""
+        deadline = time.monotonic() + self.timeout
+        for tier, budget in self._attempts(simple, deadline):
+            try:
+                result = self._run_hedged(tier, self._model(tier, temperature), prompt, budget)
+                tier.breaker.record_success()
+                LLM_CALLS.labels(tier.name, "success").inc()
+                return result
+            except Exception as e:
+                tier.breaker.record_failure()
+                LLM_CALLS.labels(tier.name, "error").inc()
+                logger.warning(f"LLM tier '{tier.name}' failed: {type(e).__name__}: {str(e)}")
+        raise LLMUnavailable(f"no model answered within {self.timeout}s")
+
+    def _permit_hedge(self) -> bool:
+        """Токен квоты на дубликат; без ограничителя дубликаты ограничены только max_hedges"""
+        if self.hedge_permit is None:
+            return True
+        try:
+            return self.hedge_permit()
+        except Exception as e:
+            logger.warning(f"Hedge rate limit check failed: {str(e)}")
+            return False
+
+    def _run_hedged(self, tier: ModelTier, model: Any, prompt: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        cancels = {}
+
+        def submit(budget: float):
+            cancel = CancelToken()
+            future = self._executor.submit(self._call, tier, model, prompt, budget, cancel)
+            cancels[future] = cancel
+            return future
+
+        futures = {submit(timeout)}
+        hedge_after = tier.latency.percentile(self.hedge_quantile) if self.hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if done:
+                pass
+            elif not self._hedges.acquire(blocking=False):
+                logger.debug(f"Hedge limit reached, '{tier.name}' request is not duplicated")
+            elif not self._permit_hedge():
+                self._hedges.release()
+                logger.debug(f"No rate limit token, '{tier.name}' request is not duplicated")
+            else:
+                logger.debug(f"Hedging '{tier.name}' request after {hedge_after:.2f}s")
+                LLM_CALLS.labels(tier.name, "hedged").inc()
+                hedge = submit(deadline - time.monotonic())
+                hedge.add_done_callback(lambda _: self._hedges.release())
+                futures.add(hedge)
+
+        try:
+            error = None
+            while futures:
+                done, futures = wait(futures, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"'{tier.name}' did not answer within {timeout:.1f}s")
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # Проигравший или опоздавший вызов закрывает соединение и освобождает поток
+            for future in futures:
+                future.cancel()
+                cancels[future].cancel()
+
+    def run_stream(self, prompt: str, simple: bool = False, temperature: Optional[float] = None) -> Iterator[Any]:
+        """
+        Потоковый ответ; на следующую модель переходим, только если текст ещё не начал поступать.
+        Для потока бюджет ограничивает ожидание каждой части, а не всю генерацию
+        """
+        deadline = time.monotonic() + self.timeout
+        for tier, remaining in self._attempts(simple, deadline):
+            model = self._model(tier, temperature)
+            run_stream = getattr(model, "run_stream", None)
+            started = time.monotonic()
+            yielded = False
+            try:
+                if run_stream is None:
+                    yield self._run_hedged(tier, model, prompt, remaining)
+                    yielded = True
+                else:
+                    for result in run_stream(prompt, timeout=remaining):
+                        yielded = True
+                        yield result
+                    tier.latency.observe(time.monotonic() - started)
+                tier.breaker.record_success()
+                LLM_CALLS.labels(tier.name, "success").inc()
+                return
+            except Exception as e:
+                tier.breaker.record_failure()
+                LLM_CALLS.labels(tier.name, "error").inc()
+                logger.warning(f"LLM tier '{tier.name}' stream failed: {type(e).__name__}: {str(e)}")
+                if yielded:
+                    raise
+        raise LLMUnavailable(f"no model answered within {self.timeout}s")
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IndexManifest:
+    """Манифест хэшей файлов и чанков, проиндексированных в коллекции"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        # Чанки, добавленные напрямую через add_documents, вне синхронизации файлов
+        self.extra: Dict[str, str] = {}
+        self._mtime = None
+        self._revision = None
+        self._load()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Хэш содержимого чанка"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def hash_chunks(chunk_hashes: Dict[str, str]) -> str:
+        """Хэш файла по хэшам его чанков"""
+        digest = hashlib.sha256()
+        for chunk_id in sorted(chunk_hashes):
+            digest.update(f"{chunk_id}:{chunk_hashes[chunk_id]}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            self._revision = None
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            self.files = data.get('files', {})
+            self.extra = data.get('extra', {})
+        except Exception as e:
+            logger.error(f"Failed to read index manifest {self.path}: {str(e)}")
+            self.files = {}
+            self.extra = {}
+        self._revision = None
+
+    def refresh(self):
+        """Перечитывание манифеста, если его обновил другой процесс"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def save(self):
+        """Атомарная запись манифеста на диск"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'files': self.files, 'extra': self.extra}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def file_hash(self, file_name: str) -> Optional[str]:
+        return self.files.get(file_name, {}).get('hash')
+
+    def chunk_hashes(self, file_name: str) -> Dict[str, str]:
+        return dict(self.files.get(file_name, {}).get('chunks', {}))
+
+    def update_file(self, file_name: str, chunk_hashes: Dict[str, str], entity: Optional[str] = None):
+        self.files[file_name] = {
+            'hash': self.hash_chunks(chunk_hashes),
+            'chunks': chunk_hashes
+        }
+        # Сущность документа (страна); пустая строка - документ разобран, но сущность не найдена
+        if entity is not None:
+            self.files[file_name]['entity'] = entity
+        self._revision = None
+
+    def file_entity(self, file_name: str) -> Optional[str]:
+        return self.files.get(file_name, {}).get('entity')
+
+    def remove_file(self, file_name: str):
+        self.files.pop(file_name, None)
+        self._revision = None
+
+    def update_extra(self, chunk_hashes: Dict[str, str]):
+        self.extra.update(chunk_hashes)
+        self._revision = None
+
+    def reset(self):
+        self.files = {}
+        self.extra = {}
+        self._revision = None
+
+    @property
+    def revision(self) -> str:
+        """Ревизия базы знаний: хэш по всем проиндексированным файлам"""
+        if self._revision is not None:
+            return self._revision
+        digest = hashlib.sha256()
+        for file_name in sorted(self.files):
+            digest.update(f"{file_name}:{self.files[file_name]['hash']}\n".encode('utf-8'))
+        if self.extra:
+            digest.update(f"extra:{self.hash_chunks(self.extra)}\n".encode('utf-8'))
+        self._revision = digest.hexdigest()[:16]
+        return self._revision
@@ -1,21 +1,32 @@
-from confluent_kafka import Producer, Consumer
-from confluent_kafka.admin import AdminClient, NewTopic
-import json
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from confluent_kafka import Producer, Consumer, TopicPartition
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from confluent_kafka.admin import AdminClient, NewPartitions, NewTopic
+from .serialization import Serializer
 import logging
 
 logger = logging.getLogger(__name__)
 
 class KafkaMessaging:
-    def __init__(self, bootstrap_servers: str = 'localhost:9093'):
+    def __init__(self, bootstrap_servers: str = 'localhost:9093', serializer: Optional[Serializer] = None):
         self.bootstrap_servers = bootstrap_servers
+        self.serializer = serializer or Serializer()
         logger.info(f"Initialized KafkaMessaging with bootstrap servers: {self.bootstrap_servers}")
 
-    def create_producer(self):
-        """Создание Kafka producer"""
+    def create_producer(self, linger_ms: int = 5, batch_size: int = 131072, compression_type: str = 'lz4'):
+        """
+        Создание Kafka producer. Сообщения копятся до linger_ms и уходят пакетами до batch_size байт,
+        пакет сжимается целиком (compression_type) - это выгодно для мелких запросов
+        """
         logger.info(f"Creating Kafka producer with bootstrap servers: {self.bootstrap_servers}")
         return Producer({
             'bootstrap.servers': self.bootstrap_servers,
-            'message.max.bytes': 10485760  # 10MB
+            'message.max.bytes': 10485760,  # 10MB
+            'linger.ms': linger_ms,
+            'batch.size': batch_size,
+            'compression.type': compression_type
         })
 
     def create_topic_if_not_exists(self, topic_name: str, num_partitions: int = 1, replication_factor: int = 1):
@@ -37,18 +48,51 @@ class KafkaMessaging:
                         logger.error(f"Failed to create topic '{topic}': {str(e)}")
             else:
                 logger.info(f"Topic '{topic_name}' already exists.")
+                current = len(topic_metadata.topics[topic_name].partitions)
+                if current < num_partitions:
+                    # Число разделов ограничивает число воркеров в группе, поэтому старая тема расширяется
+                    logger.info(f"Increasing partitions of '{topic_name}' from {current} to {num_partitions}")
+                    for topic, f in admin_client.create_partitions([NewPartitions(topic_name, num_partitions)]).items():
+                        try:
+                            f.result()
+                        except Exception as e:
+                            logger.error(f"Failed to add partitions to '{topic}': {str(e)}")
         except Exception as e:
             logger.error(f"Error checking or creating topic: {str(e)}")
 
-    def create_consumer(self, group_id: str, topics: list):
-        """Создание Kafka consumer"""
+    def create_consumer(
+            self,
+            group_id: str,
+            topics: list,
+            assignment_strategy: str = 'cooperative-sticky',
+            on_assign: Optional[Callable[[List[TopicPartition]], None]] = None,
+            on_revoke: Optional[Callable[[List[TopicPartition]], None]] = None
+    ):
+        """
+        Создание Kafka consumer.
+        При cooperative-sticky ребалансировка забирает и выдаёт разделы инкрементально:
+        on_assign / on_revoke получают только изменившиеся разделы.
+        """
         logger.info(f"Creating Kafka consumer for group: {group_id}, subscribing to topics: {topics}")
         consumer = Consumer({
             'bootstrap.servers': self.bootstrap_servers,
             'group.id': group_id,
-            'auto.offset.reset': 'latest'
+            'auto.offset.reset': 'latest',
+            'enable.auto.commit': False,
+            'partition.assignment.strategy': assignment_strategy
         })
-        consumer.subscribe(topics)
+
+        def assigned(consumer, partitions):
+            logger.info(f"Partitions assigned: {[(tp.topic, tp.partition) for tp in partitions]}")
+            if on_assign is not None:
+                on_assign(partitions)
+
+        def revoked(consumer, partitions):
+            logger.info(f"Partitions revoked: {[(tp.topic, tp.partition) for tp in partitions]}")
+            if on_revoke is not None:
+                on_revoke(partitions)
+
+        consumer.subscribe(topics, on_assign=assigned, on_revoke=revoked, on_lost=revoked)
         return consumer
 
     @staticmethod
@@ -59,22 +103,35 @@ class KafkaMessaging:
         else:
             logger.debug(f"Message delivered to {msg.topic()} [{msg.partition()}]")
             logger.debug(f"Message key: {msg.key().decode('utf-8')}")
-            logger.debug(f"Message value: {msg.value().decode('utf-8')}")
+            logger.debug(f"Message value: {len(msg.value())} bytes")
 
-    def produce_message(self, producer, topic: str, key: str, value: dict):
-        """Отправка сообщения в Kafka"""
-        logger.info(f"Producing message to topic '{topic}' with key: {key}")
+    def produce_message(self, producer, topic: str, key: str, value: dict) -> bool:
+        """Отправка сообщения в Kafka; True - сообщение принято в очередь producer"""
+        logger.debug(f"Producing message to topic '{topic}' with key: {key}")
         try:
             producer.produce(
                 topic=topic,
                 key=key,
-                value=json.dumps(value),
+                value=self.serializer.dumps(value),
                 callback=self.delivery_report
             )
             producer.poll(0)
-            logger.info(f"Message sent successfully to topic '{topic}' with key: {key}")
+            logger.debug(f"Message sent successfully to topic '{topic}' with key: {key}")
+            return True
         except Exception as e:
             logger.error(f"Failed to produce message to topic '{topic}' with key: {key}, error: {str(e)}")
+            return False
+
+    def flush(self, producer, timeout: float = 10.0) -> bool:
+        """Ожидание подтверждения брокером всех отправленных сообщений"""
+        try:
+            remaining = producer.flush(timeout)
+        except Exception as e:
+            logger.error(f"Producer flush failed: {str(e)}")
+            return False
+        if remaining:
+            logger.error(f"{remaining} messages were not delivered to Kafka within {timeout}s")
+        return not remaining
 
     def consume_messages(self, consumer, timeout: float = 1.0):
         """Чтение сообщений из Kafka"""
@@ -84,20 +141,205 @@ class KafkaMessaging:
                 logger.debug("No messages received during this poll cycle.")
                 return None
 
-            logger.info(f"Polled message from topic '{msg.topic()}'. Message key: {msg.key()}")
+            logger.debug(f"Polled message from topic '{msg.topic()}'. Message key: {msg.key()}")
 
             if msg.error():
                 logger.error(f"Consumer error: {msg.error()}")
                 return None
 
-            consumer.commit(msg)
+            # Смещение коммитит вызывающий код после обработки (commit_offsets)
             message_data = {
                 'topic': msg.topic(),
+                'partition': msg.partition(),
+                'offset': msg.offset(),
                 'key': msg.key().decode('utf-8'),
-                'value': json.loads(msg.value().decode('utf-8'))
+                'value': self.serializer.loads(msg.value())
             }
-            logger.info(f"Consumed message: {message_data}")
+            logger.debug(f"Consumed message: {message_data}")
             return message_data
         except Exception as e:
             logger.error(f"Consume error: {str(e)}")
             return None
+
+    def consume(self, consumer, num_messages: int = 32, timeout: float = 0.2) -> List[dict]:
+        """Пакетное чтение: до num_messages сообщений или до истечения timeout секунд"""
+        try:
+            msgs = consumer.consume(num_messages=num_messages, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Consume error: {str(e)}")
+            return []
+
+        batch = []
+        for msg in msgs:
+            if msg.error():
+                logger.error(f"Consumer error: {msg.error()}")
+                continue
+            try:
+                value = self.serializer.loads(msg.value())
+            except Exception as e:
+                # Битое сообщение остаётся в пакете, чтобы его смещение тоже было закоммичено
+                logger.error(f"Failed to decode message at {msg.topic()}[{msg.partition()}]@{msg.offset()}: {str(e)}")
+                value = {}
+            batch.append({
+                'topic': msg.topic(),
+                'partition': msg.partition(),
+                'offset': msg.offset(),
+                'key': msg.key().decode('utf-8') if msg.key() else None,
+                'value': value
+            })
+
+        if batch:
+            logger.debug(f"Consumed batch of {len(batch)} messages")
+        return batch
+
+    def consumer_lag(self, consumer, timeout: float = 1.0) -> Dict[Tuple[str, int], int]:
+        """Отставание группы по назначенным разделам: конец раздела минус текущая позиция"""
+        lag = {}
+        try:
+            for partition in consumer.position(consumer.assignment()):
+                _, high = consumer.get_watermark_offsets(partition, timeout=timeout)
+                position = partition.offset if partition.offset >= 0 else high
+                lag[(partition.topic, partition.partition)] = max(high - position, 0)
+        except Exception as e:
+            logger.error(f"Failed to read consumer lag: {str(e)}")
+        return lag
+
+    @staticmethod
+    def batch_offsets(batch: List[dict]) -> List[TopicPartition]:
+        """Смещения для коммита: следующее после последнего сообщения в каждой партиции"""
+        offsets = {}
+        for message in batch:
+            tp = (message['topic'], message['partition'])
+            offsets[tp] = max(offsets.get(tp, -1), message['offset'])
+        return [TopicPartition(topic, partition, offset + 1) for (topic, partition), offset in offsets.items()]
+
+    @staticmethod
+    def first_offsets(batch: List[dict]) -> List[TopicPartition]:
+        """Смещения, с которых пакет нужно прочитать повторно"""
+        offsets = {}
+        for message in batch:
+            tp = (message['topic'], message['partition'])
+            offsets[tp] = min(offsets.get(tp, message['offset']), message['offset'])
+        return [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
+
+    def seek_offsets(self, consumer, offsets: List[TopicPartition]) -> None:
+        """Возврат позиции чтения для повторной доставки необработанных сообщений"""
+        for tp in offsets:
+            try:
+                consumer.seek(tp)
+            except Exception as e:
+                # Раздел мог уйти другому воркеру, тогда он продолжит с последнего коммита
+                logger.warning(f"Failed to seek {tp.topic}[{tp.partition}] to {tp.offset}: {str(e)}")
+
+    def close_consumer(self, consumer) -> None:
+        """Выход из группы: разделы сразу переходят другим воркерам"""
+        try:
+            consumer.close()
+        except Exception as e:
+            logger.error(f"Failed to close consumer: {str(e)}")
+
+    def commit_offsets(self, consumer, offsets: List[TopicPartition]) -> None:
+        """Асинхронный коммит смещений обработанного пакета"""
+        if not offsets:
+            return
+        try:
+            consumer.commit(offsets=offsets, asynchronous=True)
+        except Exception as e:
+            logger.error(f"Commit error: {str(e)}")
+
+
+class OrderedCommitter:
+    """
+    Коммиты смещений по порядку пакетов, после их обработки:
+    - пакет добавляется задачей, результат которой - смещения первых необработанных сообщений по разделам
+    - в разделах с необработанными сообщениями коммитится смещение первого из них, и чтение возвращается
+      к нему; более поздние пакеты этих разделов будут прочитаны заново, их смещения не коммитятся
+    - после max_redeliveries повторных чтений с одного смещения сообщения пропускаются
+    - с track_partitions коммитятся только разделы, назначенные consumer (assign/revoke из колбэков группы)
+    - вызовы consumer идут через executor: consumer не потокобезопасен
+    """
+
+    def __init__(
+            self,
+            messaging: KafkaMessaging,
+            consumer,
+            executor: Executor,
+            max_redeliveries: int = 3,
+            track_partitions: bool = False
+    ):
+        self.messaging = messaging
+        self.consumer = consumer
+        self.executor = executor
+        self.max_redeliveries = max_redeliveries
+        self.partitions: Optional[Set[Tuple[str, int]]] = set() if track_partitions else None
+        # Раздел -> (смещение, число повторных чтений)
+        self.redeliveries: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._pending: Deque[Tuple[asyncio.Task, List[TopicPartition]]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, task: asyncio.Task, offsets: List[TopicPartition]) -> None:
+        """Пакет в работе: задача обработки и смещения для коммита после неё"""
+        self._pending.append((task, offsets))
+
+    async def wait_oldest(self) -> None:
+        await asyncio.wait([self._pending[0][0]])
+
+    async def commit_ready(self) -> None:
+        """Коммит завершённых пакетов, строго по порядку"""
+        while self._pending and self._pending[0][0].done():
+            await self._commit()
+
+    async def drain(self) -> None:
+        """Ожидание и коммит всех пакетов в работе"""
+        while self._pending:
+            await self.wait_oldest()
+            await self._commit()
+
+    def assign(self, partitions: List[TopicPartition]) -> None:
+        if self.partitions is not None:
+            self.partitions |= {(tp.topic, tp.partition) for tp in partitions}
+
+    def revoke(self, partitions: List[TopicPartition]) -> None:
+        for tp in partitions:
+            if self.partitions is not None:
+                self.partitions.discard((tp.topic, tp.partition))
+            self.redeliveries.pop((tp.topic, tp.partition), None)
+
+    async def _commit(self) -> None:
+        loop = asyncio.get_running_loop()
+        task, offsets = self._pending.popleft()
+        retry = {(tp.topic, tp.partition): tp for tp in self._redeliverable(task.result())}
+        commits = [
+            retry.get((tp.topic, tp.partition), tp) for tp in offsets
+            if self.partitions is None or (tp.topic, tp.partition) in self.partitions
+        ]
+        for tp in offsets:
+            if (tp.topic, tp.partition) not in retry:
+                self.redeliveries.pop((tp.topic, tp.partition), None)
+        if retry:
+            for i, (later_task, later_offsets) in enumerate(self._pending):
+                self._pending[i] = (
+                    later_task, [tp for tp in later_offsets if (tp.topic, tp.partition) not in retry]
+                )
+            await loop.run_in_executor(
+                self.executor, self.messaging.seek_offsets, self.consumer, list(retry.values())
+            )
+        await loop.run_in_executor(self.executor, self.messaging.commit_offsets, self.consumer, commits)
+
+    def _redeliverable(self, failed: List[TopicPartition]) -> List[TopicPartition]:
+        """Необработанные смещения, которые ещё можно перечитать; после лимита попыток сообщения теряются"""
+        retry = []
+        for tp in failed:
+            key = (tp.topic, tp.partition)
+            offset, attempts = self.redeliveries.get(key, (tp.offset, 0))
+            attempts = attempts + 1 if offset == tp.offset else 1
+            if attempts > self.max_redeliveries:
+                logger.error(f"Giving up on {tp.topic}[{tp.partition}]@{tp.offset} after {attempts - 1} redeliveries")
+                self.redeliveries.pop(key, None)
+                continue
+            logger.warning(f"Redelivering {tp.topic}[{tp.partition}] from offset {tp.offset} (attempt {attempts})")
+            self.redeliveries[key] = (tp.offset, attempts)
+            retry.append(tp)
+        return retry
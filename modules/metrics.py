@@ -0,0 +1,143 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Этапы обработки запроса: bot (cache_lookup, kafka_produce), worker (kafka_poll, batch), delivery (deliver),
+# agent (embed, semantic_cache, retrieve, llm, llm_first_token), vector_db (vector_search, bm25),
+# embedding executor (embed_batch), redis
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of request processing stages",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "Cache lookups by cache layer and result",
+    ["cache", "result"]
+)
+IN_FLIGHT = Gauge(
+    "rag_in_flight",
+    "Work currently in progress",
+    ["kind"]
+)
+KAFKA_LAG = Gauge(
+    "rag_kafka_consumer_lag",
+    "Messages between the committed position and the end of the partition",
+    ["topic", "partition"]
+)
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens",
+    "Estimated prompt size in tokens",
+    buckets=(128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+)
+KB_CHUNKS = Gauge(
+    "rag_kb_chunks",
+    "Number of chunks in the vector index"
+)
+REQUESTS_SHED = Counter(
+    "rag_requests_shed_total",
+    "Requests rejected by admission control"
+)
+RETRIEVAL_FILTER = Counter(
+    "rag_retrieval_entity_filter_total",
+    "Retrieval queries by entity pre-filter outcome",
+    ["result"]
+)
+LLM_CALLS = Counter(
+    "rag_llm_calls_total",
+    "Upstream LLM attempts by model and outcome",
+    ["model", "outcome"]
+)
+
+_server: Optional[web.AppRunner] = None
+_started_at = time.time()
+# Проверки готовности компонентов процесса: имя -> функция, возвращающая состояние
+_health_checks: Dict[str, Callable[[], str]] = {}
+
+
+@contextmanager
+def timed(stage: str):
+    """Замер длительности этапа в rag_stage_seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+def count_cache(cache: str, hits: int, misses: int) -> None:
+    if hits:
+        CACHE_REQUESTS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, "miss").inc(misses)
+
+
+def track_in_flight(kind: str, func: Callable[[], float]) -> None:
+    """Гейдж, значение которого читается в момент сбора метрик"""
+    IN_FLIGHT.labels(kind).set_function(func)
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def register_health_check(name: str, func: Callable[[], str]) -> None:
+    """Компонент считается готовым, когда func возвращает ready"""
+    _health_checks[name] = func
+
+
+def _health_states() -> Dict[str, str]:
+    states = {}
+    for name, func in _health_checks.items():
+        try:
+            states[name] = func()
+        except Exception as e:
+            states[name] = f"error: {str(e)}"
+    return states
+
+
+async def _health(request: web.Request) -> web.Response:
+    """Liveness: процесс отвечает, даже пока компоненты прогреваются"""
+    return web.json_response({
+        "status": "ok",
+        "uptime": round(time.time() - _started_at, 1),
+        "components": _health_states()
+    })
+
+
+async def _ready(request: web.Request) -> web.Response:
+    """Readiness: 200 только когда все зарегистрированные компоненты готовы"""
+    states = _health_states()
+    ready = all(state == "ready" for state in states.values())
+    return web.json_response(
+        {"status": "ready" if ready else "starting", "components": states},
+        status=200 if ready else 503
+    )
+
+
+async def start_metrics_server(host: str = "0.0.0.0", port: int = 9100) -> Optional[web.AppRunner]:
+    """HTTP-эндпоинты /metrics, /health и /ready; один на процесс, повторный вызов ничего не делает"""
+    global _server
+    if _server is not None or not port:
+        return _server
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    app.router.add_get("/health", _health)
+    app.router.add_get("/ready", _ready)
+    runner = _server = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Failed to start metrics server on {host}:{port}: {str(e)}")
+        await runner.cleanup()
+        _server = None
+        return None
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
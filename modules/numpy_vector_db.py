@@ -0,0 +1,259 @@
+import os
+import glob
+import json
+import uuid
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+import logging
+from .embedding_executor import BULK
+from .vector_db import VectorDB
+
+logger = logging.getLogger(__name__)
+
+
+class NumpyVectorDB(VectorDB):
+    """
+    Встроенное хранилище векторов без Chroma:
+    - нормализованные float32-эмбеддинги лежат в memory-mapped файле и разделяются
+      между процессами через page cache
+    - id, тексты и метаданные хранятся в компактном JSON рядом с ним
+    - точный top-k считается одним матричным произведением и argpartition
+    """
+
+    def _open_store(self) -> None:
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self._meta_path = os.path.join(self.persist_dir, f"{self.collection_name}.meta.json")
+        self._meta_mtime = None
+        self._matrix: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        # Строки матрицы по странам, строятся по метаданным при первом фильтрованном поиске
+        self._entity_rows: Optional[Dict[str, np.ndarray]] = None
+        self._dirty = False
+        self._load()
+
+    def _load(self, attempts: int = 3) -> None:
+        """Загрузка индекса с диска; матрица открывается только на чтение через mmap"""
+        if not os.path.exists(self._meta_path):
+            return
+        for attempt in range(attempts):
+            mtime = os.path.getmtime(self._meta_path)
+            with open(self._meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            try:
+                matrix = np.memmap(
+                    os.path.join(self.persist_dir, meta['vectors']),
+                    dtype=np.float32,
+                    mode='r',
+                    shape=(len(meta['ids']), meta['dim'])
+                ) if meta['ids'] else np.zeros((0, meta['dim']), dtype=np.float32)
+                break
+            except FileNotFoundError:
+                # Между чтением метаданных и открытием файла векторов другой процесс записал
+                # два новых поколения - метаданные перечитываются
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"Vectors file {meta['vectors']} is gone, rereading {self._meta_path}")
+
+        self._meta_mtime = mtime
+        self._matrix = matrix
+        self._ids = meta['ids']
+        self._documents = meta['documents']
+        self._metadatas = meta['metadatas']
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._entity_rows = None
+        self._dirty = False
+
+    def _refresh(self) -> None:
+        """Перезагрузка индекса, если его переписал другой процесс"""
+        if self._dirty:
+            return
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            self._load()
+
+    def _count(self) -> int:
+        return len(self._ids)
+
+    def _get_documents(self, ids: List[str]) -> Dict[str, str]:
+        return {
+            doc_id: self._documents[self._positions[doc_id]]
+            for doc_id in ids if doc_id in self._positions
+        }
+
+    def _all_documents(self) -> Dict[str, str]:
+        return dict(zip(self._ids, self._documents))
+
+    def _get_embeddings(self, ids: List[str]) -> np.ndarray:
+        return np.asarray(self._matrix[[self._positions[doc_id] for doc_id in ids]], dtype=np.float32)
+
+    def _get_metadatas(self, ids: List[str]) -> Dict[str, Dict]:
+        return {
+            doc_id: self._metadatas[self._positions[doc_id]]
+            for doc_id in ids if doc_id in self._positions
+        }
+
+    def _set_metadatas(self, metadatas: Dict[str, Dict]) -> None:
+        for doc_id, metadata in metadatas.items():
+            position = self._positions.get(doc_id)
+            if position is not None:
+                self._metadatas[position] = metadata
+        self._entity_rows = None
+        if not self._dirty:
+            self._matrix = np.array(self._matrix, dtype=np.float32)
+            self._dirty = True
+
+    def _upsert(
+            self,
+            documents: Dict[str, str],
+            embeddings: Optional[np.ndarray] = None,
+            metadatas: Optional[Dict[str, Dict]] = None
+    ) -> None:
+        if embeddings is None:
+            embeddings = self.embedding_func.embed(list(documents.values()), priority=BULK)
+        embeddings = np.array(embeddings, dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+        if not self._dirty:
+            # Копия в памяти на время записи, mmap остаётся только для чтения
+            self._matrix = np.array(self._matrix, dtype=np.float32)
+            self._dirty = True
+        if self._matrix.shape[0] == 0:
+            self._matrix = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+
+        metadatas = metadatas or {}
+        new_rows = []
+        for (doc_id, content), embedding in zip(documents.items(), embeddings):
+            metadata = metadatas.get(doc_id) or {"source": doc_id}
+            position = self._positions.get(doc_id)
+            if position is None:
+                self._positions[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._documents.append(content)
+                self._metadatas.append(metadata)
+                new_rows.append(embedding)
+            else:
+                self._matrix[position] = embedding
+                self._documents[position] = content
+                self._metadatas[position] = metadata
+        self._entity_rows = None
+        if new_rows:
+            self._matrix = np.vstack([self._matrix, np.stack(new_rows)])
+
+    def _delete(self, ids: List[str]) -> None:
+        drop = {self._positions[doc_id] for doc_id in ids if doc_id in self._positions}
+        if not drop:
+            return
+        keep = [i for i in range(len(self._ids)) if i not in drop]
+        self._matrix = np.array(self._matrix[keep], dtype=np.float32)
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._entity_rows = None
+        self._dirty = True
+
+    def _flush(self) -> None:
+        """Атомарная запись: новый файл векторов, затем метаданные, ссылающиеся на него"""
+        if not self._dirty:
+            return
+        old_vectors = self._current_vectors_file()
+        vectors_file = f"{self.collection_name}.vectors.{uuid.uuid4().hex[:8]}.f32"
+        dim = int(self._matrix.shape[1]) if self._matrix.ndim == 2 else 0
+        if self._ids:
+            np.ascontiguousarray(self._matrix, dtype=np.float32).tofile(
+                os.path.join(self.persist_dir, vectors_file)
+            )
+
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'vectors': vectors_file,
+                'dim': dim,
+                'ids': self._ids,
+                'documents': self._documents,
+                'metadatas': self._metadatas
+            }, file, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path)
+
+        # Отображённые файлы читаются и после удаления, но процесс, только что прочитавший прежние
+        # метаданные, должен ещё успеть открыть их файл: предыдущее поколение живёт до следующей записи
+        self._remove_vectors(keep={vectors_file, old_vectors})
+        self._load()
+
+    def _current_vectors_file(self) -> Optional[str]:
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, 'r', encoding='utf-8') as file:
+            return json.load(file).get('vectors')
+
+    def _rows_for(self, entities: Tuple[str, ...]) -> np.ndarray:
+        """Номера строк матрицы с чанками заданных стран"""
+        if self._entity_rows is None:
+            rows: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(self._metadatas):
+                if metadata.get("country"):
+                    rows.setdefault(metadata["country"], []).append(i)
+            self._entity_rows = {entity: np.asarray(positions) for entity, positions in rows.items()}
+        parts = [self._entity_rows[entity] for entity in entities if entity in self._entity_rows]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def _search(
+            self,
+            query_embeddings: np.ndarray,
+            top_k: int,
+            entities: Tuple[str, ...] = ()
+    ) -> List[List[Tuple[str, str, float]]]:
+        self._refresh()
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        rows = self._rows_for(entities) if entities else None
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        if matrix.shape[0] == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        top_k = min(top_k, matrix.shape[0])
+        # (b x d) @ (d x n): косинусная близость всех запросов пакета ко всем (отобранным) чанкам
+        similarities = query_embeddings @ matrix.T
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+
+        results = []
+        for row, row_candidates in zip(similarities, candidates):
+            order = row_candidates[np.argsort(-row[row_candidates])]
+            positions = order if rows is None else rows[order]
+            # Квадрат L2 для нормализованных векторов - как расстояние Chroma по умолчанию
+            results.append([
+                (self._ids[position], self._documents[position], float(2.0 - 2.0 * row[i]))
+                for i, position in zip(order, positions)
+            ])
+        return results
+
+    def _remove_vectors(self, keep: set) -> None:
+        """Удаление файлов векторов коллекции, кроме перечисленных"""
+        for path in glob.glob(os.path.join(self.persist_dir, f"{glob.escape(self.collection_name)}.vectors.*.f32")):
+            if os.path.basename(path) not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _drop_store(self) -> None:
+        try:
+            os.remove(self._meta_path)
+        except OSError:
+            pass
+        self._remove_vectors(keep=set())
+
+    def _reset(self) -> None:
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._positions = {}
+        self._entity_rows = None
+        self._dirty = True
+        self._flush()
@@ -0,0 +1,57 @@
+import re
+from typing import List, Set
+from .tokens import estimate_tokens, truncate_to_tokens
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class PromptPacker:
+    """
+    Упаковка контекста в промпт:
+    - чанки берутся в порядке релевантности, пока не исчерпан бюджет токенов
+    - почти дублирующиеся чанки отбрасываются
+    - не поместившийся чанк обрезается по границе предложения
+    """
+
+    def __init__(self, budget_tokens: int = 1200, dedupe_threshold: float = 0.8, min_tail_tokens: int = 40):
+        self.budget_tokens = budget_tokens
+        self.dedupe_threshold = dedupe_threshold
+        self.min_tail_tokens = min_tail_tokens
+
+    def pack(self, chunks: List[str]) -> List[str]:
+        packed = []
+        shingles: List[Set[tuple]] = []
+        remaining = self.budget_tokens
+
+        for chunk in chunks:
+            chunk_shingles = self._shingles(chunk)
+            if any(self._similarity(chunk_shingles, seen) >= self.dedupe_threshold for seen in shingles):
+                continue
+
+            tokens = estimate_tokens(chunk)
+            if tokens <= remaining:
+                packed.append(chunk)
+                shingles.append(chunk_shingles)
+                remaining -= tokens
+                continue
+
+            if remaining >= self.min_tail_tokens:
+                tail = truncate_to_tokens(chunk, remaining)
+                if tail:
+                    packed.append(tail)
+            break
+
+        return packed
+
+    @staticmethod
+    def _shingles(text: str, size: int = 3) -> Set[tuple]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < size:
+            return {tuple(words)}
+        return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    @staticmethod
+    def _similarity(first: Set[tuple], second: Set[tuple]) -> float:
+        if not first or not second:
+            return 0.0
+        return len(first & second) / min(len(first), len(second))
@@ -0,0 +1,258 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict
+import numpy as np
+import redis
+from .entities import AliasIndex
+from .serialization import Serializer
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Запись в индекс с отметкой времени сервера Redis: у всех процессов одни часы,
+# и курсор подгрузки не теряет записи из-за расхождения локальных часов
+_INDEX_SCRIPT = """
+local now = redis.call('time')
+local score = tonumber(now[1]) + tonumber(now[2]) / 1000000
+redis.call('zadd', KEYS[1], score, ARGV[1])
+redis.call('zremrangebyscore', KEYS[1], '-inf', score - tonumber(ARGV[2]))
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class SemanticCache:
+    """
+    Семантический кэш ответов:
+    - ответ отдаётся, если косинусная близость эмбеддингов запросов выше порога
+    - локальный поиск по матрице NumPy с вытеснением по TTL и LRU
+    - записи дублируются в Redis и подтягиваются другими воркерами
+    - ответ отдаётся только на запрос о тех же странах: «Италия» и «Франция» для
+      эмбеддинга почти неразличимы
+    """
+
+    def __init__(
+            self,
+            host: str = 'localhost',
+            port: int = 6379,
+            db: int = 0,
+            threshold: float = 0.92,
+            near_miss_margin: float = 0.05,
+            max_entries: int = 10000,
+            ttl: int = 86400,
+            refresh_interval: float = 5.0,
+            namespace: str = "semantic_cache",
+            serializer: Optional[Serializer] = None,
+            entity_index: Optional[AliasIndex] = None
+    ):
+        self.redis = redis.Redis(host=host, port=port, db=db)
+        self.serializer = serializer or Serializer()
+        self.entity_index = entity_index
+        self.threshold = threshold
+        self.near_miss_margin = near_miss_margin
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._matrix: Optional[np.ndarray] = None
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._active = np.zeros(max_entries, dtype=bool)
+        self._row_ids: List[Optional[str]] = [None] * max_entries
+        self._row_entities = np.full(max_entries, "", dtype=object)
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._last_refresh = 0.0
+        # Наибольшая отметка индекса в Redis среди уже подгруженных записей
+        self._cursor: Optional[float] = None
+        self._add_to_index = self.redis.register_script(_INDEX_SCRIPT)
+
+        self.stats = {"hits": 0, "misses": 0, "near_misses": 0}
+
+    def _index_key(self, version: str) -> str:
+        return f"{self.namespace}:{version}:index"
+
+    def _entry_key(self, version: str, entry_id: str) -> str:
+        return f"{self.namespace}:{version}:entry:{entry_id}"
+
+    def entities_key(self, query: Optional[str]) -> str:
+        """Страны запроса в виде ключа: записи сравниваются только с запросами о тех же странах"""
+        if self.entity_index is None or not query:
+            return ""
+        return self.entity_index.key(query)
+
+    def lookup(self, embedding: np.ndarray, version: str, query: Optional[str] = None) -> Optional[str]:
+        """Поиск ответа на семантически близкий запрос о тех же странах"""
+        self._refresh(version)
+        entities = self.entities_key(query)
+
+        with self._lock:
+            best_entry, similarity = self._best_match(embedding, entities)
+            if best_entry is not None and similarity >= self.threshold:
+                self._entries.move_to_end(best_entry)
+                self.stats["hits"] += 1
+                return self._entries[best_entry]["answer"]
+
+            self.stats["misses"] += 1
+            if best_entry is not None and similarity >= self.threshold - self.near_miss_margin:
+                self.stats["near_misses"] += 1
+                logger.debug(f"Semantic cache near miss with similarity {similarity:.3f}")
+            return None
+
+    def put(
+            self,
+            embedding: np.ndarray,
+            answer: str,
+            chunk_ids: List[str],
+            version: str,
+            query: Optional[str] = None
+    ) -> None:
+        """Сохранение ответа локально и в Redis"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        entities = self.entities_key(query)
+        entry_id = hashlib.sha256(embedding.tobytes() + entities.encode('utf-8')).hexdigest()[:32]
+        expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._switch_version(version)
+            self._insert(entry_id, embedding, answer, chunk_ids, expires_at, entities)
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(self._entry_key(version, entry_id), mapping={
+                "embedding": embedding.tobytes(),
+                "answer": self._encode_answer(answer),
+                "chunk_ids": json.dumps(chunk_ids),
+                "expires_at": expires_at,
+                "entities": entities
+            })
+            pipe.expire(self._entry_key(version, entry_id), self.ttl)
+            self._add_to_index(keys=[self._index_key(version)], args=[entry_id, self.ttl], client=pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Semantic cache put error: {str(e)}")
+
+    def _best_match(self, embedding: np.ndarray, entities: str):
+        if self._matrix is None or not self._entries:
+            return None, -1.0
+
+        similarities = self._matrix @ np.asarray(embedding, dtype=np.float32)
+        valid = self._active & (self._expires > time.time()) & (self._row_entities == entities)
+        if not valid.any():
+            return None, -1.0
+        similarities[~valid] = -np.inf
+
+        row = int(np.argmax(similarities))
+        return self._row_ids[row], float(similarities[row])
+
+    def _insert(
+            self,
+            entry_id: str,
+            embedding: np.ndarray,
+            answer: str,
+            chunk_ids: List[str],
+            expires_at: float,
+            entities: str
+    ):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+
+        if entry_id in self._entries:
+            row = self._entries.pop(entry_id)["row"]
+        else:
+            if not self._free_rows:
+                _, evicted = self._entries.popitem(last=False)
+                self._active[evicted["row"]] = False
+                self._free_rows.append(evicted["row"])
+            row = self._free_rows.pop()
+
+        self._matrix[row] = embedding
+        self._expires[row] = expires_at
+        self._active[row] = True
+        self._row_ids[row] = entry_id
+        self._row_entities[row] = entities
+        self._entries[entry_id] = {"row": row, "answer": answer, "chunk_ids": chunk_ids}
+
+    def _switch_version(self, version: str):
+        """Смена версии базы знаний делает все локальные записи недействительными"""
+        if self._version == version:
+            return
+        self._version = version
+        self._entries.clear()
+        self._active[:] = False
+        self._free_rows = list(range(self.max_entries - 1, -1, -1))
+        self._last_refresh = 0.0
+        self._cursor = None
+
+    def _refresh(self, version: str):
+        """Подгрузка записей, добавленных другими процессами"""
+        now = time.time()
+        with self._lock:
+            self._switch_version(version)
+            if now - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = now
+            cursor = self._cursor
+
+        try:
+            # Граница включительная: записи с той же отметкой, что и курсор, отсеиваются ниже
+            indexed = self.redis.zrangebyscore(
+                self._index_key(version), "-inf" if cursor is None else cursor, "+inf", withscores=True
+            )
+            with self._lock:
+                new_ids = [
+                    entry_id for entry_id in (raw_id.decode('utf-8') for raw_id, _ in indexed)
+                    if entry_id not in self._entries
+                ]
+
+            records = []
+            if new_ids:
+                pipe = self.redis.pipeline(transaction=False)
+                for entry_id in new_ids:
+                    pipe.hgetall(self._entry_key(version, entry_id))
+                records = pipe.execute()
+        except Exception as e:
+            logger.error(f"Semantic cache refresh error: {str(e)}")
+            return
+
+        with self._lock:
+            if self._version != version:
+                return
+            # Курсор сдвигается только после успешной подгрузки записей
+            if indexed:
+                self._cursor = max(score for _, score in indexed)
+            for entry_id, record in zip(new_ids, records):
+                if not record:
+                    continue
+                self._insert(
+                    entry_id,
+                    np.frombuffer(record[b"embedding"], dtype=np.float32),
+                    self._decode_answer(record[b"answer"]),
+                    json.loads(record[b"chunk_ids"]),
+                    float(record[b"expires_at"]),
+                    record.get(b"entities", b"").decode('utf-8')
+                )
+        if new_ids:
+            logger.debug(f"Semantic cache loaded {len(new_ids)} entries from Redis")
+
+    def _encode_answer(self, answer: str):
+        # Прежние процессы читают ответ как текст UTF-8, поэтому в режиме json он пишется как раньше
+        return answer if self.serializer.codec == "json" else self.serializer.dumps(answer)
+
+    def _decode_answer(self, raw: bytes) -> str:
+        return self.serializer.loads(raw) if Serializer.is_encoded(raw) else raw.decode('utf-8')
+
+    def get_stats(self) -> Dict[str, float]:
+        """Счётчики попаданий для подбора порога"""
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": self.stats["hits"] / total if total else 0.0
+            }
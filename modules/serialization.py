@@ -0,0 +1,80 @@
+import json
+import threading
+from typing import Any, Union
+import msgpack
+import zstandard
+
+# Заголовок: байт 0xC1 (не встречается ни в UTF-8, ни как тип msgpack), версия схемы, кодек.
+# Данные без заголовка - прежний JSON, поэтому старые и новые процессы читают записи друг друга
+MAGIC = 0xC1
+SCHEMA_VERSION = 1
+CODEC_MSGPACK = 0
+CODEC_MSGPACK_ZSTD = 1
+HEADER_SIZE = 3
+
+
+class Serializer:
+    """
+    Формат сообщений Kafka и значений Redis:
+    - codec="json": прежний JSON без заголовка, по умолчанию - его читают и старые процессы
+    - codec="msgpack": msgpack, значения больше compress_threshold байт сжимаются zstd; включается явно,
+      когда все процессы обновлены
+    - loads понимает оба формата независимо от codec
+    """
+
+    def __init__(self, codec: str = "json", compress_threshold: int = 512, level: int = 3):
+        if codec not in ("msgpack", "json"):
+            raise ValueError(f"Unknown serialization codec: {codec}")
+        self.codec = codec
+        self.compress_threshold = compress_threshold
+        self.level = level
+        # Объекты zstd нельзя использовать из нескольких потоков одновременно
+        self._local = threading.local()
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor
+
+    def _decompressor(self) -> zstandard.ZstdDecompressor:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def dumps(self, value: Any) -> bytes:
+        if self.codec == "json":
+            return json.dumps(value).encode('utf-8')
+        payload = msgpack.packb(value, use_bin_type=True)
+        if len(payload) > self.compress_threshold:
+            compressed = self._compressor().compress(payload)
+            if len(compressed) < len(payload):
+                return bytes((MAGIC, SCHEMA_VERSION, CODEC_MSGPACK_ZSTD)) + compressed
+        return bytes((MAGIC, SCHEMA_VERSION, CODEC_MSGPACK)) + payload
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        if isinstance(data, str) or not self.is_encoded(data):
+            return json.loads(data)
+        version, codec = data[1], data[2]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Unsupported payload schema version {version}")
+        payload = memoryview(data)[HEADER_SIZE:]
+        if codec == CODEC_MSGPACK_ZSTD:
+            payload = self._decompressor().decompress(payload)
+        elif codec != CODEC_MSGPACK:
+            raise ValueError(f"Unsupported payload codec {codec}")
+        return msgpack.unpackb(payload, raw=False)
+
+    @staticmethod
+    def is_encoded(data: Union[bytes, str]) -> bool:
+        return isinstance(data, (bytes, bytearray)) and len(data) >= HEADER_SIZE and data[0] == MAGIC
+
+    @staticmethod
+    def payload_size(data: Union[bytes, str]) -> int:
+        """Размер данных без сжатия - для учёта объёма L1-кэша"""
+        if Serializer.is_encoded(data) and data[2] == CODEC_MSGPACK_ZSTD:
+            size = zstandard.frame_content_size(data[HEADER_SIZE:])
+            if size > 0:
+                return size
+        return len(data)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import redis.asyncio as aioredis
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Снятие аренды только её владельцем
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Межпроцессное схлопывание одинаковых запросов:
+    - первый воркер берёт короткую аренду ключа в Redis (SET NX PX) и генерирует ответ
+    - остальные ждут публикации результата или появления ключа в кэше, а не вызывают LLM
+    - если аренда пропала без результата, ожидающий возвращает None и генерирует сам
+    """
+
+    def __init__(
+            self,
+            redis_client: aioredis.Redis,
+            lease_ttl_ms: int = 45000,
+            wait_timeout: float = 45.0,
+            poll_interval: float = 0.5,
+            namespace: str = "single_flight"
+    ):
+        self.redis = redis_client
+        self.lease_ttl_ms = lease_ttl_ms
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.namespace = namespace
+        self.channel = f"{namespace}:done"
+        self._events: Dict[str, asyncio.Event] = {}
+        # Число ожидающих по ключу: событие удаляется, когда уходит последний из них
+        self._waiters: Dict[str, int] = {}
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+
+    def _lease_key(self, key: str) -> str:
+        return f"{self.namespace}:lease:{key}"
+
+    async def acquire_many(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        """Попытка взять аренду для каждого ключа: токен владельца или None, если ключ уже в работе"""
+        tokens = {key: uuid.uuid4().hex for key in keys}
+        if not keys:
+            return tokens
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(self._lease_key(key), tokens[key], nx=True, px=self.lease_ttl_ms)
+                acquired = await pipe.execute()
+        except Exception as e:
+            # Без Redis схлопывание не работает, но запросы обрабатываются
+            logger.error(f"Single-flight acquire error: {str(e)}")
+            return tokens
+        return {key: token if ok else None for (key, token), ok in zip(tokens.items(), acquired)}
+
+    async def release_many(self, leases: Dict[str, str]) -> None:
+        """Снятие аренды и оповещение ожидающих; вызывается после записи ответов в кэш"""
+        if not leases:
+            return
+        try:
+            for key, token in leases.items():
+                await self._release(keys=[self._lease_key(key)], args=[token])
+                await self.redis.publish(self.channel, key)
+        except Exception as e:
+            logger.error(f"Single-flight release error: {str(e)}")
+
+    async def wait(self, key: str, fetch: Callable[[str], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """Ожидание результата чужой генерации; None - по таймауту или если владелец не справился"""
+        event = self._events.setdefault(key, asyncio.Event())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while True:
+                value = await fetch(key)
+                if value is not None:
+                    return value
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Timed out waiting for in-flight result of {key}")
+                    return None
+                if event.is_set() or not await self._lease_exists(key):
+                    # Владелец закончил, но ответа нет - генерация не удалась
+                    return await fetch(key)
+                try:
+                    await asyncio.wait_for(event.wait(), min(self.poll_interval, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Запись удаляется при любом исходе, в том числе по таймауту, иначе ключи копились бы
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._events[key]
+
+    async def _lease_exists(self, key: str) -> bool:
+        try:
+            return bool(await self.redis.exists(self._lease_key(key)))
+        except Exception as e:
+            logger.error(f"Single-flight lease check error: {str(e)}")
+            return False
+
+    async def listen(self) -> None:
+        """Подписка на завершение генераций в других процессах"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                logger.info(f"Subscribed to single-flight notifications on '{self.channel}'")
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    key = message['data']
+                    event = self._events.get(key.decode('utf-8') if isinstance(key, bytes) else key)
+                    if event is not None:
+                        event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Single-flight listener error: {str(e)}")
+                await asyncio.sleep(1)
@@ -0,0 +1,84 @@
+import time
+import asyncio
+from typing import List, Set
+from .delivery import TELEGRAM_MESSAGE_LIMIT, DeliveryService, split_message
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingReply:
+    """
+    Потоковый ответ в Telegram:
+    - сразу отправляет сообщение-заглушку во все чаты
+    - редактирует его накопленным текстом не чаще заданного интервала
+    - финальный текст отправляется с Markdown, при ошибке разметки - простым текстом;
+      длинный ответ делится на части, продолжение уходит следующими сообщениями
+    - заглушки и правки идут через DeliveryService, в пределах общих лимитов Telegram
+    - доставка учитывается по чатам: обычной доставкой ответ уходит только туда, где поток не дошёл
+    """
+
+    def __init__(
+            self,
+            delivery: DeliveryService,
+            chat_ids: List[int],
+            edit_interval: float = 1.0,
+            min_delta: int = 40,
+            placeholder: str = "✍️ Готовлю ответ..."
+    ):
+        self.delivery = delivery
+        self.chat_ids = chat_ids
+        self.edit_interval = edit_interval
+        self.min_delta = min_delta
+        self.placeholder = placeholder
+        self._messages = []
+        self._shown = ""
+        self._next_edit_at = 0.0
+        self._delivered: Set[int] = set()
+
+    async def start(self):
+        """Отправка заглушек"""
+        results = await asyncio.gather(
+            *(self.delivery.send_placeholder(chat_id, self.placeholder) for chat_id in self.chat_ids)
+        )
+        self._messages = [message for message in results if message is not None]
+        self._next_edit_at = time.monotonic() + self.edit_interval
+
+    async def update(self, text: str):
+        """Промежуточное обновление с ограничением частоты правок"""
+        if time.monotonic() < self._next_edit_at or len(text) - len(self._shown) < self.min_delta:
+            return
+        self._next_edit_at = time.monotonic() + self.edit_interval
+        # Незавершённая Markdown-разметка не парсится, поэтому промежуточный текст - без неё
+        preview = self._truncate(text) + " ▌"
+        await asyncio.gather(*(self.delivery.edit(message, preview, wait=False) for message in self._messages))
+        self._shown = text
+
+    async def finish(self, text: str) -> Set[int]:
+        """
+        Финальная правка: первая часть ответа - в заглушку, остальные - следующими сообщениями.
+        Возвращает чаты, получившие ответ целиком
+        """
+        first, *rest = split_message(text) or [text]
+
+        async def finish_chat(message) -> bool:
+            if not await self.delivery.edit(message, first, parse_mode="Markdown"):
+                return False
+            for part in rest:
+                if not await self.delivery.send(message.chat.id, part):
+                    return False
+            return True
+
+        results = await asyncio.gather(*(finish_chat(message) for message in self._messages))
+        # Чаты без заглушки или с оборванной правкой получат ответ обычной доставкой
+        self._delivered = {message.chat.id for message, ok in zip(self._messages, results) if ok}
+        return self._delivered
+
+    @property
+    def delivered(self) -> Set[int]:
+        return self._delivered
+
+    @staticmethod
+    def _truncate(text: str) -> str:
+        limit = TELEGRAM_MESSAGE_LIMIT - 2
+        return text if len(text) <= limit else text[:limit - 1] + "…"
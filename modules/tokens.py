@@ -0,0 +1,34 @@
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+(?=[\"«(]?[A-ZА-ЯЁ0-9])|\n+")
+
+# Средняя длина подслова токенизатора YandexGPT для кириллицы и латиницы, в символах
+_CHARS_PER_TOKEN = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов без обращения к API токенизации"""
+    count = 0
+    for token in _TOKEN_RE.findall(text):
+        count += -(-len(token) // _CHARS_PER_TOKEN) if token[0].isalnum() or token[0] == "_" else 1
+    return count
+
+
+def split_sentences(text: str) -> List[str]:
+    """Разбиение текста на предложения и строки"""
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Обрезка текста по границе предложения так, чтобы уложиться в бюджет токенов"""
+    kept = []
+    used = 0
+    for sentence in split_sentences(text):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
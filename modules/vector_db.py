@@ -1,54 +1,478 @@
+import os
 import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Tuple
+from typing import List, Dict, Set, Tuple, Iterable, Optional
 import numpy as np
 import logging
+from .manifest import IndexManifest
+from .bm25 import BM25Index
+from .cache import LocalCache, normalize_query
+from .embedding_executor import BULK, EmbeddingExecutor
+from .entities import AliasIndex
+from .metrics import KB_CHUNKS, RETRIEVAL_FILTER, count_cache, timed
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VectorDB:
-    def __init__(self, collection_name: str = "documents", persist_dir: str = "db"):
-        self.client = chromadb.PersistentClient(path=persist_dir)
+    def __init__(
+            self,
+            collection_name: str = "documents",
+            persist_dir: str = "db",
+            retrieval_cache_size: int = 4096,
+            retrieval_cache_ttl: int = 3600,
+            retrieval_mode: str = "dense",
+            rrf_k: int = 60,
+            embedding_func: Optional[EmbeddingExecutor] = None,
+            embedding_cache: Optional[LocalCache] = None,
+            entity_index: Optional[AliasIndex] = None
+    ):
+        self.collection_name = collection_name
+        self.persist_dir = persist_dir
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
 
-        self.embedding_func = embedding_functions.DefaultEmbeddingFunction()
+        # Исполнитель и кэш эмбеддингов запросов могут разделяться между версиями коллекции
+        self.embedding_func = embedding_func or EmbeddingExecutor()
+        # Индекс псевдонимов сущностей: чанки помечаются страной документа, поиск сужается до упомянутых стран
+        self.entity_index = entity_index
 
+        self._open_store()
+
+        self.manifest = IndexManifest(
+            os.path.join(persist_dir, f"{collection_name}_manifest.json")
+        )
+        if self.manifest.files and self._count() == 0:
+            logger.warning("Index manifest found for an empty collection, reindexing from scratch")
+            self.manifest.reset()
+
+        self.lexical_index = BM25Index(
+            os.path.join(persist_dir, f"{collection_name}_bm25.json")
+        )
+        if len(self.lexical_index) == 0 and self._count() > 0:
+            logger.info("Building BM25 index from the existing collection")
+            self.lexical_index.add(self._all_documents())
+            self.lexical_index.save()
+
+        if self.entity_index is not None:
+            self._tag_untagged_files()
+
+        # Эмбеддинги запросов не зависят от содержимого БЗ, результаты поиска - зависят
+        self._embedding_cache = embedding_cache or LocalCache(
+            max_entries=retrieval_cache_size, max_bytes=64 * 1024 * 1024, ttl=retrieval_cache_ttl
+        )
+        self._results_cache = LocalCache(
+            max_entries=retrieval_cache_size, max_bytes=64 * 1024 * 1024, ttl=retrieval_cache_ttl
+        )
+        self._results_version = None
+        self._entity_ids_cache: Dict[Tuple[str, ...], Set[str]] = {}
+        KB_CHUNKS.set(self._count())
+
+    def _open_store(self) -> None:
+        """Открытие хранилища векторов"""
+        self.client = chromadb.PersistentClient(path=self.persist_dir)
         self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=self.embedding_func
+            name=self.collection_name,
+            # Эмбеддинги всегда считает исполнитель, модель нужна Chroma только для конфигурации коллекции
+            embedding_function=self.embedding_func.model
         )
 
+    def _count(self) -> int:
+        return self.collection.count()
+
+    def _get_documents(self, ids: List[str]) -> Dict[str, str]:
+        results = self.collection.get(ids=ids, include=["documents"])
+        return dict(zip(results["ids"], results["documents"]))
+
+    def _all_documents(self) -> Dict[str, str]:
+        results = self.collection.get(include=["documents"])
+        return dict(zip(results["ids"], results["documents"]))
+
+    def _get_embeddings(self, ids: List[str]) -> np.ndarray:
+        results = self.collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(results["ids"], results["embeddings"]))
+        return np.asarray([by_id[doc_id] for doc_id in ids], dtype=np.float32)
+
+    def _get_metadatas(self, ids: List[str]) -> Dict[str, Dict]:
+        results = self.collection.get(ids=ids, include=["metadatas"])
+        return dict(zip(results["ids"], results["metadatas"]))
+
+    def _set_metadatas(self, metadatas: Dict[str, Dict]) -> None:
+        self.collection.update(ids=list(metadatas), metadatas=list(metadatas.values()))
+
+    def copy_from(self, source: "VectorDB", batch_size: int = 256) -> None:
+        """Копирование чанков с готовыми эмбеддингами и манифеста из другой коллекции"""
+        ids = list(source._all_documents())
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            documents = source._get_documents(batch)
+            self._write(
+                {doc_id: documents[doc_id] for doc_id in batch},
+                source._get_embeddings(batch),
+                source._get_metadatas(batch)
+            )
+        self.manifest.files = {name: dict(entry) for name, entry in source.manifest.files.items()}
+        self.manifest.update_extra(source.manifest.extra)
+        self._flush()
+        self.lexical_index.save()
+        self.manifest.save()
+
     def add_documents(self, documents: Dict[str, str]) -> None:
         """Добавление документов в векторную БД"""
-        logger.info("STARTED adding docs")
-        ids = []
-        texts = []
-        metadatas = []
-
-        for doc_id, content in documents.items():
-            logger.info(f"\t {doc_id} - {content}")
-            ids.append(doc_id)
-            texts.append(content)
-            metadatas.append({"source": doc_id})
-
-        self.collection.add(
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
+        self._write(documents)
+        self._flush()
+        self.lexical_index.save()
+        self.manifest.update_extra({
+            doc_id: IndexManifest.hash_text(content) for doc_id, content in documents.items()
+        })
+        self.manifest.save()
+        KB_CHUNKS.set(self._count())
+
+    @property
+    def kb_version(self) -> str:
+        """Версия содержимого базы знаний, меняется при любом изменении коллекции"""
+        self.manifest.refresh()
+        return self.manifest.revision
+
+    def sync_documents(
+            self,
+            documents: Iterable[Tuple[str, Dict[str, str]]],
+            batch_size: int = 256,
+            keep_files: Iterable[str] = ()
+    ) -> Dict[str, int]:
+        """
+        Инкрементальная синхронизация коллекции с документами:
+        - эмбеддятся и добавляются только новые и изменившиеся чанки
+        - удаляются чанки удалённых файлов и хвосты укоротившихся (кроме файлов из keep_files)
+        - документы читаются потоково, чанки уходят в БД пачками не больше batch_size
+        """
+        stats = {"files": 0, "unchanged": 0, "upserted": 0, "deleted": 0}
+        seen_files = set(keep_files)
+        pending: Dict[str, str] = {}
+        pending_metadatas: Dict[str, Dict] = {}
+
+        for file_name, chunks in documents:
+            seen_files.add(file_name)
+            stats["files"] += 1
+
+            chunk_hashes = {
+                chunk_id: IndexManifest.hash_text(content)
+                for chunk_id, content in chunks.items()
+            }
+            if self.manifest.file_hash(file_name) == IndexManifest.hash_chunks(chunk_hashes):
+                stats["unchanged"] += 1
+                continue
+
+            old_hashes = self.manifest.chunk_hashes(file_name)
+            changed = {
+                chunk_id: chunks[chunk_id]
+                for chunk_id, chunk_hash in chunk_hashes.items()
+                if old_hashes.get(chunk_id) != chunk_hash
+            }
+            removed = [chunk_id for chunk_id in old_hashes if chunk_id not in chunk_hashes]
+            entity = self._document_entity(chunks)
+
+            if entity is not None and entity != self.manifest.file_entity(file_name):
+                # Сменилась страна документа: метки неизменившихся чанков переписываются без эмбеддингов
+                retagged = [chunk_id for chunk_id in chunk_hashes if chunk_id in old_hashes and chunk_id not in changed]
+                if retagged:
+                    self._set_metadatas({chunk_id: self._chunk_metadata(chunk_id, entity) for chunk_id in retagged})
+            if changed:
+                pending.update(changed)
+                pending_metadatas.update({chunk_id: self._chunk_metadata(chunk_id, entity) for chunk_id in changed})
+                stats["upserted"] += len(changed)
+                if len(pending) >= batch_size:
+                    self._write(pending, metadatas=pending_metadatas)
+                    pending, pending_metadatas = {}, {}
+            if removed:
+                self._remove(removed)
+                stats["deleted"] += len(removed)
+            self.manifest.update_file(file_name, chunk_hashes, entity=entity)
+
+        if pending:
+            self._write(pending, metadatas=pending_metadatas)
+
+        for file_name in set(self.manifest.files) - seen_files:
+            removed = list(self.manifest.chunk_hashes(file_name))
+            if removed:
+                self._remove(removed)
+                stats["deleted"] += len(removed)
+            self.manifest.remove_file(file_name)
+
+        self._flush()
+        self.lexical_index.save()
+        self.manifest.save()
+        KB_CHUNKS.set(self._count())
+        logger.info(f"Knowledge base synced: {stats}")
+        return stats
+
+    def _write(
+            self,
+            documents: Dict[str, str],
+            embeddings: Optional[np.ndarray] = None,
+            metadatas: Optional[Dict[str, Dict]] = None
+    ) -> None:
+        """Запись чанков в хранилище векторов и лексический индекс"""
+        self._upsert(documents, embeddings, metadatas)
+        self.lexical_index.add(documents)
+
+    def _remove(self, ids: List[str]) -> None:
+        self._delete(ids)
+        self.lexical_index.remove(ids)
+
+    def _upsert(
+            self,
+            documents: Dict[str, str],
+            embeddings: Optional[np.ndarray] = None,
+            metadatas: Optional[Dict[str, Dict]] = None
+    ) -> None:
+        if embeddings is None:
+            embeddings = self.embedding_func.embed(list(documents.values()), priority=BULK)
+        metadatas = metadatas or {}
+        self.collection.upsert(
+            documents=list(documents.values()),
+            metadatas=[metadatas.get(doc_id) or {"source": doc_id} for doc_id in documents],
+            ids=list(documents.keys()),
+            embeddings=np.asarray(embeddings).tolist()
         )
 
+    def _delete(self, ids: List[str]) -> None:
+        self.collection.delete(ids=ids)
+
+    def _flush(self) -> None:
+        """Сброс накопленных изменений хранилища на диск"""
+
+    @staticmethod
+    def _chunk_metadata(chunk_id: str, entity: Optional[str]) -> Dict:
+        if entity:
+            return {"source": chunk_id, "country": entity}
+        return {"source": chunk_id}
+
+    def _document_entity(self, chunks: Dict[str, str]) -> Optional[str]:
+        """Страна документа по его чанкам; None - индекс сущностей не подключён"""
+        if self.entity_index is None:
+            return None
+        return self.entity_index.detect(chunks.values()) or ""
+
+    def _tag_untagged_files(self) -> None:
+        """Разметка сущностями файлов, проиндексированных до появления индекса: без пересчёта эмбеддингов"""
+        untagged = [file_name for file_name in self.manifest.files if self.manifest.file_entity(file_name) is None]
+        if not untagged:
+            return
+        logger.info(f"Tagging {len(untagged)} indexed files with entities")
+        for file_name in untagged:
+            chunk_ids = list(self.manifest.chunk_hashes(file_name))
+            found = self._get_documents(chunk_ids)
+            # Хранилище может вернуть чанки в другом порядке, а заголовок документа - в первом
+            documents = {chunk_id: found[chunk_id] for chunk_id in chunk_ids if chunk_id in found}
+            entity = self._document_entity(documents)
+            self._set_metadatas({chunk_id: self._chunk_metadata(chunk_id, entity) for chunk_id in documents})
+            self.manifest.files[file_name]['entity'] = entity
+        self._flush()
+        self.manifest.save()
+
+    def _query_entities(self, query_text: str) -> Tuple[str, ...]:
+        if self.entity_index is None:
+            return ()
+        return tuple(sorted(self.entity_index.find(query_text)))
+
+    def _entity_ids(self, entities: Tuple[str, ...]) -> Set[str]:
+        """Чанки документов с заданными сущностями - по манифесту, без обращения к хранилищу"""
+        ids = self._entity_ids_cache.get(entities)
+        if ids is None:
+            ids = {
+                chunk_id
+                for file_name, entry in self.manifest.files.items() if entry.get('entity') in entities
+                for chunk_id in entry['chunks']
+            }
+            self._entity_ids_cache[entities] = ids
+        return ids
+
     def query(self, query_text: str, top_k: int = 3) -> List[Tuple[str, float]]:
         """Поиск по векторной БД"""
+        return self.query_batch([query_text], top_k=top_k)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 3) -> List[List[Tuple[str, float]]]:
+        """Пакетный поиск: все запросы эмбеддятся и ищутся одним вызовом"""
+        if not query_texts:
+            return []
+
+        return [
+            [(document, distance) for _, document, distance in results]
+            for results in self.search(self.embed(query_texts), top_k=top_k, query_texts=query_texts)
+        ]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Нормализованные эмбеддинги текстов; модель вызывается один раз для всех промахов кэша"""
+        keys = [normalize_query(text) for text in texts]
+        embeddings = [self._embedding_cache.get(key) for key in keys]
+
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], texts[i])
+        count_cache("embedding", len(texts) - len(missing), len(missing))
+        if missing:
+            with timed("embed"):
+                computed = np.array(self.embedding_func.embed(list(missing.values())), dtype=np.float32)
+            computed /= np.maximum(np.linalg.norm(computed, axis=1, keepdims=True), 1e-12)
+            for key, embedding in zip(missing, computed):
+                self._embedding_cache.set(key, embedding, embedding.nbytes)
+            by_key = dict(zip(missing, computed))
+            embeddings = [by_key[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+
+        return np.stack(embeddings)
+
+    def search(
+            self,
+            query_embeddings: np.ndarray,
+            top_k: int = 3,
+            query_texts: Optional[List[str]] = None
+    ) -> List[List[Tuple[str, str, float]]]:
+        """
+        Поиск ближайших чанков по готовым эмбеддингам: (id, текст, расстояние).
+        С query_texts результаты кэшируются по нормализованному запросу и версии БЗ,
+        а при подключённом индексе сущностей поиск сужается до стран, упомянутых в запросе.
+        """
+        if len(query_embeddings) == 0:
+            return []
+        if query_texts is None:
+            with timed("vector_search"):
+                return self._search(query_embeddings, top_k)
+
+        version = self.kb_version
+        if version != self._results_version:
+            self._results_cache.clear()
+            self._entity_ids_cache.clear()
+            self._results_version = version
+
+        keys = [f"{version}:{self.retrieval_mode}:{top_k}:{normalize_query(text)}" for text in query_texts]
+        results = [self._results_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        count_cache("retrieval", len(results) - len(missing), len(missing))
+        # Запросы с одинаковым набором упомянутых сущностей ищутся одним вызовом с общим фильтром
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i in missing:
+            groups.setdefault(self._query_entities(query_texts[i]), []).append(i)
+        for entities, indices in groups.items():
+            found = self._filtered_search(
+                np.asarray(query_embeddings)[indices], [query_texts[i] for i in indices], top_k, entities
+            )
+            for i, result in zip(indices, found):
+                results[i] = result
+                self._results_cache.set(keys[i], result, sum(len(document) for _, document, _ in result))
+        return results
+
+    def _filtered_search(
+            self,
+            query_embeddings: np.ndarray,
+            query_texts: List[str],
+            top_k: int,
+            entities: Tuple[str, ...]
+    ) -> List[List[Tuple[str, str, float]]]:
+        """Поиск только по чанкам упомянутых стран; если там ничего нет - по всей коллекции"""
+        if self.retrieval_mode == "hybrid":
+            found = self._hybrid_search(query_embeddings, query_texts, top_k, entities)
+        else:
+            with timed("vector_search"):
+                found = self._search(query_embeddings, top_k, entities)
+        if not entities:
+            RETRIEVAL_FILTER.labels("unfiltered").inc(len(found))
+            return found
+
+        empty = [i for i, result in enumerate(found) if not result]
+        RETRIEVAL_FILTER.labels("filtered").inc(len(found) - len(empty))
+        if empty:
+            RETRIEVAL_FILTER.labels("fallback").inc(len(empty))
+            fallback = self._filtered_search(query_embeddings[empty], [query_texts[i] for i in empty], top_k, ())
+            for i, result in zip(empty, fallback):
+                found[i] = result
+        return found
+
+    def _hybrid_search(
+            self,
+            query_embeddings: np.ndarray,
+            query_texts: List[str],
+            top_k: int,
+            entities: Tuple[str, ...] = ()
+    ) -> List[List[Tuple[str, str, float]]]:
+        """
+        Гибридный поиск: плотный и BM25, объединённые reciprocal-rank fusion.
+        Расстояние в результате - 1 минус нормированный RRF-скор (меньше - ближе).
+        """
+        self.lexical_index.refresh()
+        candidates = max(top_k * 4, 20)
+        allowed_ids = self._entity_ids(entities) if entities else None
+        with timed("vector_search"):
+            dense_results = self._search(query_embeddings, candidates, entities)
+
+        fused_results = []
+        missing_ids = set()
+        for dense, text in zip(dense_results, query_texts):
+            scores: Dict[str, float] = {}
+            documents = {}
+            for rank, (doc_id, document, _) in enumerate(dense):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+                documents[doc_id] = document
+            with timed("bm25"):
+                lexical = self.lexical_index.search(text, candidates, ids=allowed_ids)
+            for rank, (doc_id, _) in enumerate(lexical):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            missing_ids.update(doc_id for doc_id, _ in best if doc_id not in documents)
+            fused_results.append((best, documents))
+
+        # Тексты чанков, найденных только лексически, подтягиваются одним запросом
+        fetched = self._get_documents(sorted(missing_ids)) if missing_ids else {}
+
+        max_score = 2.0 / (self.rrf_k + 1)
+        return [
+            [
+                (doc_id, documents.get(doc_id, fetched.get(doc_id, "")), 1.0 - score / max_score)
+                for doc_id, score in best
+            ]
+            for best, documents in fused_results
+        ]
+
+    def _search(
+            self,
+            query_embeddings: np.ndarray,
+            top_k: int,
+            entities: Tuple[str, ...] = ()
+    ) -> List[List[Tuple[str, str, float]]]:
         results = self.collection.query(
-            query_texts=[query_text],
-            n_results=top_k
+            query_embeddings=np.asarray(query_embeddings).tolist(),
+            n_results=top_k,
+            where={"country": {"$in": list(entities)}} if entities else None
         )
 
-        return list(zip(
-            results["documents"][0],
-            results["distances"][0]
-        ))
+        return [
+            list(zip(ids, documents, distances))
+            for ids, documents, distances in zip(results["ids"], results["documents"], results["distances"])
+        ]
 
     def clear(self) -> None:
         """Очистка коллекции"""
-        self.collection.delete()
\ No newline at end of file
+        self._reset()
+        self.lexical_index.reset()
+        self.lexical_index.save()
+        self.manifest.reset()
+        self.manifest.save()
+        self._results_cache.clear()
+        self._entity_ids_cache.clear()
+        KB_CHUNKS.set(0)
+
+    def _reset(self) -> None:
+        self.collection.delete()
+
+    def drop(self) -> None:
+        """Удаление коллекции вместе с манифестом и лексическим индексом"""
+        self._drop_store()
+        for path in (self.manifest.path, self.lexical_index.path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _drop_store(self) -> None:
+        self.client.delete_collection(self.collection_name)
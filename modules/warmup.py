@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import queue
+import asyncio
+import logging.handlers
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from .admission import SharedTokenBucket, TokenBucket
+from .agent import Agent
+from .cache import AsyncCacheManager, normalize_query
+from .entities import AliasIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    """
+    Журнал запросов бота в формате JSONL (ts, query) - источник для прогрева кэша:
+    - record только кладёт строку в очередь, в файл пишет отдельный поток, event loop не ждёт диск
+    - ротация по размеру: при max_bytes файл переименовывается в path.1, хранится backups старых файлов
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def record(self, query: str) -> None:
+        try:
+            line = json.dumps({'ts': time.time(), 'query': query}, ensure_ascii=False)
+            self._queue.put_nowait(logging.makeLogRecord({'msg': line}))
+        except Exception as e:
+            logger.error(f"Failed to record query: {str(e)}")
+
+    def close(self) -> None:
+        """Дописывает очередь и закрывает файл"""
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+
+
+def query_log_files(path: str) -> List[str]:
+    """Файлы журнала от старых к новым: ротированные path.N, ..., path.1 и текущий path"""
+    directory, name = os.path.split(path)
+    pattern = re.compile(re.escape(name) + r"\.(\d+)$")
+    rotated = []
+    for entry in os.listdir(directory or '.'):
+        match = pattern.match(entry)
+        if match:
+            rotated.append((int(match.group(1)), os.path.join(directory, entry)))
+    files = [file for _, file in sorted(rotated, reverse=True)]
+    return files + [path] if os.path.exists(path) else files
+
+
+def load_query_log(path: str, since: Optional[float] = None) -> List[str]:
+    """
+    Запросы из JSONL-лога бота (поле query или text), включая ротированные файлы.
+    since - unix-время, более старые записи с меткой ts пропускаются.
+    """
+    files = query_log_files(path)
+    if not files:
+        raise FileNotFoundError(path)
+    queries = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if since is not None and record.get('ts', since) < since:
+                    continue
+                query = record.get('query') or record.get('text')
+                if query:
+                    queries.append(query)
+    return queries
+
+
+@dataclass
+class QueryCluster:
+    """Группа семантически близких запросов: представитель и частоты нормализованных вариантов"""
+    query: str
+    variants: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        return sum(self.variants.values())
+
+
+def cluster_queries(
+        queries: List[str],
+        embed: Callable[[List[str]], np.ndarray],
+        threshold: float = 0.92,
+        batch_size: int = 256,
+        entity_index: Optional[AliasIndex] = None
+) -> List[QueryCluster]:
+    """
+    Кластеры запросов по убыванию частоты. Точные повторы сливаются по нормализованному тексту,
+    перефразировки - жадно к самому частому близкому запросу (косинус >= threshold, как в семантическом кэше).
+    С entity_index объединяются только запросы об одних и тех же странах - то же правило, что
+    у SemanticCache: иначе ответ про Италию попал бы под ключ запроса про Францию.
+    """
+    counts = Counter()
+    originals: Dict[str, str] = {}
+    for query in queries:
+        key = normalize_query(query)
+        if key:
+            counts[key] += 1
+            originals.setdefault(key, query.strip())
+    if not counts:
+        return []
+
+    ranked = [key for key, _ in counts.most_common()]
+    embeddings = np.concatenate([
+        np.asarray(embed([originals[key] for key in ranked[start:start + batch_size]]), dtype=np.float32)
+        for start in range(0, len(ranked), batch_size)
+    ])
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    clusters: List[QueryCluster] = []
+    leaders = np.zeros((len(ranked), embeddings.shape[1]), dtype=np.float32)
+    leader_entities = np.full(len(ranked), "", dtype=object)
+    for key, embedding in zip(ranked, embeddings):
+        entities = entity_index.key(originals[key]) if entity_index is not None else ""
+        if clusters:
+            similarities = leaders[:len(clusters)] @ embedding
+            similarities[leader_entities[:len(clusters)] != entities] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                clusters[best].variants[key] = counts[key]
+                continue
+        leaders[len(clusters)] = embedding
+        leader_entities[len(clusters)] = entities
+        clusters.append(QueryCluster(query=originals[key], variants={key: counts[key]}))
+
+    clusters.sort(key=lambda cluster: cluster.count, reverse=True)
+    return clusters
+
+
+def coverage(clusters: List[QueryCluster], top_n: int) -> Dict[str, float]:
+    """Ожидаемая доля попаданий: какая часть трафика из лога приходится на top_n кластеров"""
+    total = sum(cluster.count for cluster in clusters)
+    top = clusters[:top_n]
+    covered = sum(cluster.count for cluster in top)
+    return {
+        'queries': total,
+        'unique': sum(len(cluster.variants) for cluster in clusters),
+        'clusters': len(clusters),
+        'warmed_clusters': len(top),
+        'hit_rate': covered / total if total else 0.0
+    }
+
+
+class CacheWarmer:
+    """
+    Прогрев кэша ответов: генерация через Agent.generate_response с ограничением частоты вызовов LLM.
+    Ответ записывается под ключами всех вариантов кластера с текущей версией БЗ и модели;
+    кластеры, уже лежащие в кэше, пропускаются.
+    quota - общий с воркерами token bucket квоты YandexGPT: прогрев не превышает её вместе с живым трафиком,
+    а rate дополнительно ограничивает долю квоты, которую забирает прогрев.
+    """
+
+    def __init__(
+            self,
+            agent: Agent,
+            cache: AsyncCacheManager,
+            rate: float = 2.0,
+            concurrency: int = 4,
+            ttl: int = 86400,
+            quota: Optional[SharedTokenBucket] = None
+    ):
+        self.agent = agent
+        self.cache = cache
+        self.bucket = TokenBucket(rate, max(rate, 1.0))
+        self.quota = quota
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.ttl = ttl
+
+    async def run(self, clusters: List[QueryCluster]) -> Dict[str, int]:
+        stats = {'generated': 0, 'cached': 0, 'failed': 0}
+        version = self.agent.cache_version
+        await asyncio.gather(*(self._warm(cluster, version, stats) for cluster in clusters))
+        return stats
+
+    async def _warm(self, cluster: QueryCluster, version: str, stats: Dict[str, int]) -> None:
+        keys = [self.cache.generate_cache_key(variant, version) for variant in cluster.variants]
+        async with self.semaphore:
+            cached = await self.cache.mget(keys)
+            if all(cached):
+                stats['cached'] += 1
+                return
+            await self._acquire(self.bucket)
+            if self.quota is not None:
+                await self._acquire(self.quota)
+            try:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(None, self.agent.generate_response, cluster.query)
+            except Exception as e:
+                logger.error(f"Failed to warm up '{cluster.query}': {str(e)}")
+                stats['failed'] += 1
+                return
+        await self.cache.mset({key: {'response': response} for key in keys}, ttl=self.ttl)
+        stats['generated'] += 1
+        logger.info(f"Warmed up '{cluster.query}' ({cluster.count} queries, {len(keys)} variants)")
+
+    @staticmethod
+    async def _acquire(bucket) -> None:
+        """Ожидание токена в локальном или общем bucket"""
+        while True:
+            delay = await bucket.reserve()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
@@ -0,0 +1,75 @@
+import hashlib
+import numpy as np
+from modules.bm25 import BM25Index, stem_ru, tokenize
+from modules.embedding_executor import EmbeddingExecutor
+from modules.numpy_vector_db import NumpyVectorDB
+
+
+class HashEmbedding:
+    """Детерминированные эмбеддинги «мешок слов» вместо модели"""
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = np.full(64, 1e-3, dtype=np.float32)
+            for word in tokenize(text):
+                vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % 64] += 1
+            vectors.append(vector)
+        return vectors
+
+
+def test_stemming_merges_word_forms():
+    assert stem_ru("италии") == stem_ru("италия") == stem_ru("италию")
+
+
+def test_tokenize_drops_stopwords_and_normalizes():
+    assert tokenize("Что посмотреть в Риме?") == tokenize("посмотреть рим")
+    assert "в" not in tokenize("в Риме")
+
+
+def test_search_ranks_matching_documents(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.json"))
+    index.add({
+        "it": "Колизей и Ватикан в Риме, паста и мороженое",
+        "th": "Пляжи Пхукета и тайский массаж",
+        "fr": "Лувр и Эйфелева башня в Париже"
+    })
+
+    results = index.search("Что посмотреть в Риме: Колизей", top_k=2)
+    assert [doc_id for doc_id, _ in results] == ["it"]
+    assert index.search("пляжи", ids={"it", "fr"}) == []
+
+
+def test_remove_and_reload(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = BM25Index(path)
+    index.add({"a": "горы и озера", "b": "озера и пляжи"})
+    index.remove(["a"])
+    index.save()
+
+    reloaded = BM25Index(path)
+    assert len(reloaded) == 1
+    assert [doc_id for doc_id, _ in reloaded.search("озера")] == ["b"]
+    assert reloaded.search("горы") == []
+
+
+def test_hybrid_search_fuses_dense_and_lexical_ranks(tmp_path):
+    db = NumpyVectorDB(
+        persist_dir=str(tmp_path),
+        retrieval_mode="hybrid",
+        embedding_func=EmbeddingExecutor(model=HashEmbedding(), workers=1)
+    )
+    db.add_documents({
+        "rome": "Колизей в Риме открыт каждый день",
+        "paris": "Лувр в Париже закрыт по вторникам",
+        "beach": "Лучшие пляжи Таиланда"
+    })
+
+    query = "Колизей в Риме"
+    results = db.search(db.embed([query]), top_k=3, query_texts=[query])[0]
+
+    assert results[0][0] == "rome"
+    assert results[0][1] == "Колизей в Риме открыт каждый день"
+    # Первое место в обоих списках - максимальный RRF-скор, расстояние 0
+    assert results[0][2] == 0.0
+    assert [distance for _, _, distance in results] == sorted(distance for _, _, distance in results)
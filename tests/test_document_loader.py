@@ -0,0 +1,25 @@
+from modules.document_loader import DocumentLoader
+
+
+def _write_documents(path, count):
+    for i in range(count):
+        (path / f"country_{i}.md").write_text(
+            f"# Страна {i}\n\n## Кухня\nБлюдо номер {i}. Ещё одно предложение.\n\n## Природа\nГоры и озёра.\n",
+            encoding="utf-8"
+        )
+
+
+def test_process_pool_matches_sequential_parsing(tmp_path):
+    _write_documents(tmp_path, 4)
+    sequential = DocumentLoader(str(tmp_path), chunk_tokens=64, workers=2)
+    parallel = DocumentLoader(str(tmp_path), chunk_tokens=64, workers=2, parallel_min_files=2)
+    try:
+        expected = sequential.load_and_chunk_documents()
+        assert len(expected) == 4
+        assert parallel.load_and_chunk_documents() == expected
+        # Пул переиспользуется между загрузками
+        pool = parallel._pool
+        assert parallel.load_and_chunk_documents() == expected
+        assert parallel._pool is pool
+    finally:
+        parallel.close()
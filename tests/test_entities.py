@@ -0,0 +1,43 @@
+from modules.entities import AliasIndex, country_index, normalize_entity_text
+
+
+def test_normalize_entity_text():
+    assert normalize_entity_text("Нью-Йорк, Ёлки!") == "нью йорк елки"
+
+
+def test_stem_alias_matches_word_forms():
+    index = country_index()
+    for query in ("Что посмотреть в Италии?", "Поездка в Италию", "итальянская кухня", "ITALY in May"):
+        assert index.find(query) == ["it"]
+
+
+def test_entities_in_order_of_mention():
+    assert country_index().find("Сравни Испанию и Португалию") == ["es", "pt"]
+    assert country_index().find("Из Токио в Рим") == ["jp", "it"]
+
+
+def test_whole_word_alias_does_not_match_inside_word():
+    index = AliasIndex({"eg": ("нил",)})
+    assert index.find("Круиз по Нилу") == []
+    assert index.find("Круиз по реке Нил") == ["eg"]
+
+
+def test_alias_starts_at_word_boundary():
+    index = AliasIndex({"it": ("рим*",)})
+    assert index.find("Римские каникулы") == ["it"]
+    assert index.find("Приморские курорты") == []
+
+
+def test_multiword_alias():
+    assert country_index().find("Отель в Нью-Йорке") == ["us"]
+    assert country_index().find("Новый год") == []
+
+
+def test_overlapping_aliases_of_different_entities():
+    index = AliasIndex({"a": ("сан*",), "b": ("сантьяго",)})
+    assert index.find("Сантьяго") == ["a", "b"]
+
+
+def test_detect_uses_first_chunk_with_entity():
+    assert country_index().detect(["Введение", "# Япония\nСакура и храмы", "Италия"]) == "jp"
+    assert country_index().detect(["Без стран"]) is None
@@ -0,0 +1,81 @@
+import threading
+import time
+from modules import llm_client
+from modules.llm_client import CircuitBreaker, CompletionResult, ResilientLLM
+
+
+class SlowModel:
+    """Первый вызов отвечает медленно, остальные - сразу"""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def run(self, prompt, timeout=60):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        time.sleep(0.3 if first else 0.0)
+        return CompletionResult(text=prompt)
+
+
+def _hedged_llm(model, hedge_permit=None):
+    llm = ResilientLLM([("yandexgpt", model)], timeout=2.0, hedge_permit=hedge_permit)
+    for _ in range(20):
+        llm.tiers[0].latency.observe(0.05)
+    return llm
+
+
+def test_hedge_sent_with_rate_limit_token():
+    model = SlowModel()
+    assert _hedged_llm(model, hedge_permit=lambda: True).run("ответ").text == "ответ"
+    assert model.calls == 2
+
+
+def test_hedge_skipped_without_rate_limit_token():
+    model = SlowModel()
+    assert _hedged_llm(model, hedge_permit=lambda: False).run("ответ").text == "ответ"
+    assert model.calls == 1
+
+
+def _open_breaker(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(llm_client.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker, clock
+
+
+def test_breaker_opens_after_failures(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    assert breaker.is_open
+    assert not breaker.allow_request()
+
+
+def test_breaker_half_open_lets_one_probe_through(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock[0] += 30.0
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_breaker_failed_probe_reopens(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock[0] += 30.0
+    assert breaker.allow_request()
+    breaker.record_failure()
+    clock[0] += 29.0
+    assert not breaker.allow_request()
+    clock[0] += 1.0
+    assert breaker.allow_request()
+
+
+def test_breaker_abandoned_probe_expires(monkeypatch):
+    breaker, clock = _open_breaker(monkeypatch)
+    clock[0] += 30.0
+    assert breaker.allow_request()
+    clock[0] += 30.0
+    assert breaker.allow_request()
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from confluent_kafka import TopicPartition
+from modules.messaging import KafkaMessaging, OrderedCommitter
+
+
+def _batch(*positions):
+    return [{"topic": topic, "partition": partition, "offset": offset} for topic, partition, offset in positions]
+
+
+def _offsets(topic_partitions):
+    return {(tp.topic, tp.partition): tp.offset for tp in topic_partitions}
+
+
+def test_batch_offsets_point_after_last_message_of_each_partition():
+    batch = _batch(("requests", 0, 5), ("requests", 1, 2), ("requests", 0, 7), ("requests", 0, 6))
+    assert _offsets(KafkaMessaging.batch_offsets(batch)) == {("requests", 0): 8, ("requests", 1): 3}
+
+
+def test_first_offsets_point_at_first_message_of_each_partition():
+    batch = _batch(("requests", 0, 7), ("requests", 1, 2), ("requests", 0, 5), ("responses", 0, 9))
+    assert _offsets(KafkaMessaging.first_offsets(batch)) == {
+        ("requests", 0): 5, ("requests", 1): 2, ("responses", 0): 9
+    }
+
+
+def test_empty_batch():
+    assert KafkaMessaging.batch_offsets([]) == []
+    assert KafkaMessaging.first_offsets([]) == []
+
+
+class FakeMessaging:
+    """Запоминает коммиты и возвраты позиции чтения вместо вызовов Kafka"""
+
+    def __init__(self):
+        self.commits = []
+        self.seeks = []
+
+    def commit_offsets(self, consumer, offsets):
+        self.commits.append(_offsets(offsets))
+
+    def seek_offsets(self, consumer, offsets):
+        self.seeks.append(_offsets(offsets))
+
+
+def _commit_batches(results, max_redeliveries=3, assigned=None):
+    """Пакеты по разделам requests/0 и requests/1; results - смещения первых необработанных сообщений"""
+    messaging = FakeMessaging()
+
+    async def run():
+        committer = OrderedCommitter(
+            messaging, None, ThreadPoolExecutor(max_workers=1),
+            max_redeliveries=max_redeliveries, track_partitions=assigned is not None
+        )
+        if assigned is not None:
+            committer.assign([TopicPartition("requests", partition) for partition in assigned])
+        for i, failed in enumerate(results):
+            batch = _batch(("requests", 0, i * 10), ("requests", 1, i * 10))
+            committer.add(asyncio.ensure_future(asyncio.sleep(0, result=failed)), KafkaMessaging.batch_offsets(batch))
+        await committer.drain()
+    asyncio.run(run())
+    return messaging
+
+
+def test_committer_commits_batches_in_order():
+    messaging = _commit_batches([[], []])
+    assert messaging.commits == [{("requests", 0): 1, ("requests", 1): 1}, {("requests", 0): 11, ("requests", 1): 11}]
+    assert messaging.seeks == []
+
+
+def test_committer_rewinds_partition_with_failed_message():
+    messaging = _commit_batches([[TopicPartition("requests", 0, 0)], []])
+    assert messaging.seeks == [{("requests", 0): 0}]
+    # Более поздний пакет этого раздела будет прочитан заново и не коммитится
+    assert messaging.commits == [{("requests", 0): 0, ("requests", 1): 1}, {("requests", 1): 11}]
+
+
+def test_committer_gives_up_after_max_redeliveries():
+    failed = [TopicPartition("requests", 0, 0)]
+    messaging = _commit_batches([failed, failed], max_redeliveries=1)
+    # Второе чтение с того же смещения уже не возвращает позицию
+    assert messaging.seeks == [{("requests", 0): 0}]
+    assert messaging.commits[-1] == {("requests", 1): 11}
+
+
+def test_committer_skips_unassigned_partitions():
+    messaging = _commit_batches([[]], assigned=[1])
+    assert messaging.commits == [{("requests", 1): 1}]
@@ -0,0 +1,31 @@
+from modules.prompt_packer import PromptPacker
+from modules.tokens import estimate_tokens
+
+
+def test_chunks_kept_in_order_within_budget():
+    chunks = ["Рим: Колизей и Форум.", "Флоренция: галерея Уффици.", "Венеция: каналы и гондолы."]
+    assert PromptPacker(budget_tokens=1000).pack(chunks) == chunks
+
+
+def test_near_duplicates_are_dropped():
+    chunk = "В Риме стоит посетить Колизей, Форум и Пантеон, а вечером прогуляться по Трастевере"
+    packed = PromptPacker(budget_tokens=1000).pack([chunk, chunk + "!", "Совсем другой текст про пляжи Таиланда"])
+    assert packed == [chunk, "Совсем другой текст про пляжи Таиланда"]
+
+
+def test_last_chunk_is_trimmed_to_budget():
+    first = "Первый чанк. " * 10
+    second = " ".join(f"Предложение номер {i}." for i in range(200))
+    packer = PromptPacker(budget_tokens=estimate_tokens(first) + 60, min_tail_tokens=20)
+
+    packed = packer.pack([first, second, "Третий чанк"])
+    assert packed[0] == first
+    assert len(packed) == 2
+    assert second.startswith(packed[1])
+    assert estimate_tokens(packed[1]) <= 60
+
+
+def test_small_tail_is_skipped():
+    first = "Первый чанк. " * 10
+    packer = PromptPacker(budget_tokens=estimate_tokens(first) + 5, min_tail_tokens=40)
+    assert packer.pack([first, "Второй чанк. " * 50]) == [first]
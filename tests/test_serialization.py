@@ -0,0 +1,46 @@
+import json
+import pytest
+from modules.serialization import CODEC_MSGPACK, CODEC_MSGPACK_ZSTD, MAGIC, Serializer
+
+VALUE = {"chat_ids": [1, 2], "query": "Что посмотреть в Италии?", "answer": "Рим " * 500}
+
+
+def test_msgpack_roundtrip_with_compression():
+    serializer = Serializer(codec="msgpack", compress_threshold=512)
+    data = serializer.dumps(VALUE)
+
+    assert data[0] == MAGIC and data[2] == CODEC_MSGPACK_ZSTD
+    assert serializer.loads(data) == VALUE
+    assert Serializer.payload_size(data) > len(data)
+
+
+def test_small_value_is_not_compressed():
+    data = Serializer(codec="msgpack", compress_threshold=512).dumps({"query": "Рим"})
+    assert data[2] == CODEC_MSGPACK
+    assert Serializer.payload_size(data) == len(data)
+
+
+def test_json_codec_writes_legacy_format():
+    data = Serializer(codec="json").dumps(VALUE)
+    assert not Serializer.is_encoded(data)
+    assert json.loads(data) == VALUE
+    assert Serializer().dumps(VALUE) == data
+
+
+def test_reads_both_formats_regardless_of_codec():
+    legacy = json.dumps(VALUE).encode("utf-8")
+    assert Serializer(codec="msgpack").loads(legacy) == VALUE
+    assert Serializer(codec="json").loads(Serializer(codec="msgpack").dumps(VALUE)) == VALUE
+    assert Serializer().loads(json.dumps(VALUE)) == VALUE
+
+
+def test_unknown_schema_version_is_rejected():
+    data = bytearray(Serializer(codec="msgpack").dumps(VALUE))
+    data[1] = 99
+    with pytest.raises(ValueError):
+        Serializer().loads(bytes(data))
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        Serializer(codec="pickle")
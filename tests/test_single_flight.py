@@ -0,0 +1,42 @@
+import asyncio
+import fakeredis
+from modules.single_flight import SingleFlight
+
+
+async def _nothing(key):
+    return None
+
+
+def test_timed_out_waiters_leave_no_entries():
+    async def run():
+        flight = SingleFlight(fakeredis.FakeAsyncRedis(), wait_timeout=0.2, poll_interval=0.05)
+        # Аренда занята другим владельцем, результата так и нет
+        assert (await flight.acquire_many(["key"]))["key"]
+        results = await asyncio.gather(flight.wait("key", _nothing), flight.wait("key", _nothing))
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert results == [None, None]
+    assert flight._events == {} and flight._waiters == {}
+
+
+def test_waiter_gets_result_of_owner():
+    async def run():
+        flight = SingleFlight(fakeredis.FakeAsyncRedis(), wait_timeout=2.0, poll_interval=0.05)
+        leases = await flight.acquire_many(["key"])
+        cache = {}
+
+        async def fetch(key):
+            return cache.get(key)
+
+        async def owner():
+            await asyncio.sleep(0.1)
+            cache["key"] = "ответ"
+            await flight.release_many(leases)
+
+        result, _ = await asyncio.gather(flight.wait("key", fetch), owner())
+        return flight, result
+
+    flight, result = asyncio.run(run())
+    assert result == "ответ"
+    assert flight._events == {} and flight._waiters == {}
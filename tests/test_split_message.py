@@ -0,0 +1,38 @@
+from modules.delivery import CODE_FENCE, TELEGRAM_MESSAGE_LIMIT, split_message
+
+
+def test_short_text_is_single_part():
+    assert split_message("Привет") == ["Привет"]
+
+
+def test_empty_text_has_no_parts():
+    assert split_message("  \n") == []
+
+
+def test_parts_fit_limit_and_keep_all_words():
+    text = "\n\n".join(f"Абзац {i}. " + "слово " * 150 for i in range(40))
+    parts = split_message(text)
+
+    assert len(parts) > 1
+    assert all(len(part) <= TELEGRAM_MESSAGE_LIMIT for part in parts)
+    assert " ".join(parts).split() == text.split()
+
+
+def test_cut_on_paragraph_boundary():
+    first, second = "а" * 60, "б" * 60
+    assert split_message(f"{first}\n\n{second}", limit=100) == [first, second]
+
+
+def test_text_without_separators_is_cut_at_limit():
+    parts = split_message("x" * 250, limit=100)
+    assert all(len(part) <= 100 for part in parts)
+    assert "".join(parts) == "x" * 250
+
+
+def test_code_block_is_reopened_in_next_part():
+    text = "Маршрут:\n" + CODE_FENCE + "\n" + "\n".join(f"день {i}: музей" for i in range(30)) + "\n" + CODE_FENCE
+    parts = split_message(text, limit=200)
+
+    assert len(parts) > 1
+    assert all(part.count(CODE_FENCE) % 2 == 0 for part in parts)
+    assert parts[1].startswith(CODE_FENCE)
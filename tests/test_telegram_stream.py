@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+from modules.telegram_stream import StreamingReply
+
+
+class FakeDelivery:
+    """Доставка без Telegram: заглушка не уходит в no_placeholder, правка не проходит в failing"""
+
+    def __init__(self, failing=(), no_placeholder=()):
+        self.failing = set(failing)
+        self.no_placeholder = set(no_placeholder)
+        self.sent = []
+
+    async def send_placeholder(self, chat_id, text):
+        if chat_id in self.no_placeholder:
+            return None
+        return SimpleNamespace(chat=SimpleNamespace(id=chat_id))
+
+    async def edit(self, message, text, parse_mode=None, wait=True):
+        return message.chat.id not in self.failing
+
+    async def send(self, chat_id, text, parse_mode="Markdown"):
+        self.sent.append(chat_id)
+        return True
+
+
+def _finish(delivery, chat_ids, text="Ответ"):
+    async def run():
+        reply = StreamingReply(delivery, chat_ids)
+        await reply.start()
+        return await reply.finish(text)
+    return asyncio.run(run())
+
+
+def test_all_chats_delivered():
+    assert _finish(FakeDelivery(), [1, 2, 3]) == {1, 2, 3}
+
+
+def test_failed_chats_are_not_reported_delivered():
+    assert _finish(FakeDelivery(failing=[2], no_placeholder=[3]), [1, 2, 3]) == {1}
+
+
+def test_long_answer_continues_in_new_messages():
+    delivery = FakeDelivery()
+    assert _finish(delivery, [1], "Абзац.\n\n" * 1000) == {1}
+    assert delivery.sent
@@ -0,0 +1,32 @@
+import numpy as np
+from modules.entities import country_index
+from modules.warmup import QueryLog, cluster_queries, load_query_log, query_log_files
+
+
+def same_embedding(texts):
+    # Все запросы для эмбеддинга одинаковы: объединение решают только страны
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_clusters_merge_paraphrases():
+    clusters = cluster_queries(["Что посмотреть в Италии", "что посмотреть в италии?", "Куда поехать в Италии"],
+                               same_embedding, entity_index=country_index())
+    assert len(clusters) == 1
+    assert clusters[0].count == 3
+
+
+def test_clusters_keep_countries_apart():
+    clusters = cluster_queries(["Что посмотреть в Италии", "Что посмотреть во Франции", "Что посмотреть в Италии"],
+                               same_embedding, entity_index=country_index())
+    assert [cluster.count for cluster in clusters] == [2, 1]
+    assert all(len(cluster.variants) == 1 for cluster in clusters)
+
+
+def test_query_log_rotates_and_loads_all_files(tmp_path):
+    path = str(tmp_path / "queries.jsonl")
+    log = QueryLog(path, max_bytes=200, backups=10)
+    for i in range(20):
+        log.record(f"Что посмотреть в Италии {i}")
+    log.close()
+    assert len(query_log_files(path)) > 1
+    assert load_query_log(path) == [f"Что посмотреть в Италии {i}" for i in range(20)]
@@ -0,0 +1,85 @@
+"""
+Прогрев кэша ответов по логу запросов: после выкладки, обновления базы знаний или сброса Redis.
+
+    python warmup.py --log logs/queries.jsonl --top 200 --rate 2 --days 7
+    python warmup.py --top 50 --dry-run    # лог из QUERY_LOG_PATH
+
+Частые запросы нормализуются и группируются по смыслу, для top N кластеров ответы генерируются
+через Agent.generate_response и записываются в кэш с текущей версией БЗ. В отчёте - ожидаемая
+доля попаданий: какая часть трафика из лога приходится на прогретые кластеры.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from modules.admission import SharedTokenBucket
+from modules.cache import AsyncCacheManager
+from modules.core import get_core
+from modules.entities import country_index
+from modules.serialization import Serializer
+from modules.warmup import CacheWarmer, cluster_queries, coverage, load_query_log
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main(args):
+    since = time.time() - args.days * 86400 if args.days else None
+    queries = load_query_log(args.log, since=since)
+    logger.info(f"Loaded {len(queries)} queries from {args.log}")
+
+    agent = await get_core().wait_ready()
+    loop = asyncio.get_running_loop()
+    clusters = await loop.run_in_executor(
+        None, lambda: cluster_queries(
+            queries, agent.embed_queries, threshold=args.threshold, entity_index=country_index()
+        )
+    )
+    report = coverage(clusters, args.top)
+    report['top'] = [
+        {'query': cluster.query, 'count': cluster.count, 'variants': len(cluster.variants)}
+        for cluster in clusters[:min(args.top, 20)]
+    ]
+
+    if not args.dry_run:
+        cache = AsyncCacheManager(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            serializer=Serializer(
+                codec=config.SERIALIZATION_CODEC,
+                compress_threshold=config.SERIALIZATION_COMPRESS_THRESHOLD,
+                level=config.SERIALIZATION_ZSTD_LEVEL
+            )
+        )
+        quota = SharedTokenBucket(
+            cache.redis,
+            rate=config.LLM_RATE_LIMIT,
+            capacity=config.LLM_RATE_BURST
+        ) if config.LLM_RATE_SHARED else None
+        warmer = CacheWarmer(
+            agent, cache, rate=args.rate, concurrency=args.concurrency, ttl=config.CACHE_TTL, quota=quota
+        )
+        report.update(await warmer.run(clusters[:args.top]))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=config.QUERY_LOG_PATH,
+                        help="JSONL-лог запросов бота, по умолчанию QUERY_LOG_PATH")
+    parser.add_argument("--top", type=int, default=config.WARMUP_TOP_N, help="сколько кластеров прогреть")
+    parser.add_argument("--rate", type=float, default=config.WARMUP_RATE, help="вызовов LLM в секунду")
+    parser.add_argument("--concurrency", type=int, default=config.WARMUP_CONCURRENCY)
+    parser.add_argument("--threshold", type=float, default=config.SEMANTIC_CACHE_THRESHOLD,
+                        help="порог косинусной близости для объединения перефразировок")
+    parser.add_argument("--days", type=float, default=0, help="учитывать только последние N дней лога")
+    parser.add_argument("--dry-run", action="store_true", help="только кластеры и покрытие, без генерации")
+    args = parser.parse_args()
+    if not args.log:
+        parser.error("query log is not set: pass --log or set QUERY_LOG_PATH")
+    asyncio.run(main(args))
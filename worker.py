@@ -1,10 +1,21 @@
 import logging
 import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 from modules.agent import Agent
-from modules.document_loader import DocumentLoader
-from modules.vector_db import VectorDB
-from modules.cache import CacheManager
-from modules.messaging import KafkaMessaging
+from modules.core import RAGCore, get_core
+from modules.cache import AsyncCacheManager, LocalCache
+from modules.serialization import Serializer
+from modules.messaging import KafkaMessaging, OrderedCommitter
+from modules.semantic_cache import SemanticCache
+from modules.single_flight import SingleFlight
+from modules.admission import AdmissionController, SharedTokenBucket, Overloaded, BUSY_MESSAGE
+from modules.metrics import (
+    KAFKA_LAG, REQUESTS_SHED, count_cache, start_metrics_server, timed, track_in_flight
+)
+from modules.telegram_stream import StreamingReply
+from modules.delivery import DeliveryService
 import config
 from aiogram import Bot
 
@@ -13,111 +24,478 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Worker:
-    def __init__(self, bot: Bot):
+    def __init__(
+            self,
+            bot: Bot,
+            concurrency: int = config.WORKER_CONCURRENCY,
+            core: Optional[RAGCore] = None,
+            delivery: Optional[DeliveryService] = None
+    ):
         logger.info("Initializing Worker...")
         self.bot = bot
-        self.cache = CacheManager(
+        self.concurrency = concurrency
+        self.running = True
+        # Блокирующие вызовы (Chroma, YandexGPT, Kafka producer) выполняются вне event loop
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rag_worker")
+        # Consumer не потокобезопасен, поэтому poll всегда идёт из одного потока
+        self.poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag_poll")
+        # Сообщения Kafka и значения Redis: json или msgpack + zstd с заголовком версии схемы
+        self.serializer = Serializer(
+            codec=config.SERIALIZATION_CODEC,
+            compress_threshold=config.SERIALIZATION_COMPRESS_THRESHOLD,
+            level=config.SERIALIZATION_ZSTD_LEVEL
+        )
+        self.cache = AsyncCacheManager(
             host=config.REDIS_HOST,
-            port=config.REDIS_PORT
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            local_cache=LocalCache(
+                max_entries=config.L1_CACHE_MAX_ENTRIES,
+                max_bytes=config.L1_CACHE_MAX_BYTES,
+                ttl=config.L1_CACHE_TTL
+            ) if config.L1_CACHE_ENABLED else None,
+            serializer=self.serializer
+        )
+        # Допуск к LLM: квота YandexGPT, справедливость между чатами, сброс нагрузки
+        self.admission = AdmissionController(
+            rate=config.LLM_RATE_LIMIT,
+            burst=config.LLM_RATE_BURST,
+            concurrency=concurrency,
+            max_queue=config.ADMISSION_QUEUE_SIZE,
+            max_per_chat=config.ADMISSION_MAX_PER_CHAT,
+            max_wait=config.ADMISSION_MAX_WAIT,
+            bucket=SharedTokenBucket(
+                self.cache.redis,
+                rate=config.LLM_RATE_LIMIT,
+                capacity=config.LLM_RATE_BURST
+            ) if config.LLM_RATE_SHARED else None
         )
-        logger.info(f"CacheManager initialized with Redis host: {config.REDIS_HOST}, port: {config.REDIS_PORT}")
+        # Прямая отправка в Telegram нужна только в режиме inline и для потоковых ответов;
+        # во встроенном режиме лимиты Telegram общие с ботом
+        self.delivery = delivery or DeliveryService(
+            bot=bot,
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            chat_rate=config.TELEGRAM_CHAT_RATE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+            retries=config.DELIVERY_RETRIES,
+            retry_backoff=config.DELIVERY_RETRY_BACKOFF,
+            max_redeliveries=config.DELIVERY_MAX_REDELIVERIES
+        )
+        # Потоковые правки по умолчанию - только если лимиты Telegram общие с ботом или доставка inline
+        if config.STREAM_RESPONSES == "auto":
+            self.stream_responses = delivery is not None or config.RESPONSE_DELIVERY == "inline"
+        else:
+            self.stream_responses = config.STREAM_RESPONSES == "true"
+        logger.info(f"AsyncCacheManager initialized with Redis host: {config.REDIS_HOST}, port: {config.REDIS_PORT}")
+        self.single_flight = SingleFlight(
+            redis_client=self.cache.redis,
+            lease_ttl_ms=config.SINGLE_FLIGHT_LEASE_MS,
+            wait_timeout=config.SINGLE_FLIGHT_WAIT_TIMEOUT,
+            poll_interval=config.SINGLE_FLIGHT_POLL_INTERVAL
+        ) if config.SINGLE_FLIGHT_ENABLED else None
 
         self.messaging = KafkaMessaging(
-            bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS
+            bootstrap_servers=config.KAFKA_BOOTSTRAP_SERVERS,
+            serializer=self.serializer
         )
         logger.info(f"KafkaMessaging initialized with bootstrap servers: {config.KAFKA_BOOTSTRAP_SERVERS}")
 
-        self.messaging.create_topic_if_not_exists(config.KAFKA_REQUESTS_TOPIC)
-        logger.info(f"Kafka topic '{config.KAFKA_REQUESTS_TOPIC}' checked/created")
+        # Запросы ключуются chat_id, поэтому сообщения одного чата всегда попадают в один раздел
+        for topic in (config.KAFKA_REQUESTS_TOPIC, config.KAFKA_RESPONSES_TOPIC):
+            self.messaging.create_topic_if_not_exists(
+                topic,
+                num_partitions=config.KAFKA_PARTITIONS,
+                replication_factor=config.KAFKA_REPLICATION_FACTOR
+            )
+            logger.info(f"Kafka topic '{topic}' checked/created")
 
-        self.kafka_producer = self.messaging.create_producer()
+        self.kafka_producer = self.messaging.create_producer(
+            linger_ms=config.KAFKA_LINGER_MS,
+            batch_size=config.KAFKA_PRODUCER_BATCH_BYTES,
+            compression_type=config.KAFKA_COMPRESSION_TYPE
+        )
         logger.info(f"Created kafka_producer: {self.kafka_producer}")
 
         self.kafka_consumer = self.messaging.create_consumer(
             group_id=config.KAFKA_GROUP_ID,
-            topics=[config.KAFKA_REQUESTS_TOPIC]
+            topics=[config.KAFKA_REQUESTS_TOPIC],
+            assignment_strategy=config.KAFKA_ASSIGNMENT_STRATEGY,
+            on_assign=self._on_assign,
+            on_revoke=self._on_revoke
         )
         logger.info(f"Kafka consumer created for group {config.KAFKA_GROUP_ID} and topic {config.KAFKA_REQUESTS_TOPIC}")
+        # Коммиты по порядку пакетов и только по разделам, назначенным этому воркеру группой
+        self.committer = OrderedCommitter(
+            self.messaging,
+            self.kafka_consumer,
+            self.poll_executor,
+            max_redeliveries=config.WORKER_MAX_REDELIVERIES,
+            track_partitions=True
+        )
 
-        # RAG компоненты
-        self.document_loader = DocumentLoader(data_path=config.DATA_PATH)
-        logger.info(f"DocumentLoader initialized with data path: {config.DATA_PATH}")
+        # RAG-ядро общее для процесса: во встроенном режиме его же использует бот
+        self.core = core or get_core()
+        self.core.start()
 
-        self.vector_db = VectorDB()
-        logger.info("VectorDB initialized")
+    @property
+    def agent(self) -> Agent:
+        return self.core.agent
 
-        self.agent = Agent(
-            yandex_folder_id=config.YANDEX_FOLDER_ID,
-            yandex_api_key=config.YANDEX_API_KEY,
-            document_loader=self.document_loader,
-            vector_db=self.vector_db
-        )
-        logger.info("Agent initialized with Yandex credentials and data sources")
+    @property
+    def semantic_cache(self) -> Optional[SemanticCache]:
+        return self.core.semantic_cache
 
     async def process_messages(self):
-        logger.info("Worker started processing messages...")
-        while True:
+        logger.info(f"Worker started processing messages with concurrency {self.concurrency}...")
+        loop = asyncio.get_running_loop()
+        await start_metrics_server(port=config.METRICS_PORT)
+        # Чтение начинается после прогрева, иначе первые пакеты ждали бы загрузку модели
+        await self.core.wait_ready()
+        loop.create_task(self.admission.run())
+        # Дубликаты запросов к LLM тоже расходуют квоту: токен берётся из bucket допуска
+        self.agent.model.hedge_permit = lambda: asyncio.run_coroutine_threadsafe(
+            self.admission.try_take(), loop
+        ).result(timeout=1.0)
+        loop.create_task(self.cache.listen_invalidations())
+        if self.single_flight is not None:
+            loop.create_task(self.single_flight.listen())
+        track_in_flight("batches", lambda: len(self.committer))
+        track_in_flight("llm_calls", lambda: self.admission.active)
+        track_in_flight("admission_queue", lambda: self.admission.queued)
+        lag_checked = 0.0
+        while self.running:
             try:
-                msg = self.messaging.consume_messages(self.kafka_consumer)
-                if msg:
-                    # logger.info(f"Received message from Kafka: {msg}")
-                    await self._handle_request(msg['value'])  # Асинхронная обработка запроса
-                else:
-                    logger.debug("No message received during this poll cycle")
-                await asyncio.sleep(1)
+                batch = await loop.run_in_executor(
+                    self.poll_executor,
+                    self.messaging.consume,
+                    self.kafka_consumer,
+                    config.KAFKA_BATCH_SIZE,
+                    config.KAFKA_BATCH_TIMEOUT_MS / 1000
+                )
             except Exception as e:
                 logger.error(f"Error during message processing: {str(e)}")
+                batch = []
 
-    async def _handle_request(self, request: dict):
-        try:
-            query = request.get('query')
-            chat_id = request.get('chat_id')
+            if batch:
+                self.committer.add(loop.create_task(self._handle_batch(batch)), self.messaging.batch_offsets(batch))
+
+            # Пакеты коммитятся строго по порядку и только после доставки ответов
+            await self.committer.commit_ready()
+
+            if loop.time() - lag_checked >= config.METRICS_LAG_INTERVAL:
+                lag_checked = loop.time()
+                lag = await loop.run_in_executor(
+                    self.poll_executor, self.messaging.consumer_lag, self.kafka_consumer
+                )
+                for (topic, partition), value in lag.items():
+                    KAFKA_LAG.labels(topic, str(partition)).set(value)
+
+            if len(self.committer) >= config.WORKER_MAX_PENDING_BATCHES:
+                await self.committer.wait_oldest()
+
+        # Остановка: дообработка прочитанного, коммит и выход из группы
+        logger.info(f"Worker stopping, waiting for {len(self.committer)} batches...")
+        await self.committer.drain()
+        await loop.run_in_executor(self.poll_executor, self.messaging.close_consumer, self.kafka_consumer)
 
-            if not query or not chat_id:
+    def stop(self):
+        """Плавная остановка цикла чтения"""
+        self.running = False
+
+    def _on_assign(self, partitions):
+        self.committer.assign(partitions)
+
+    def _on_revoke(self, partitions):
+        self.committer.revoke(partitions)
+        for tp in partitions:
+            try:
+                KAFKA_LAG.remove(tp.topic, str(tp.partition))
+            except KeyError:
+                pass
+
+    async def update_knowledge_base(self):
+        """Переиндексация базы знаний и сброс L1-кэшей во всех процессах"""
+        agent = await self.core.wait_ready()
+        stats = await self._run_blocking(agent.update_knowledge_base)
+        await self.cache.invalidate()
+        return stats
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Выполнение блокирующего вызова в пуле потоков воркера"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def _handle_batch(self, batch: List[dict]):
+        """
+        Обработка пакета сообщений: общий поиск по кэшу и векторной БД, параллельная генерация.
+        Возвращает смещения первых недоставленных сообщений по разделам.
+        """
+        with timed("batch"):
+            try:
+                delivered = await self._process_batch([msg['value'] for msg in batch])
+                # Ответы считаются доставленными, когда брокер подтвердил их запись в тему ответов
+                if config.RESPONSE_DELIVERY == "kafka" and not await self._run_blocking(
+                        self.messaging.flush, self.kafka_producer):
+                    delivered = [False] * len(batch)
+            except Exception as e:
+                logger.error(f"Failed to process batch: {str(e)}")
+                delivered = [False] * len(batch)
+        return self.messaging.first_offsets([msg for msg, ok in zip(batch, delivered) if not ok])
+
+    async def _process_batch(self, requests: List[dict]) -> List[bool]:
+        """Ответы на пакет запросов; для каждого запроса - признак того, что он обработан"""
+        cache_version = self.agent.cache_version
+        groups: Dict[str, List[dict]] = {}
+        for request in requests:
+            if not request.get('query') or not request.get('chat_id'):
                 logger.warning(f"Skipping request due to missing 'query' or 'chat_id': {request}")
-                return
+                continue
+            cache_key = self.cache.generate_cache_key(request['query'], cache_version)
+            groups.setdefault(cache_key, []).append(request)
+
+        if not groups:
+            return [True] * len(requests)
 
-            logger.info(f"Handling request with query: {query} from chat_id: {chat_id}")
+        failed = set()
 
-            cache_key = self.cache.generate_cache_key(query)
-            logger.info(f"Generated cache key: {cache_key}")
+        async def deliver(cache_key: str, response: Optional[str], streamed: Set[int] = frozenset()):
+            # Ответы группы доставляются, как только готовы, не дожидаясь остальных запросов пакета;
+            # streamed - чаты, уже получившие ответ потоково
+            group = groups[cache_key]
+            delivered = await asyncio.gather(*(
+                self._deliver(request, response, streamed=request['chat_id'] in streamed) for request in group
+            ))
+            failed.update(id(request) for request, ok in zip(group, delivered) if not ok)
 
-            cached_response = self.cache.get(cache_key)
+        async def generate(keys: List[str]):
+            generated, streamed = await self._generate_misses(groups, keys)
+            await asyncio.gather(*(
+                deliver(cache_key, generated.get(cache_key), streamed.get(cache_key, set())) for cache_key in keys
+            ))
+
+        misses = []
+        hits = {}
+        cache_keys = list(groups)
+        for cache_key, cached_response in zip(cache_keys, await self.cache.mget(cache_keys)):
             if cached_response:
-                logger.info(f"Cache hit for query: {query}")
-                response = cached_response['response']
+                hits[cache_key] = cached_response['response']
             else:
-                logger.info(f"Cache miss for query: {query}, generating response...")
-                response = self.agent.generate_response(query)
-                logger.info(f"Saving response to cache for query: {query}")
-                self.cache.set(
-                    key=cache_key,
-                    value={'response': response},
-                    ttl=config.CACHE_TTL
-                )
+                misses.append(cache_key)
+        count_cache("response", len(groups) - len(misses), len(misses))
+        tasks = [deliver(cache_key, response) for cache_key, response in hits.items()]
+
+        if misses and self.single_flight is not None:
+            # Запросы, которые уже генерирует другой воркер, ждут его ответа
+            leases = await self.single_flight.acquire_many(misses)
+            owned = [cache_key for cache_key in misses if leases[cache_key]]
+            waiting = [cache_key for cache_key in misses if not leases[cache_key]]
+            if waiting:
+                logger.debug(f"Coalescing {len(waiting)} queries with in-flight generations")
+
+            async def generate_owned():
+                try:
+                    generated, streamed = await self._generate_misses(groups, owned)
+                finally:
+                    await self.single_flight.release_many({cache_key: leases[cache_key] for cache_key in owned})
+                await asyncio.gather(*(
+                    deliver(cache_key, generated.get(cache_key), streamed.get(cache_key, set()))
+                    for cache_key in owned
+                ))
+
+            async def wait_owner(cache_key: str):
+                # Ожидание может длиться до таймаута аренды, поэтому каждый ответ доставляется сразу
+                cached_response = await self.single_flight.wait(cache_key, self.cache.get)
+                if cached_response:
+                    await deliver(cache_key, cached_response['response'])
+                else:
+                    await generate([cache_key])
 
-            logger.info(f"Sending response to chat_id {chat_id}")
-            await self.bot.send_message(
-                chat_id=chat_id,
-                text=response,
-                parse_mode="Markdown"
+            tasks.append(generate_owned())
+            tasks.extend(wait_owner(cache_key) for cache_key in waiting)
+        elif misses:
+            tasks.append(generate(misses))
+
+        await asyncio.gather(*tasks)
+        return [id(request) not in failed for request in requests]
+
+    async def _generate_misses(
+            self,
+            groups: Dict[str, List[dict]],
+            misses: List[str]
+    ) -> Tuple[Dict[str, Optional[str]], Dict[str, Set[int]]]:
+        """Генерация ответов для промахов кэша и запись их в кэш"""
+        if not misses:
+            return {}, {}
+        generated, streamed = await self._generate_batch(
+            [groups[cache_key][0]['query'] for cache_key in misses],
+            [[request['chat_id'] for request in groups[cache_key]] for cache_key in misses]
+        )
+        await self.cache.mset(
+            {
+                cache_key: {'response': response}
+                for cache_key, response in zip(misses, generated)
+                if response is not None
+            },
+            ttl=config.CACHE_TTL
+        )
+        return dict(zip(misses, generated)), dict(zip(misses, streamed))
+
+    async def _generate_batch(
+            self,
+            queries: List[str],
+            recipients: List[List[int]]
+    ) -> Tuple[List[Optional[str]], List[Set[int]]]:
+        """
+        Семантический кэш и поиск контекста для всего пакета, затем параллельная генерация.
+        Возвращает ответы и для каждого - чаты, куда ответ уже доставлен потоково.
+        """
+        streamed: List[Set[int]] = [set() for _ in queries]
+        try:
+            query_embeddings = await self._run_blocking(self.agent.embed_queries, queries)
+            responses = await self._run_blocking(self.agent.lookup_cached, query_embeddings, queries)
+            pending = [i for i, response in enumerate(responses) if response is None]
+            if not pending:
+                return responses, streamed
+
+            contexts = await self._run_blocking(
+                self.agent.retrieve,
+                [queries[i] for i in pending],
+                query_embeddings[pending]
             )
+        except Exception as e:
+            logger.error(f"Failed to retrieve context for batch: {str(e)}")
+            return [None] * len(queries), streamed
 
-            self.messaging.produce_message(
+        generated = await asyncio.gather(*(
+            self._generate(queries[i], context, query_embeddings[i], recipients[i])
+            for i, context in zip(pending, contexts)
+        ))
+        for i, (response, delivered) in zip(pending, generated):
+            responses[i] = response
+            streamed[i] = delivered
+        return responses, streamed
+
+    async def _generate(
+            self,
+            query: str,
+            context: List[Tuple[str, str]],
+            query_embedding,
+            chat_ids: List[int]
+    ) -> Tuple[Optional[str], Set[int]]:
+        """
+        Генерация ответа после допуска к LLM; при перегрузке чатам сразу уходит просьба повторить.
+        Возвращает ответ и чаты, которые уже получили ответ или просьбу повторить
+        """
+        try:
+            async with self.admission.slot(chat_ids[0]):
+                if self.stream_responses:
+                    return await self._stream(query, context, query_embedding, chat_ids)
+                try:
+                    response = await self._run_blocking(
+                        self.agent.generate_with_context, query, context, query_embedding=query_embedding
+                    )
+                    return response, set()
+                except Exception as e:
+                    logger.error(f"Failed to generate response for query '{query}': {str(e)}")
+                    return None, set()
+        except Overloaded as e:
+            logger.warning(f"Shedding query: {str(e)}")
+            REQUESTS_SHED.inc()
+            notified = await asyncio.gather(*(self._notify(chat_id, BUSY_MESSAGE) for chat_id in chat_ids))
+            # Ответ не кэшируется; чаты, куда просьба не ушла, получат сообщение об ошибке обычной доставкой
+            return None, {chat_id for chat_id, ok in zip(chat_ids, notified) if ok}
+
+    async def _stream(
+            self,
+            query: str,
+            context: List[Tuple[str, str]],
+            query_embedding,
+            chat_ids: List[int]
+    ) -> Tuple[Optional[str], Set[int]]:
+        """Потоковая генерация с прогрессивной правкой сообщений в чатах"""
+        loop = asyncio.get_running_loop()
+        reply = StreamingReply(
+            delivery=self.delivery,
+            chat_ids=chat_ids,
+            edit_interval=config.STREAM_EDIT_INTERVAL,
+            min_delta=config.STREAM_MIN_DELTA
+        )
+        await reply.start()
+
+        updates: asyncio.Queue = asyncio.Queue()
+
+        def produce():
+            try:
+                for text in self.agent.stream_with_context(query, context):
+                    loop.call_soon_threadsafe(updates.put_nowait, text)
+            finally:
+                loop.call_soon_threadsafe(updates.put_nowait, None)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        raw_response = ""
+        while True:
+            text = await updates.get()
+            if text is None:
+                break
+            raw_response = text
+            await reply.update(text)
+
+        try:
+            await producer
+            response = await self._run_blocking(
+                self.agent.complete_response, query, raw_response, context, query_embedding
+            )
+        except Exception as e:
+            logger.error(f"Failed to stream response for query '{query}': {str(e)}")
+            return None, await reply.finish("Произошла ошибка при обработке запроса")
+
+        return response, await reply.finish(response)
+
+    async def _deliver(self, request: dict, response: Optional[str], streamed: bool = False) -> bool:
+        """Передача ответа на доставку; False - ответ не доставлен и запрос нужно прочитать повторно"""
+        chat_id = request['chat_id']
+        if response is None:
+            return True if streamed else await self._notify(chat_id, "Произошла ошибка при обработке запроса")
+        # При потоковой генерации ответ уже показан правками сообщения-заглушки
+        return await self._notify(chat_id, response, delivered=streamed)
+
+    async def _notify(self, chat_id: int, text: str, delivered: bool = False) -> bool:
+        """
+        Ответ в чат: в режиме kafka - запись в тему ответов для сервиса доставки,
+        в режиме inline - отправка прямо из воркера
+        """
+        try:
+            if config.RESPONSE_DELIVERY == "inline":
+                return delivered or await self.delivery.send(chat_id, text)
+            return await self._run_blocking(
+                self.messaging.produce_message,
                 producer=self.kafka_producer,
                 topic=config.KAFKA_RESPONSES_TOPIC,
                 key=str(chat_id),
-                value={'response': response, 'chat_id': chat_id}
+                value={'chat_id': chat_id, 'response': text, 'delivered': delivered}
             )
-
         except Exception as e:
-            logger.error(f"Failed to process request: {str(e)}")
-            try:
-                if request.get('chat_id'):
-                    await self.bot.send_message(
-                        chat_id=request['chat_id'],
-                        text="Произошла ошибка при обработке запроса"
-                    )
-            except Exception as inner_e:
-                logger.error(f"Failed to send error message to chat {request.get('chat_id')}: {str(inner_e)}")
+            logger.error(f"Failed to deliver response to chat {chat_id}: {str(e)}")
+            return False
+
+async def main():
+    """Отдельный процесс воркера: несколько таких процессов делят разделы темы запросов"""
+    bot = Bot(token=config.TELEGRAM_TOKEN)
+    worker = Worker(bot=bot)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    # Тонкий бот базу знаний не собирает: её собирает и пересобирает воркер - владелец индекса,
+    # остальные воркеры открывают рабочую версию и перехватывают владение, если владелец завершился
+    if config.KB_WATCH_INTERVAL > 0:
+        loop.create_task(worker.core.own_index(worker.update_knowledge_base, config.KB_WATCH_INTERVAL))
+    try:
+        await worker.process_messages()
+    finally:
+        session = await bot.get_session()
+        await session.close()
+
 
+if __name__ == '__main__':
+    asyncio.run(main())